@@ -12,7 +12,7 @@ Command:
 @ Scenario-3
 -> python sotl.py --env_name '3way' --phase_num 3 --detector_break 'E0--s'
 -> python sotl.py --env_name '4way' --phase_num 4 --detector_break 'E0--s'
-@LastEditTime: 2023-12-02 18:05:05
+@LastEditTime: 2026-10-18 22:51:37
 '''
 import sys
 from pathlib import Path
@@ -27,7 +27,7 @@ from tshub.utils.get_abs_path import get_abs_path
 from tshub.utils.init_log import set_logger
 
 from TSCEnvironment.tsc_env import TSCEnvironment
-from TSCEnvironment.llm_wrapper import LLMTSCEnvWrapper
+from TSCEnvironment.base_tsc_wrapper import BaseTSCEnvWrapper
 
 path_convert = get_abs_path(__file__)
 set_logger(path_convert('./'))
@@ -62,12 +62,12 @@ if __name__ == '__main__':
         use_gui=True,
     ) # 初始化环境
     
-    llm_env = LLMTSCEnvWrapper(
+    llm_env = BaseTSCEnvWrapper(
         env=tsc_scenario,
         tls_id='J1',
         phase_num=phase_num,
         copy_files=[trip_info]
-    ) # wrapper for llm
+    ) # 不需要 prompt, 不导入 langchain
 
     # Simulation with environment
     dones = False
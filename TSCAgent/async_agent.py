@@ -0,0 +1,240 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 18:05:37
+@Description: 异步的 LLM Agent, LLM 思考的时候仿真继续运行
++ 主线程在决策时刻保存一份环境的快照 (EnvSnapshot), Agent 在后台线程中只读取快照, 不会调用 TraCI
++ LLM 还没有给出结果时, 主线程使用 RL 的动作; 结果在下一个决策时刻使用
++ 超过 max_staleness (仿真时间) 的结果直接丢弃, 窗口结束之后完成的结果也计入 discarded
++ 后台线程是 daemon, 正在运行的 LLM 请求不会阻止程序退出; deadline/token_budget 与 TSCAgent 相同
++ 超过 deadline/token_budget 时与同步的决策相同, 使用 TSCAgent.fallback_decision (部分的回答 -> RL -> 最大 occupancy)
++ long_tail_gate 不为 None 时, LLM 完成的决策的时间计入 LongTailGate.record_llm_latency
++ metrics (DecisionMetricsCallback) 在后台线程中记录每次决策, source 为 async
+@LastEditTime: 2026-10-19 16:31:07
+'''
+import time
+import threading
+from loguru import logger
+from types import SimpleNamespace
+from concurrent.futures import Future
+from typing import Any, Dict, List, Tuple
+
+from TSCAgent.tsc_agent import TSCAgent
+from TSCAgent.callback_handler import DeadlineExceeded
+from TSCAgent.output_parse import OutputParse
+from TSCAgent.tool_cache import ToolCache
+from TSCPrompt.compact_encoding import CompactEncoder
+
+
+class EnvSnapshot:
+    """决策时刻 BaseTSCEnvWrapper 中 tools 需要的信息, 接口与 wrapper 相同
+    """
+    def __init__(self, env, rl_decision:int=None) -> None:
+        self.tls_id = env.tls_id
+        self.episode = env.episode
+        self.decision_step = env.decision_step
+        self.state_version = env.state_version
+        self.ls_elements = list(env.ls_elements)
+        self.tsc_env = SimpleNamespace(sim_step=env.tsc_env.sim_step)
+        self.prompt_encoding = getattr(env, 'prompt_encoding', 'full')
+        self.prompt_encoder = CompactEncoder() if self.prompt_encoding == 'compact' else None # 后台线程使用自己的 encoder
+
+        self.available_actions = env.get_available_actions()
+        self.current_phase = env.get_current_phase()
+        self.intersection_layout = env.get_intersection_layout()
+        self.signal_phase_structure = env.get_signal_phase_structure()
+        self.current_occupancy = env.get_current_occupancy()
+        self.previous_occupancy = env.get_previous_occupancy()
+        self.rescue_movement_ids = env.get_rescue_movement_ids()
+        self.movement_state = env.get_movement_state()
+        self.detector_state = env.get_detector_state()
+        self.rl_decision = env.get_rl_decision() if rl_decision is None else rl_decision
+        self.max_occupancy_phase = env.get_max_occupancy_phase()
+
+    def get_available_actions(self) -> List[str]:
+        return self.available_actions
+
+    def get_current_phase(self) -> str:
+        return self.current_phase
+
+    def get_intersection_layout(self) -> Dict[str, Any]:
+        return self.intersection_layout
+
+    def get_signal_phase_structure(self) -> Dict[str, List[str]]:
+        return self.signal_phase_structure
+
+    def get_current_occupancy(self) -> Dict[str, float]:
+        return self.current_occupancy
+
+    def get_previous_occupancy(self) -> Dict[str, float]:
+        return self.previous_occupancy
+
+    def get_rescue_movement_ids(self) -> List[str]|None:
+        return self.rescue_movement_ids
+
+    def get_movement_state(self) -> Dict[str, bool]:
+        return self.movement_state
+
+    def get_detector_state(self) -> Dict[str, str]:
+        return self.detector_state
+
+    def get_rl_decision(self) -> int:
+        return self.rl_decision
+
+    def get_max_occupancy_phase(self) -> int:
+        return self.max_occupancy_phase
+
+
+class SnapshotProxy:
+    """tools 绑定的环境, 每次提交新的任务时替换 snapshot (同一时间只有一个任务)
+    """
+    def __init__(self) -> None:
+        self.snapshot = None
+
+    def __getattr__(self, name:str) -> Any:
+        snapshot = self.__dict__.get('snapshot')
+        if snapshot is None:
+            raise AttributeError(name)
+        return getattr(snapshot, name)
+
+
+class AsyncTSCAgent:
+    def __init__(self, llm, tools:List[Any], parser_llm=None, long_tail_gate=None, use_cache:bool=True, max_staleness:float=10, verbose:bool=True, **agent_kwargs) -> None:
+        """
+        Args:
+            llm: ChatOpenAI
+            tools (List[Any]): custom_tools 中 tool 的类, 会绑定到快照上
+            parser_llm (optional): OutputParse 使用的 ChatOpenAI (例如 caller='parser'), None 时使用 llm. Defaults to None.
+            long_tail_gate (optional): LongTailGate, 记录 LLM 决策的时间. Defaults to None.
+            use_cache (bool, optional): 同一个快照中重复的 tool 调用直接返回结果. Defaults to True.
+            max_staleness (float, optional): 结果最多延迟的仿真时间 (s), 超过则丢弃. Defaults to 10.
+            agent_kwargs: 传给 TSCAgent, 例如 agent_message, metrics, deadline, token_budget
+        """
+        self.env = SnapshotProxy()
+        self.max_staleness = max_staleness
+        self.long_tail_gate = long_tail_gate
+        self.tool_cache = ToolCache(env=self.env) if use_cache else None
+        self.agent = TSCAgent(
+            env=self.env, llm=llm,
+            tools=[tool(env=self.env, cache=self.tool_cache) for tool in tools],
+            verbose=verbose, **agent_kwargs
+        )
+        self.o_parse = OutputParse(env=self.env, llm=llm if parser_llm is None else parser_llm) # 与同步的决策相同, 分别统计
+        self.future: Future = None
+        self.submit_sim_step = None
+        self.context = None
+
+        # 统计
+        self.num_submitted = 0
+        self.num_applied = 0
+        self.num_discarded = 0
+        self.num_failed = 0
+        self.num_deadline = 0 # 超过 deadline/token_budget 的次数 (使用 fallback 的动作)
+        self.num_unfinished = 0 # close 时还没有完成的请求
+        self.sim_delay = 0 # 使用的结果延迟的仿真时间
+        self.wall_time = 0 # LLM 花费的时间
+
+    @property
+    def busy(self) -> bool:
+        return self.future is not None
+
+    def submit(self, env, sim_step:float, last_step_action:int, last_step_explanation:str, rl_decision:int=None, context:Any=None, last_step_source:str='llm') -> bool:
+        """在主线程中保存快照, 然后在后台运行 Agent; 上一个任务没有完成时不提交
+        context 会和结果一起返回 (例如 decision cache 的特征)
+        """
+        if self.busy:
+            return False
+        self.env.snapshot = EnvSnapshot(env, rl_decision=rl_decision)
+        self.submit_sim_step = sim_step
+        self.context = context
+        self.num_submitted += 1
+        self.future = Future()
+        threading.Thread(
+            target=self._worker, args=(self.future, sim_step, last_step_action, last_step_explanation, last_step_source),
+            name='tsc_agent', daemon=True
+        ).start() # daemon, 退出时不等待 LLM
+        return True
+
+    def _worker(self, future:Future, *args: Any) -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(self._run(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    def _run(self, sim_step, last_step_action, last_step_explanation, last_step_source) -> Tuple[Dict[str, Any], str, float]:
+        """返回 (agent_action, source, wall_time), source 为 llm 或者 fallback 的来源 (partial, rl, max_occupancy)
+        """
+        start_time = time.perf_counter()
+        metrics = self.agent.metrics
+        try:
+            agent_response = self.agent.agent_run(
+                sim_step=sim_step,
+                last_step_action=last_step_action,
+                last_step_explanation=last_step_explanation,
+                last_step_source=last_step_source
+            )
+            agent_action = self.o_parse.parser_output(agent_response, callbacks=None if metrics is None else [metrics])
+            source = 'llm'
+        except DeadlineExceeded as e:
+            phase_id, explanation, source = self.agent.fallback_decision(self.o_parse, e.partial_output) # 只读取快照
+            agent_action = {'phase_id': phase_id, 'explanation': explanation}
+        except Exception:
+            if metrics is not None:
+                metrics.end_decision(action=None, source='async-failed')
+            raise
+        if metrics is not None:
+            metrics.end_decision(action=agent_action['phase_id'], source='async' if source == 'llm' else f'async-fallback-{source}')
+        return agent_action, source, time.perf_counter() - start_time
+
+    def poll(self, sim_step:float, apply:bool=True) -> Tuple[int, str, str, Any]|None:
+        """在决策时刻检查结果, 返回 (phase_id, explanation, source, context); 没有结果或者结果过期时返回 None
+        source 为 llm, 超过预算时为 fallback 的来源 (partial, rl, max_occupancy)
+        apply 为 False 时 (例如 LLM 的窗口已经结束), 完成的结果计入 discarded
+        """
+        if (self.future is None) or (not self.future.done()):
+            return None
+        future, self.future = self.future, None
+        delay = sim_step - self.submit_sim_step
+        try:
+            agent_action, source, wall_time = future.result()
+            phase_id = int(agent_action['phase_id'])
+        except Exception as e:
+            self.num_failed += 1
+            logger.warning(f'SIM: Async decision submitted at {self.submit_sim_step} failed, {e}')
+            return None
+        self.wall_time += wall_time
+        if source != 'llm':
+            self.num_deadline += 1
+        elif self.long_tail_gate is not None:
+            self.long_tail_gate.record_llm_latency(wall_time) # 与同步的决策相同, 只记录 LLM 完成的决策
+        if (delay > self.max_staleness) or (not apply):
+            self.num_discarded += 1
+            logger.info(f'SIM: Discard decision submitted at {self.submit_sim_step}, {delay}s late.')
+            return None
+        self.num_applied += 1
+        self.sim_delay += delay
+        logger.info(f'SIM: Apply decision ({source}) submitted at {self.submit_sim_step} at {sim_step}, Phase {phase_id}.')
+        return phase_id, agent_action['explanation'], source, self.context
+
+    def stats(self) -> Dict[str, float]:
+        num_finished = self.num_applied + self.num_discarded
+        return {
+            'submitted': self.num_submitted,
+            'applied': self.num_applied,
+            'discarded': self.num_discarded,
+            'failed': self.num_failed,
+            'deadline': self.num_deadline,
+            'unfinished': self.num_unfinished,
+            'mean_sim_delay': self.sim_delay / self.num_applied if self.num_applied > 0 else 0,
+            'mean_llm_time': self.wall_time / num_finished if num_finished > 0 else 0,
+        }
+
+    def close(self, sim_step:float=None) -> None:
+        """不等待正在运行的 LLM 请求 (daemon 线程); 已经完成的结果计入 discarded, 没有完成的计入 unfinished
+        """
+        if self.future is not None and self.future.done():
+            self.poll(self.submit_sim_step if sim_step is None else sim_step, apply=False)
+        if self.future is not None:
+            self.num_unfinished += 1
+            self.future = None
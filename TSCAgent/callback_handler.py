@@ -2,12 +2,87 @@
 @Author: WANG Maonan
 @Date: 2023-09-04 20:51:07
 @Description: callback function
-@LastEditTime: 2023-09-18 21:41:51
++ DeadlineCallback, 限制每一次决策的时间和 token
++ remaining, 剩余的时间, 每次 LLM 请求的 timeout 不超过剩余的时间
+@LastEditTime: 2026-10-19 10:12:40
 '''
+import time
+from typing import Any
 from loguru import logger
 from langchain.callbacks import FileCallbackHandler
+from langchain.callbacks.base import BaseCallbackHandler
 
 def create_file_callback(logfile:str="output.log"):
     logger.add(logfile, colorize=False, enqueue=True)
     handler = FileCallbackHandler(logfile)
-    return handler
\ No newline at end of file
+    return handler
+
+class DeadlineExceeded(Exception):
+    """一次决策超过了时间或者 token 的预算
+    """
+    def __init__(self, reason:str, elapsed:float, tokens:int, partial_output:str) -> None:
+        super().__init__(f'{reason}, elapsed {elapsed:.2f}s, tokens {tokens}')
+        self.reason = reason
+        self.elapsed = elapsed
+        self.tokens = tokens
+        self.partial_output = partial_output # 最后一次 LLM 的输出, 用于解析部分的答案
+
+
+class DeadlineCallback(BaseCallbackHandler):
+    """每次 LLM 开始前和 LLM/tool 结束后检查预算, 超过时抛出 DeadlineExceeded 中止 Agent
+    正在进行的 LLM 请求无法中断, PooledChatOpenAI 在每次请求前把 request_timeout 设置为 remaining()
+    """
+    raise_error = True # 否则 langchain 会忽略 callback 中的异常
+
+    def __init__(self, deadline:float=None, token_budget:int=None) -> None:
+        super().__init__()
+        self.deadline = deadline
+        self.token_budget = token_budget
+        self.reset()
+
+    def reset(self) -> None:
+        self.start_time = time.perf_counter()
+        self.tokens = 0
+        self.partial_output = ''
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start_time
+
+    def remaining(self) -> float|None:
+        """剩余的时间 (s), 没有时间预算时为 None
+        """
+        if self.deadline is None:
+            return None
+        return self.deadline - self.elapsed
+
+    def deadline_passed(self) -> bool:
+        return (self.deadline is not None) and (self.elapsed > self.deadline)
+
+    def error(self, reason:str) -> DeadlineExceeded:
+        return DeadlineExceeded(reason, self.elapsed, self.tokens, self.partial_output)
+
+    def check(self) -> None:
+        reason = None
+        if self.deadline_passed():
+            reason = 'time budget exceeded'
+        elif (self.token_budget is not None) and (self.tokens > self.token_budget):
+            reason = 'token budget exceeded'
+        if reason is not None:
+            raise self.error(reason)
+
+    def on_llm_start(self, serialized, prompts, **kwargs: Any) -> None:
+        self.check() # 超过预算之后不再发出新的请求
+
+    def on_chat_model_start(self, serialized, messages, **kwargs: Any) -> None:
+        self.check()
+
+    def on_llm_end(self, response, **kwargs: Any) -> None:
+        token_usage = (response.llm_output or {}).get('token_usage', {})
+        self.tokens += token_usage.get('total_tokens', 0)
+        if response.generations and response.generations[0]:
+            self.partial_output = response.generations[0][0].text
+        self.check()
+
+    def on_tool_end(self, output: str, **kwargs: Any) -> None:
+        self.check()
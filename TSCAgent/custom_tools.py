@@ -2,10 +2,21 @@
 @Author: WANG Maonan
 @Date: 2023-09-06 14:57:39
 @Description: Agent Tools
-@LastEditTime: 2024-01-06 20:26:51
++ 传入 cache (ToolCache) 时, 同一个 episode/决策时刻内重复调用直接返回之前的结果
++ env.prompt_encoding 为 compact 时使用紧凑的编码, 同一次决策中重复的静态信息只输出一次
+@LastEditTime: 2026-10-18 20:40:05
 '''
+import functools
 from typing import Any, Optional
 from tshub.utils.format_dict import dict_to_str
+from TSCAgent.tool_cache import ToolCache, cached_tool, STATIC, DYNAMIC
+from TSCPrompt.compact_encoding import (
+    encode_layout,
+    encode_phases,
+    encode_occupancy,
+    encode_situation,
+    encode_list
+)
 
 def prompts(name, description):
     def decorator(func) -> Any:
@@ -15,41 +26,79 @@ def prompts(name, description):
 
     return decorator
 
+def is_compact(env) -> bool:
+    return getattr(env, 'prompt_encoding', 'full') == 'compact'
+
+def compact_layout(env) -> str:
+    return 'Layout (movement:direction lanes, l=left s=through r=right): ' + encode_layout(env.get_intersection_layout())
+
+def compact_phases(env) -> str:
+    return 'Phases (phase| green movements):\n' + encode_phases(env.get_signal_phase_structure())
+
+def omit_repeated(section:str):
+    """compact 时, 同一次决策中已经输出过的静态信息不再重复 (需要放在 cached_tool 的外面)
+    """
+    def decorator(func) -> Any:
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            result = func(self, *args, **kwargs)
+            if not is_compact(self.env):
+                return result
+            return self.env.prompt_encoder.static_section(
+                section, result, scope=(self.env.episode, self.env.decision_step)
+            )
+        return wrapper
+    return decorator
+
 # #############################
 # Get Intersection Information
 # #############################
 class GetIntersectionLayout:
-    def __init__(self, env) -> None:
+    def __init__(self, env, cache:ToolCache=None) -> None:
         self.env = env
+        self.cache = cache
     
     @prompts(name="Get Intersection Layout",
             description="Useful when you want to know the structure of the intersection. This tool provides the description of the intersection layout. The input to this tool should always be the str, 'None'.")
+    @omit_repeated(section='Layout')
+    @cached_tool(scope=STATIC)
     def inference(self, junction_id):
+        if is_compact(self.env):
+            return compact_layout(self.env)
         intersection_layout = "The description of this intersection layout"
         intersection_layout += dict_to_str(self.env.get_intersection_layout())
         return intersection_layout
 
 
 class GetSignalPhaseStructure:
-    def __init__(self, env) -> None:
+    def __init__(self, env, cache:ToolCache=None) -> None:
         self.env = env
+        self.cache = cache
     
     @prompts(name="Get Signal Phase Structure",
             description="Useful when you want to know the structure of the signal phase. This tool provides the description of the signal phase structure, including the `Phase ID` in this intersection and `Movement ID` in each signal phase. The input to this tool should always be the str, 'None'.")
+    @omit_repeated(section='Phases')
+    @cached_tool(scope=STATIC)
     def inference(self, junction_id):
+        if is_compact(self.env):
+            return compact_phases(self.env)
         signal_phase_structure = "The description of this Signal Phase Structure"
         signal_phase_structure += dict_to_str(self.env.get_signal_phase_structure())
         return signal_phase_structure
 
 
 class GetCurrentOccupancy:
-    def __init__(self, env: Any) -> None:
+    def __init__(self, env: Any, cache:ToolCache=None) -> None:
         self.env = env
+        self.cache = cache
 
     @prompts(name='Get Current Occupancy',
              description="""Useful when you want to get the congestion situation of each traffic movement at the **current** moment. The input to this tool should be a string, `junction_id`.""")
+    @cached_tool(scope=DYNAMIC)
     def inference(self, *arg, **kwargs) -> str:
         current_occupancy = self.env.get_current_occupancy()
+        if is_compact(self.env):
+            return f'Occupancy % at {self.env.tsc_env.sim_step}s (-1 = detector down): {encode_occupancy(current_occupancy)}'
         current_occupancy_string = f"""Now you get the current occupancy for this intersection. At the current moment {self.env.tsc_env.sim_step}, the congestion situation of each movement is:\n{dict_to_str(current_occupancy)}
         \n,where `key` is the `movement id`, and `value` represents the proportion of the queue length on this `traffic movement` to the total length. Based on the information you have obtained so far, the structure of the intersection, the structure of the traffic phase, and the occupancy of each movement, please select an appropriate action from the available actions and give an explanation.
         """
@@ -57,13 +106,17 @@ class GetCurrentOccupancy:
 
 
 class GetPreviousOccupancy:
-    def __init__(self, env: Any) -> None:
+    def __init__(self, env: Any, cache:ToolCache=None) -> None:
         self.env = env
+        self.cache = cache
 
     @prompts(name='Get Previous Occupancy',
              description="""Useful when you want to get the congestion situation of each traffic movement at the **previous** moment. The input to this tool should be a string, `junction_id`.""")
+    @cached_tool(scope=DYNAMIC)
     def inference(self, *arg, **kwargs) -> str:
         previous_occupancy = self.env.get_previous_occupancy()
+        if is_compact(self.env):
+            return f'Occupancy % at {self.env.tsc_env.sim_step-5}s (-1 = detector down): {encode_occupancy(previous_occupancy)}. Then get the current occupancy.'
         previous_occupancy_string = f"""Now you get the previous occupancy for this intersection. At the previous moment {self.env.tsc_env.sim_step-5}, the congestion situation of each movement is:\n{dict_to_str(previous_occupancy)}
         \n,where `key` is the `movement id`, and `value` represents the proportion of the queue length on this `traffic movement` to the total length. Then please use the appropriate tool to obtain current occupancy.
         """
@@ -74,11 +127,13 @@ class GetPreviousOccupancy:
 # Get Traditional Decision
 # ########################
 class GetTraditionalDecision:
-    def __init__(self, env: Any) -> None:
+    def __init__(self, env: Any, cache:ToolCache=None) -> None:
         self.env = env
+        self.cache = cache
         
     @prompts(name='Get Traditional Decision',
              description="""Useful when you want to obtain the decision made by traditional methods under the current environment. The result of traditional methods is applicable for minimizing queue length. However, in long-tail problems, such as the presence of an ambulance or sudden unavailability of certain movements, traditional methods are not the best solution. The input to this tool should always be the str, 'None'.""")
+    @cached_tool(scope=DYNAMIC, policy_calls=1)
     def inference(self, junction_id) -> str:
         decision = self.env.get_rl_decision()
         traditional_decision = f'The decision provided by traditional methods is to set {int(decision)} as the green signal.'
@@ -89,11 +144,13 @@ class GetTraditionalDecision:
 # Choose Actions
 # ###############
 class GetAvailableActions:
-    def __init__(self, env: Any) -> None:
+    def __init__(self, env: Any, cache:ToolCache=None) -> None:
         self.env = env
+        self.cache = cache
 
     @prompts(name='Get Available Actions',
              description="""Useful before you make the decisions, this tool let you know what are your available actions in this situation step. The input to this tool should always be the str, 'None'.""")
+    @cached_tool(scope=STATIC)
     def inference(self, junction_id) -> str:
         outputPrefix = 'You can ONLY use one of the following actions to control the traffic light to reduce the congestion: \n'
         available_actions = self.env.get_available_actions()
@@ -107,12 +164,19 @@ class GetAvailableActions:
 # Scenario Analysis
 # #################
 class GetJunctionSituation:
-    def __init__(self, env: Any) -> None:
+    def __init__(self, env: Any, cache:ToolCache=None) -> None:
         self.env = env
+        self.cache = cache
     
     @prompts(name="Get Junction Situation",
         description="Useful when you want to determine whether the environment is a long-tail problem in traffic signal control. When you want to judge whether there is an ambulance in the environment, check whether each movement is passable. The input to this tool should always be the str, 'None'.")
+    @cached_tool(scope=DYNAMIC, traci_calls=lambda env: len(env.ls_elements)) # get_movement_state 对每个直行/左转 movement 查询一次
     def inference(self, junction_id) -> str:
+        if is_compact(self.env):
+            return 'Situation: ' + encode_situation(
+                self.env.get_rescue_movement_ids(), self.env.get_movement_state(), self.env.get_detector_state()
+            )
+
         # 添加救护车的信息
         rescue_movement_ids = self.env.get_rescue_movement_ids()
         if rescue_movement_ids is None:
@@ -131,12 +195,59 @@ class GetJunctionSituation:
         return junction_state
 
 
+# ##################
+# One-shot Snapshot
+# ##################
+class GetJunctionSnapshot:
+    def __init__(self, env: Any, cache:ToolCache=None) -> None:
+        self.env = env
+        self.cache = cache
+
+    @prompts(name="Get Junction Snapshot",
+        description="Useful when you want ALL the information needed for one decision in a single call: the intersection layout, the signal phase structure, the current and previous occupancy, emergency vehicles, blocked movements, detector status, the traditional decision and the available actions. The input to this tool should always be the str, 'None'.")
+    @cached_tool(scope=DYNAMIC, traci_calls=lambda env: len(env.ls_elements), policy_calls=1)
+    def inference(self, junction_id) -> str:
+        rescue_movement_ids = self.env.get_rescue_movement_ids()
+        movement_state = self.env.get_movement_state()
+        detector_state = self.env.get_detector_state()
+        blocked_movements = [_id for _id, _pass in movement_state.items() if not _pass]
+        broken_detectors = [_id for _id, _state in detector_state.items() if _state == 'Not Work']
+        if is_compact(self.env):
+            scope = (self.env.episode, self.env.decision_step)
+            encoder = self.env.prompt_encoder
+            return f"""Snapshot at {self.env.tsc_env.sim_step}s. Movement keys are <edge><direction>.
+{encoder.static_section('Layout', compact_layout(self.env), scope)}
+{encoder.static_section('Phases', compact_phases(self.env), scope)}
+Current phase: {self.env.get_current_phase()}
+Occupancy % (-1 = detector down): {encode_occupancy(self.env.get_current_occupancy())}
+Previous occupancy %: {encode_occupancy(self.env.get_previous_occupancy())}
+emergency:{encode_list(rescue_movement_ids)} blocked:{encode_list(blocked_movements)} detector_down:{encode_list(broken_detectors)}
+Traditional decision: Phase-{int(self.env.get_rl_decision())}
+Available actions: {','.join(self.env.get_available_actions())}
+Now give your Final Answer."""
+        junction_snapshot = f"""Snapshot of this intersection at {self.env.tsc_env.sim_step}s.
+Intersection layout (movement id: attributes):\n{dict_to_str(self.env.get_intersection_layout())}
+Signal phase structure (phase id: movement ids):\n{dict_to_str(self.env.get_signal_phase_structure())}
+Current phase: {self.env.get_current_phase()}
+Current occupancy (queue length / lane length, -1 if the detector does not work):\n{dict_to_str(self.env.get_current_occupancy())}
+Previous occupancy:\n{dict_to_str(self.env.get_previous_occupancy())}
+Emergency vehicles: {rescue_movement_ids if rescue_movement_ids else 'None'}
+Blocked movements (cannot pass, do not give them green): {blocked_movements if blocked_movements else 'None'}
+Detectors not working: {broken_detectors if broken_detectors else 'None'}
+Traditional decision (good for minimizing queues in standard situations): Phase-{int(self.env.get_rl_decision())}
+Available actions: {self.env.get_available_actions()}
+This is everything you need, now give your Final Answer."""
+        return junction_snapshot
+
+
 class GetEmergencyVehicle:
-    def __init__(self, env: Any) -> None:
+    def __init__(self, env: Any, cache:ToolCache=None) -> None:
         self.env = env
+        self.cache = cache
 
     @prompts(name='Get Emergency Vehicle',
              description="""Useful when you want to Check if there is an Emergency Vehicle on the specific traffic movement. The input to this tool should be a string, `junction_id`.""")
+    @cached_tool(scope=DYNAMIC)
     def inference(self, junction_id) -> str:
         rescue_movement_ids = self.env.get_rescue_movement()
         if len(rescue_movement_ids) == 0:
@@ -0,0 +1,254 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 16:10:27
+@Description: 放在 LLM Agent 之前的决策缓存
++ 使用 junction_similarity 中的特征描述路口: phase 车道数, phase occupancy, 是否有急救车
++ 急救车所在的 movement, 不可通行的 movement, 损坏的探测器需要完全相同 (作为 key)
++ key 相同且相似度小于 threshold 时, 直接返回之前的动作和解释, 不调用 LLM
++ 数据保存在 SQLite 中, 每次插入只追加一行; 超过 max_entries 时删除最久没有使用的记录
+@LastEditTime: 2026-10-19 16:02:14
+'''
+import json
+import time
+import numpy as np
+from loguru import logger
+from typing import Any, Dict, List, Tuple
+
+from utils.similarity_index import JunctionSimilarityIndex
+from utils.junction_database import (
+    connect_database,
+    encode_vector,
+    decode_vector,
+    get_phase_lane_counts
+)
+
+DECISION_CACHE_TABLE = """
+    CREATE TABLE IF NOT EXISTS decision_cache(
+        entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        cache_key TEXT NOT NULL,
+        lane_counts BLOB NOT NULL,
+        current_occupancy BLOB NOT NULL,
+        previous_occupancy BLOB NOT NULL,
+        has_emergency INTEGER NOT NULL,
+        phase_id INTEGER NOT NULL,
+        explanation TEXT,
+        last_used REAL NOT NULL,
+        hits INTEGER NOT NULL DEFAULT 0);"""
+
+
+def get_junction_features(env) -> Dict[str, Any]:
+    """从 wrapper 中提取路口的特征
+
+    Returns:
+        Dict[str, Any]:
+            - cache_key, 离散的特征, 需要完全相同
+            - lane_counts, current_occupancy, previous_occupancy, has_emergency, 用于计算相似度
+    """
+    phase_structure = env.get_signal_phase_structure()
+    rescue_movement_ids = env.get_rescue_movement_ids() or []
+    movement_state = env.get_movement_state()
+    detector_state = env.get_detector_state()
+    cache_key = json.dumps({
+        'junction_id': env.tls_id,
+        'emergency': sorted(rescue_movement_ids),
+        'blocked': sorted(_id for _id, _pass in movement_state.items() if not _pass),
+        'detector': sorted(_id for _id, _state in detector_state.items() if _state == 'Not Work'),
+    }, sort_keys=True)
+    return {
+        'cache_key': cache_key,
+        'lane_counts': get_phase_lane_counts(env.get_intersection_layout(), phase_structure, env.tls_id),
+        'current_occupancy': env.get_phase_occupancy(),
+        'previous_occupancy': env.get_phase_occupancy(previous=True),
+        'has_emergency': len(rescue_movement_ids) > 0,
+    }
+
+
+class _Bucket:
+    """相同 cache_key 的记录, 特征保存在预分配的矩阵中
+    + add 原地写入一行, 容量不够时扩大为两倍 (均摊 O(1))
+    + remove 使用最后一行覆盖被删除的行 (swap-remove), 不需要重建
+    """
+    def __init__(self, capacity:int=16) -> None:
+        self.entry_ids = [] # 与矩阵的行顺序相同
+        self.positions = {} # entry_id -> 行号
+        self.size = 0
+        self.width = 0 # phase 数量, 不同的记录长度不同时使用 0 填充
+        self.lane_counts = np.zeros((capacity, 0), dtype=np.float64)
+        self.current_occupancy = np.zeros((capacity, 0), dtype=np.float64)
+        self.previous_occupancy = np.zeros((capacity, 0), dtype=np.float64)
+        self.has_emergency = np.zeros(capacity, dtype=bool)
+
+    def _reserve(self, num_rows:int, width:int) -> None:
+        capacity = len(self.has_emergency)
+        if num_rows <= capacity and width <= self.width:
+            return
+        capacity = max(capacity, 1)
+        while capacity < num_rows:
+            capacity *= 2
+        width = max(width, self.width)
+        for name in ('lane_counts', 'current_occupancy', 'previous_occupancy'):
+            matrix = np.zeros((capacity, width), dtype=np.float64)
+            matrix[:self.size, :self.width] = getattr(self, name)[:self.size]
+            setattr(self, name, matrix)
+        has_emergency = np.zeros(capacity, dtype=bool)
+        has_emergency[:self.size] = self.has_emergency[:self.size]
+        self.has_emergency = has_emergency
+        self.width = width
+
+    def add(self, entry_id:int, features:Tuple[Any, ...]) -> None:
+        lane_counts, current, previous, has_emergency = features
+        self._reserve(self.size + 1, max(len(lane_counts), len(current), len(previous)))
+        row = self.size
+        for matrix, vector in ((self.lane_counts, lane_counts), (self.current_occupancy, current), (self.previous_occupancy, previous)):
+            matrix[row, :len(vector)] = vector
+            matrix[row, len(vector):] = 0
+        self.has_emergency[row] = has_emergency
+        self.entry_ids.append(entry_id)
+        self.positions[entry_id] = row
+        self.size += 1
+
+    def remove(self, entry_id:int) -> None:
+        row, last = self.positions.pop(entry_id), self.size - 1
+        if row != last: # 最后一行移动到被删除的位置
+            for matrix in (self.lane_counts, self.current_occupancy, self.previous_occupancy, self.has_emergency):
+                matrix[row] = matrix[last]
+            self.entry_ids[row] = self.entry_ids[last]
+            self.positions[self.entry_ids[row]] = row
+        self.entry_ids.pop()
+        self.size -= 1
+
+    def get_index(self) -> JunctionSimilarityIndex:
+        """当前记录的 index, 使用矩阵的 view, 不复制
+        """
+        return JunctionSimilarityIndex(
+            self.lane_counts[:self.size], self.current_occupancy[:self.size],
+            self.previous_occupancy[:self.size], self.has_emergency[:self.size]
+        )
+
+
+class DecisionCache:
+    def __init__(self, database:str, threshold:float=0.05, max_entries:int=5000) -> None:
+        """
+        Args:
+            database (str): 缓存的 SQLite 文件, 多次运行之间可以复用
+            threshold (float, optional): 相似度 (junction_similarity 中的分数) 小于该值时复用决策. Defaults to 0.05.
+            max_entries (int, optional): 最多保存的记录数量, 超过时删除最久没有使用的记录. Defaults to 5000.
+        """
+        self.database = database
+        self.threshold = threshold
+        self.max_entries = max_entries
+
+        self.connection = connect_database(database)
+        with self.connection:
+            self.connection.execute(DECISION_CACHE_TABLE)
+
+        # 从磁盘中读取之前的记录
+        self.buckets: Dict[str, _Bucket] = {}
+        self.entries: Dict[int, Dict[str, Any]] = {} # entry_id -> phase_id, explanation, cache_key, last_used
+        for entry_id, cache_key, lane_counts, current, previous, has_emergency, phase_id, explanation, last_used in self.connection.execute(
+            "SELECT entry_id, cache_key, lane_counts, current_occupancy, previous_occupancy, has_emergency, phase_id, explanation, last_used FROM decision_cache;"
+        ):
+            self._add_entry(
+                entry_id, cache_key,
+                (decode_vector(lane_counts), decode_vector(current), decode_vector(previous), bool(has_emergency)),
+                phase_id, explanation, last_used
+            )
+
+        # 统计
+        self.lookups = 0
+        self.hits = 0
+        self.lookup_time = 0 # 查询花费的时间
+        self.llm_calls = 0
+        self.llm_time = 0 # 未命中时 LLM 花费的时间
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _add_entry(self, entry_id, cache_key, features, phase_id, explanation, last_used) -> None:
+        if cache_key not in self.buckets:
+            self.buckets[cache_key] = _Bucket()
+        self.buckets[cache_key].add(entry_id, features)
+        self.entries[entry_id] = {
+            'cache_key': cache_key, 'phase_id': phase_id,
+            'explanation': explanation, 'last_used': last_used
+        }
+
+    @staticmethod
+    def _to_tuple(features:Dict[str, Any]) -> Tuple[Any, ...]:
+        return (
+            np.asarray(features['lane_counts'], dtype=np.float32),
+            np.asarray(features['current_occupancy'], dtype=np.float32),
+            np.asarray(features['previous_occupancy'], dtype=np.float32),
+            bool(features['has_emergency'])
+        )
+
+    def lookup(self, features:Dict[str, Any]) -> Tuple[int, str]|None:
+        """查找相似的决策, 没有找到时返回 None
+        """
+        start_time = time.perf_counter()
+        self.lookups += 1
+        result = None
+        bucket = self.buckets.get(features['cache_key'])
+        if bucket is not None and len(bucket.entry_ids) > 0:
+            indices, scores = bucket.get_index().query(*self._to_tuple(features), k=1)
+            if scores[0] <= self.threshold:
+                entry_id = bucket.entry_ids[indices[0]]
+                entry = self.entries[entry_id]
+                entry['last_used'] = time.time()
+                with self.connection:
+                    self.connection.execute(
+                        "UPDATE decision_cache SET last_used=?, hits=hits+1 WHERE entry_id=?;",
+                        (entry['last_used'], entry_id)
+                    )
+                self.hits += 1
+                result = (entry['phase_id'], entry['explanation'])
+                logger.info(f'SIM: Reuse decision {entry_id} (score {scores[0]:.4f}), Phase {entry["phase_id"]}.')
+        self.lookup_time += time.perf_counter() - start_time
+        return result
+
+    def insert(self, features:Dict[str, Any], phase_id:int, explanation:str, llm_latency:float=None) -> None:
+        """加入 LLM 的决策, llm_latency 用于估计命中时节省的时间
+        """
+        if llm_latency is not None:
+            self.llm_calls += 1
+            self.llm_time += llm_latency
+        features_tuple = self._to_tuple(features)
+        last_used = time.time()
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO decision_cache (cache_key, lane_counts, current_occupancy, previous_occupancy, has_emergency, phase_id, explanation, last_used) VALUES (?,?,?,?,?,?,?,?);",
+                (features['cache_key'], *[encode_vector(vector) for vector in features_tuple[:3]], int(features_tuple[3]), int(phase_id), explanation, last_used)
+            )
+        self._add_entry(cursor.lastrowid, features['cache_key'], features_tuple, int(phase_id), explanation, last_used)
+        self.evict()
+
+    def evict(self) -> List[int]:
+        """删除最久没有使用的记录 (LRU)
+        """
+        num_evict = len(self.entries) - self.max_entries
+        if num_evict <= 0:
+            return []
+        evict_ids = sorted(self.entries, key=lambda _id: self.entries[_id]['last_used'])[:num_evict]
+        with self.connection:
+            self.connection.executemany("DELETE FROM decision_cache WHERE entry_id=?;", [(_id,) for _id in evict_ids])
+        for entry_id in evict_ids:
+            entry = self.entries.pop(entry_id)
+            self.buckets[entry['cache_key']].remove(entry_id)
+        return evict_ids
+
+    def stats(self) -> Dict[str, float]:
+        """命中率与延迟统计
+        """
+        mean_llm_latency = self.llm_time / self.llm_calls if self.llm_calls > 0 else 0
+        return {
+            'entries': len(self.entries),
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.lookups if self.lookups > 0 else 0,
+            'mean_lookup_latency': self.lookup_time / self.lookups if self.lookups > 0 else 0,
+            'mean_llm_latency': mean_llm_latency,
+            'saved_time': self.hits * mean_llm_latency, # 估计节省的 LLM 时间
+        }
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,69 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 19:31:48
+@Description: Agent 的决策记忆, 替换 ConversationSummaryMemory
++ 只保存最近 K 次的决策和解释, 不调用 LLM 进行总结
++ 输出的文本不超过 max_tokens (估计值), 超过时删除最早的记录, 并截断过长的解释
++ 记录决策的来源, 只有 LLM 给出的决策保存解释 (RL, fallback 的决策只记录动作和来源)
+@LastEditTime: 2026-10-19 13:48:02
+'''
+from collections import deque
+from typing import Any, List
+
+from TSCPrompt.compact_encoding import count_tokens
+
+LLM_SOURCES = ('llm', 'cache', 'partial') # 解释由 LLM 给出的来源 (cache 是相似场景中 LLM 的决策)
+
+
+class DecisionMemory:
+    def __init__(self, max_decisions:int=5, max_tokens:int=300, max_explanation_chars:int=300) -> None:
+        """
+        Args:
+            max_decisions (int, optional): 最多保存的决策数量 K. Defaults to 5.
+            max_tokens (int, optional): 输出文本的 token 上限. Defaults to 300.
+            max_explanation_chars (int, optional): 每条解释最多保留的字符数. Defaults to 300.
+        """
+        self.max_tokens = max_tokens
+        self.max_explanation_chars = max_explanation_chars
+        self.decisions = deque(maxlen=max_decisions) # (sim_step, action, explanation, source)
+
+    def __len__(self) -> int:
+        return len(self.decisions)
+
+    def add(self, sim_step:float, action:Any, explanation:str, source:str='llm') -> None:
+        """记录在 sim_step 之前执行的决策, source 不在 LLM_SOURCES 中时不保存解释
+        """
+        if source not in LLM_SOURCES:
+            explanation = ''
+        explanation = ' '.join(str(explanation or '').split()) # 去掉换行和多余的空格
+        if len(explanation) > self.max_explanation_chars:
+            explanation = explanation[:self.max_explanation_chars] + '...'
+        if str(action).isdigit(): # phase id
+            action = f'Phase-{action}'
+        self.decisions.append((sim_step, action, explanation, source))
+
+    def clear(self) -> None:
+        self.decisions.clear()
+
+    def lines(self) -> List[str]:
+        return [
+            f'- until {sim_step}s: {action}'
+            + ('' if source in LLM_SOURCES else f' (by the {source} controller)')
+            + (f', because {explanation}' if explanation else '')
+            for sim_step, action, explanation, source in self.decisions
+        ]
+
+    def render(self, skip_latest:bool=False) -> str:
+        """从旧到新输出最近的决策, 超过 max_tokens 时删除最早的记录
+        skip_latest 为 True 时不输出最新的一条 (prompt 中已经单独给出上一次的决策)
+        """
+        lines = self.lines()
+        if skip_latest:
+            lines = lines[:-1]
+        if len(lines) == 0:
+            return 'No previous decisions.'
+        while len(lines) > 1 and count_tokens('\n'.join(lines)) > self.max_tokens:
+            lines.pop(0)
+        while count_tokens(lines[0]) > self.max_tokens: # 只剩最新的一条时截断
+            lines[0] = lines[0][:int(len(lines[0])*0.9)]
+        return '\n'.join(lines)
@@ -0,0 +1,141 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 20:14:37
+@Description: 记录每一次 Agent 决策的耗时与 token
++ 每次决策: 总耗时, 每个 tool 的耗时, LLM 调用次数/耗时, prompt/completion token, 格式错误的重试次数 (_Exception), 最终的动作
++ 每次决策写入一行 CSV 和 JSONL, 同时统计最近 window 次决策的 p50/p95/p99
+@LastEditTime: 2026-10-18 20:14:37
+'''
+import csv
+import json
+import time
+import numpy as np
+from pathlib import Path
+from loguru import logger
+from collections import deque
+from typing import Any, Dict, List
+from langchain.callbacks.base import BaseCallbackHandler
+
+METRIC_FIELDS = [
+    'episode', 'sim_step', 'wall_time', 'llm_calls', 'llm_time',
+    'prompt_tokens', 'completion_tokens', 'tool_calls', 'tool_time',
+    'tool_latency', 'parse_errors', 'action', 'source'
+]
+SUMMARY_FIELDS = ['wall_time', 'llm_time', 'tool_time', 'llm_calls', 'prompt_tokens', 'completion_tokens']
+
+
+class DecisionMetricsCallback(BaseCallbackHandler):
+    def __init__(self, output_path:str=None, window:int=100, summary_every:int=10) -> None:
+        """
+        Args:
+            output_path (str, optional): 输出文件的路径 (不含后缀), 生成 .csv 和 .jsonl, None 时不写文件. Defaults to None.
+            window (int, optional): 统计分位数的决策数量. Defaults to 100.
+            summary_every (int, optional): 每多少次决策输出一次统计. Defaults to 10.
+        """
+        super().__init__()
+        self.window = deque(maxlen=window)
+        self.summary_every = summary_every
+        self.num_decisions = 0
+        self.record = None # 当前的决策
+        self.pending = {} # run_id -> (name, start_time)
+
+        self.csv_file = self.jsonl_file = self.csv_writer = None
+        if output_path is not None:
+            output_path = Path(output_path)
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            self.csv_file = open(output_path.with_suffix('.csv'), 'w', newline='')
+            self.csv_writer = csv.DictWriter(self.csv_file, fieldnames=METRIC_FIELDS)
+            self.csv_writer.writeheader()
+            self.jsonl_file = open(output_path.with_suffix('.jsonl'), 'w')
+
+    # ##########
+    # Decision
+    # ##########
+    def start_decision(self, sim_step:float, episode:int=None) -> None:
+        if self.record is not None:
+            self.end_decision(action=None, source='unfinished') # 上一次决策没有结束
+        self.record = {
+            'episode': episode, 'sim_step': sim_step, 'start_time': time.perf_counter(),
+            'llm_calls': 0, 'llm_time': 0.0, 'prompt_tokens': 0, 'completion_tokens': 0,
+            'tool_calls': 0, 'tool_time': 0.0, 'tool_latency': {}, 'parse_errors': 0,
+        }
+        self.pending = {}
+
+    def end_decision(self, action:Any, source:str='llm') -> Dict[str, Any]|None:
+        """决策完成 (解析出动作之后), source 是动作的来源, 例如 llm, fallback
+        """
+        if self.record is None:
+            return None
+        record, self.record = self.record, None
+        record['wall_time'] = time.perf_counter() - record.pop('start_time')
+        record['action'] = None if action is None else int(action)
+        record['source'] = source
+        self.window.append(record)
+        self.num_decisions += 1
+        if self.csv_writer is not None:
+            self.csv_writer.writerow(dict(record, tool_latency=json.dumps(record['tool_latency'])))
+            self.csv_file.flush()
+            self.jsonl_file.write(json.dumps(record) + '\n')
+            self.jsonl_file.flush()
+        if (self.summary_every > 0) and (self.num_decisions % self.summary_every == 0):
+            logger.info(f'SIM: Decision metrics (last {len(self.window)}), {self.summary()}')
+        return record
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """最近 window 次决策的 p50/p95/p99
+        """
+        summary = {}
+        for field in SUMMARY_FIELDS:
+            values = np.array([record[field] for record in self.window], dtype=np.float64)
+            if len(values) == 0:
+                continue
+            p50, p95, p99 = np.percentile(values, [50, 95, 99]).tolist()
+            summary[field] = {'p50': p50, 'p95': p95, 'p99': p99, 'mean': float(values.mean())}
+        return summary
+
+    def close(self) -> None:
+        for file in (self.csv_file, self.jsonl_file):
+            if file is not None:
+                file.close()
+
+    # ##########
+    # Callbacks
+    # ##########
+    def on_llm_start(self, serialized:Dict[str, Any], prompts:List[str], *, run_id, **kwargs: Any) -> None:
+        self.pending[run_id] = ('llm', time.perf_counter())
+
+    def on_chat_model_start(self, serialized:Dict[str, Any], messages:List[List[Any]], *, run_id, **kwargs: Any) -> None:
+        self.pending[run_id] = ('llm', time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs: Any) -> None:
+        _, start_time = self.pending.pop(run_id, (None, None))
+        if self.record is None:
+            return
+        self.record['llm_calls'] += 1
+        if start_time is not None:
+            self.record['llm_time'] += time.perf_counter() - start_time
+        token_usage = (response.llm_output or {}).get('token_usage', {})
+        self.record['prompt_tokens'] += token_usage.get('prompt_tokens', 0)
+        self.record['completion_tokens'] += token_usage.get('completion_tokens', 0)
+
+    def on_llm_error(self, error:BaseException, *, run_id, **kwargs: Any) -> None:
+        self.pending.pop(run_id, None)
+
+    def on_tool_start(self, serialized:Dict[str, Any], input_str:str, *, run_id, **kwargs: Any) -> None:
+        self.pending[run_id] = (serialized.get('name', 'tool'), time.perf_counter())
+
+    def on_tool_end(self, output:str, *, run_id, **kwargs: Any) -> None:
+        name, start_time = self.pending.pop(run_id, (None, None))
+        if (self.record is None) or (start_time is None):
+            return
+        latency = time.perf_counter() - start_time
+        self.record['tool_calls'] += 1
+        self.record['tool_time'] += latency
+        self.record['tool_latency'].setdefault(name, []).append(latency)
+
+    def on_tool_error(self, error:BaseException, *, run_id, **kwargs: Any) -> None:
+        self.pending.pop(run_id, None)
+
+    def on_agent_action(self, action, **kwargs: Any) -> None:
+        if (self.record is not None) and (action.tool == '_Exception'):
+            self.record['parse_errors'] += 1 # HANDLE_PARSING_ERROR 之后的重试
@@ -0,0 +1,89 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 18:52:16
+@Description: 只有在长尾场景下才调用 LLM Agent, 其余时刻直接使用 RL 的动作
+长尾场景:
++ 有急救车 (get_rescue_movement_ids)
++ 有 movement 不可以通行 (get_movement_state)
++ 有探测器损坏 (get_detector_state)
++ occupancy 异常, 某个 movement 的占有率超过 occ_threshold, 或者与上一时刻相比变化超过 occ_jump
+@LastEditTime: 2026-10-19 14:14:37
+'''
+import time
+import numpy as np
+from loguru import logger
+from collections import Counter
+from typing import Dict, List
+
+
+class LongTailGate:
+    def __init__(self, occ_threshold:float=None, occ_jump:float=None) -> None:
+        """
+        Args:
+            occ_threshold (float, optional): 占有率 (0-1) 超过该值认为是异常, None 时不检查. Defaults to None.
+            occ_jump (float, optional): 与上一时刻相比占有率的变化超过该值认为是异常, None 时不检查. Defaults to None.
+        """
+        self.occ_threshold = occ_threshold
+        self.occ_jump = occ_jump
+
+        # 统计
+        self.num_decisions = 0
+        self.num_escalated = 0
+        self.reasons = Counter()
+        self.gate_time = 0 # 判断是否是长尾场景花费的时间
+        self.llm_time = 0 # 调用 LLM 花费的时间
+        self.llm_calls = 0
+
+    def check(self, env) -> List[str]:
+        """返回长尾场景的原因, 为空则是普通的场景
+        """
+        reasons = []
+        if env.get_rescue_movement_ids():
+            reasons.append('emergency')
+        if not all(env.get_movement_state().values()):
+            reasons.append('blocked')
+        detector_state = env.get_detector_state()
+        if any(state == 'Not Work' for state in detector_state.values()):
+            reasons.append('detector')
+        if (self.occ_threshold is not None) or (self.occ_jump is not None):
+            working = np.zeros(len(env.current_avg_occ), dtype=bool) # movement 少于 12 个时, 后面是 padding
+            working[:len(env.movement_ids)] = [
+                detector_state.get(movement_id, 'Work') == 'Work' and not movement_id.endswith('--r')
+                for movement_id in env.movement_ids
+            ] # 只看正常工作的直行和左转
+            current_occ = env.current_avg_occ[working]
+            previous_occ = env.previous_avg_occ[working]
+            if (self.occ_threshold is not None) and np.any(current_occ > self.occ_threshold):
+                reasons.append('occupancy')
+            elif (self.occ_jump is not None) and np.any(np.abs(current_occ - previous_occ) > self.occ_jump):
+                reasons.append('occupancy')
+        return reasons
+
+    def should_escalate(self, env) -> bool:
+        """是否需要调用 LLM Agent
+        """
+        start_time = time.perf_counter()
+        reasons = self.check(env)
+        self.gate_time += time.perf_counter() - start_time
+        self.num_decisions += 1
+        if len(reasons) > 0:
+            self.num_escalated += 1
+            self.reasons.update(reasons)
+            logger.info(f'SIM: Long-tail scenario {reasons}, call the LLM agent.')
+        return len(reasons) > 0
+
+    def record_llm_latency(self, latency:float) -> None:
+        self.llm_calls += 1
+        self.llm_time += latency
+
+    def stats(self) -> Dict[str, float]:
+        mean_llm_latency = self.llm_time / self.llm_calls if self.llm_calls > 0 else 0
+        num_skipped = self.num_decisions - self.num_escalated
+        return {
+            'decisions': self.num_decisions,
+            'escalated': self.num_escalated,
+            'escalated_fraction': self.num_escalated / self.num_decisions if self.num_decisions > 0 else 0,
+            'reasons': dict(self.reasons),
+            'mean_llm_latency': mean_llm_latency,
+            'saved_time': num_skipped * mean_llm_latency - self.gate_time, # 估计节省的时间
+        }
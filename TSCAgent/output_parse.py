@@ -2,12 +2,26 @@
 @Author: WANG Maonan
 @Date: 2023-09-18 17:52:04
 @Description: Output parse
-@LastEditTime: 2023-10-15 23:54:16
++ 先在本地解析 Agent 的最终回答 (JSON, 正则, 与 get_available_actions 匹配 phase 名称)
++ 本地解析失败时才调用 LLM, 并统计调用 LLM 的比例; callbacks (例如 DecisionMetricsCallback) 会记录这次 LLM 调用
+@LastEditTime: 2026-10-19 14:05:26
 '''
+import re
+import json
+from loguru import logger
+from typing import Any, Dict, List
 from langchain.output_parsers import ResponseSchema
 from langchain.output_parsers import StructuredOutputParser
 from langchain.prompts import ChatPromptTemplate, HumanMessagePromptTemplate
 
+DECISION_KEYS = ('phase_id', 'decision', 'action') # 回答中动作的 key
+EXPLANATION_KEYS = ('explanation', 'explanations', 'expalanation', 'expalanations') # prompt 中的拼写是 expalanations
+JSON_BLOCK_PATTERN = re.compile(r'\{.*\}', re.DOTALL)
+PHASE_PATTERN = re.compile(r'(?:signal\s+)?phase[\s\-_]*(\d+)', re.IGNORECASE)
+DECISION_PATTERN = re.compile(r'"?(?:phase_id|decision|action)"?\s*:\s*\{?\s*"?([^"\}\n,]+)', re.IGNORECASE)
+EXPLANATION_PATTERN = re.compile(r'"?expa?lanations?"?\s*:\s*\{?\s*"?(.+?)"?\s*\}?\s*(?:```|$)', re.IGNORECASE | re.DOTALL)
+
+
 class OutputParse(object):
     def __init__(self, env=None, llm=None) -> None:
         self.sce = env
@@ -22,7 +36,80 @@ class OutputParse(object):
         self.output_parser = StructuredOutputParser.from_response_schemas(self.response_schemas)
         self.format_instructions = self.output_parser.get_format_instructions()
 
-    def parser_output(self, final_results:str) -> str:
+        # 统计
+        self.num_parse = 0
+        self.num_fallback = 0 # 调用 LLM 的次数
+
+    # ############
+    # Local Parse
+    # ############
+    def get_phase_ids(self) -> List[int]|None:
+        """可以选择的 phase id, 没有 env 时不检查
+        """
+        if self.sce is None:
+            return None
+        phase_ids = []
+        for action in self.sce.get_available_actions(): # 'Phase-0' 或者 0
+            match = re.search(r'\d+', str(action))
+            if match is not None:
+                phase_ids.append(int(match.group()))
+        return phase_ids
+
+    def match_phase(self, text:Any) -> int|None:
+        """从文本中找到唯一的 phase id
+        """
+        if isinstance(text, (int, float)) and not isinstance(text, bool):
+            candidates = {int(text)}
+        else:
+            text = str(text).strip()
+            candidates = {int(_id) for _id in PHASE_PATTERN.findall(text)}
+            if len(candidates) == 0 and re.fullmatch(r'\d+', text):
+                candidates = {int(text)}
+        if len(candidates) != 1:
+            return None # 没有找到或者有歧义
+        phase_id = candidates.pop()
+        phase_ids = self.get_phase_ids()
+        if (phase_ids is not None) and (phase_id not in phase_ids):
+            return None
+        return phase_id
+
+    def parse_json(self, final_results:str) -> Dict[str, Any]|None:
+        match = JSON_BLOCK_PATTERN.search(final_results)
+        if match is None:
+            return None
+        try:
+            output = json.loads(match.group())
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(output, dict):
+            return None
+        output = {key.lower(): value for key, value in output.items()}
+        decision = next((output[key] for key in DECISION_KEYS if key in output), None)
+        phase_id = None if decision is None else self.match_phase(decision)
+        if phase_id is None:
+            return None
+        explanation = next((output[key] for key in EXPLANATION_KEYS if key in output), '')
+        return {'phase_id': phase_id, 'explanation': str(explanation)}
+
+    def parse_regex(self, final_results:str) -> Dict[str, Any]|None:
+        text = final_results.split('Final Answer:')[-1] # 只看最终的回答
+        decision = DECISION_PATTERN.search(text)
+        phase_id = self.match_phase(decision.group(1) if decision is not None else text)
+        if phase_id is None:
+            return None
+        explanation = EXPLANATION_PATTERN.search(text)
+        explanation = explanation.group(1).strip() if explanation is not None else text.strip()
+        return {'phase_id': phase_id, 'explanation': explanation}
+
+    def parse_local(self, final_results:str) -> Dict[str, Any]|None:
+        """依次尝试 JSON 和正则, 失败时返回 None
+        """
+        return self.parse_json(final_results) or self.parse_regex(final_results)
+
+    # ##########
+    # LLM Parse
+    # ##########
+    def parse_llm(self, final_results:str, callbacks:List[Any]=None) -> Dict[str, Any]:
         prompt_template = ChatPromptTemplate(
             messages=[
                 HumanMessagePromptTemplate.from_template(
@@ -35,7 +122,20 @@ class OutputParse(object):
         custom_message = prompt_template.format_messages(
             answer = final_results,
         )
-        output = self.llm(custom_message)
-        self.final_parsered_output = self.output_parser.parse(output.content)
-        
-        return self.final_parsered_output
\ No newline at end of file
+        output = self.llm(custom_message, callbacks=callbacks)
+        return self.output_parser.parse(output.content)
+
+    def parser_output(self, final_results:str, callbacks:List[Any]=None) -> Dict[str, Any]:
+        """callbacks 传给 LLM 解析 (本地解析失败时), 使这次调用计入决策的统计
+        """
+        self.num_parse += 1
+        self.final_parsered_output = self.parse_local(final_results)
+        if self.final_parsered_output is None:
+            self.num_fallback += 1
+            logger.info(f'SIM: Local parse failed, fall back to LLM ({self.num_fallback}/{self.num_parse}).')
+            self.final_parsered_output = self.parse_llm(final_results, callbacks=callbacks)
+
+        return self.final_parsered_output
+
+    def fallback_rate(self) -> float:
+        return self.num_fallback / self.num_parse if self.num_parse > 0 else 0
@@ -0,0 +1,88 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 16:52:09
+@Description: LLM 回答的缓存, key 是 prompt 输入的规范形式 (例如量化之后的 occupancy)
++ 内存中使用 LRU
++ 可选的 SQLite 持久化, 多次运行之间复用
+@LastEditTime: 2026-10-18 16:52:09
+'''
+import time
+import hashlib
+from loguru import logger
+from collections import OrderedDict
+from typing import Dict
+
+from utils.junction_database import connect_database
+
+RESPONSE_CACHE_TABLE = """
+    CREATE TABLE IF NOT EXISTS response_cache(
+        cache_key TEXT PRIMARY KEY,
+        response TEXT NOT NULL,
+        created REAL NOT NULL);"""
+
+
+class ResponseCache:
+    def __init__(self, capacity:int=1024, database:str=None) -> None:
+        """
+        Args:
+            capacity (int, optional): 内存中最多保存的回答数量. Defaults to 1024.
+            database (str, optional): SQLite 文件, 为 None 时只使用内存. Defaults to None.
+        """
+        self.capacity = capacity
+        self.memory = OrderedDict()
+        self.connection = None
+        if database is not None:
+            self.connection = connect_database(database)
+            with self.connection:
+                self.connection.execute(RESPONSE_CACHE_TABLE)
+        self.reset_stats()
+
+    @staticmethod
+    def make_key(canonical_input:str) -> str:
+        return hashlib.sha256(canonical_input.encode('utf-8')).hexdigest()
+
+    def reset_stats(self) -> None:
+        """每个 episode 开始时清空统计
+        """
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+    def get(self, key:str) -> str|None:
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.stats['memory_hits'] += 1
+            return self.memory[key]
+        if self.connection is not None:
+            row = self.connection.execute("SELECT response FROM response_cache WHERE cache_key=?;", (key,)).fetchone()
+            if row is not None:
+                self._put_memory(key, row[0])
+                self.stats['disk_hits'] += 1
+                return row[0]
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, key:str, response:str) -> None:
+        self._put_memory(key, response)
+        if self.connection is not None:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO response_cache VALUES (?,?,?);", (key, response, time.time())
+                )
+
+    def _put_memory(self, key:str, response:str) -> None:
+        self.memory[key] = response
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.capacity:
+            self.memory.popitem(last=False) # 删除最久没有使用的
+
+    def log_stats(self, episode:int=None) -> Dict[str, float]:
+        """输出当前 episode 的命中情况
+        """
+        total = sum(self.stats.values())
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        stats = dict(self.stats, hit_rate=hits/total if total > 0 else 0)
+        logger.info(f'SIM: Response cache (episode {episode}), {stats}')
+        return stats
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
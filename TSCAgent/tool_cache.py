@@ -0,0 +1,86 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 17:20:41
+@Description: Agent Tools 结果的缓存
++ static, 路口结构, 信号灯结构, 可用动作, 每个 episode 只计算一次
++ dynamic, occupancy, RL 决策, 路口状况, 每个决策时刻 (decision_step) 只计算一次
++ set_edge_speed/set_occ_missing 修改环境时 state_version 增加, dynamic 的结果失效
+@LastEditTime: 2026-10-18 17:20:41
+'''
+import functools
+from typing import Any, Callable, Dict, Tuple
+
+STATIC = 'static'
+DYNAMIC = 'dynamic'
+
+
+class ToolCache:
+    def __init__(self, env) -> None:
+        """
+        Args:
+            env: BaseTSCEnvWrapper, 需要有 episode, decision_step, state_version
+        """
+        self.env = env
+        self.results: Dict[str, Tuple[Tuple[int, ...], Any]] = {} # tool name -> (scope key, result)
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.calls = 0
+        self.hits = 0
+        self.avoided_traci_calls = 0 # 没有调用的 TraCI 查询次数
+        self.avoided_policy_calls = 0 # 没有调用的 model.predict 次数
+
+    def scope_key(self, scope:str) -> Tuple[int, ...]:
+        if scope == STATIC:
+            return (self.env.episode,)
+        return (self.env.episode, self.env.decision_step, self.env.state_version)
+
+    def get_or_call(self, name:str, scope:str, func:Callable[[], Any], traci_calls:int=0, policy_calls:int=0) -> Any:
+        """scope 相同时直接返回之前的结果, 否则调用 func
+        """
+        self.calls += 1
+        scope_key = self.scope_key(scope)
+        cached = self.results.get(name)
+        if cached is not None and cached[0] == scope_key:
+            self.hits += 1
+            self.avoided_traci_calls += traci_calls
+            self.avoided_policy_calls += policy_calls
+            return cached[1]
+        result = func()
+        self.results[name] = (scope_key, result) # 每个 tool 只保留最新的结果
+        return result
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'calls': self.calls,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.calls if self.calls > 0 else 0,
+            'avoided_traci_calls': self.avoided_traci_calls,
+            'avoided_policy_calls': self.avoided_policy_calls,
+        }
+
+
+def cached_tool(scope:str, traci_calls:Callable[[Any], int]=None, policy_calls:int=0):
+    """缓存 tool 的 inference, tool 需要有 self.env 和 self.cache (为 None 时不缓存)
+    tool 的输入 (junction_id) 不影响输出, 因此 key 只包含 tool 的名称
+
+    Args:
+        scope (str): STATIC 或 DYNAMIC
+        traci_calls (Callable[[Any], int], optional): 根据 env 计算一次调用中 TraCI 查询的次数. Defaults to None.
+        policy_calls (int, optional): 一次调用中 model.predict 的次数. Defaults to 0.
+    """
+    def decorator(func) -> Any:
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            cache = getattr(self, 'cache', None)
+            if cache is None:
+                return func(self, *args, **kwargs)
+            return cache.get_or_call(
+                name=type(self).__name__, scope=scope,
+                func=lambda: func(self, *args, **kwargs),
+                traci_calls=0 if traci_calls is None else traci_calls(self.env),
+                policy_calls=policy_calls
+            )
+        return wrapper
+
+    return decorator
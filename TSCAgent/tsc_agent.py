@@ -2,17 +2,21 @@
 @Author: WANG Maonan
 @Date: 2023-09-04 20:51:49
 @Description: traffic light control LLM Agent
-@LastEditTime: 2024-01-06 17:02:26
++ deadline/token_budget, 超过预算时中止 Agent, 依次使用: 部分的回答 -> RL 的决策 -> 最大 occupancy 的相位
++ deadline 是硬的预算: 每次 LLM 请求的 request_timeout 为剩余的时间, 超过之后不再发出请求
++ DecisionMemory, 最近 K 次的决策作为文本放入 prompt, 不需要 LLM 总结 (上一次的决策单独给出, 不在历史中重复)
+@LastEditTime: 2026-10-19 13:48:02
 '''
-from typing import List
+from typing import Any, Dict, List, Tuple
 from loguru import logger
+from collections import defaultdict
 
 from langchain.chat_models import ChatOpenAI
 from langchain.agents import initialize_agent, AgentType
 from langchain.agents.tools import Tool
-from langchain.memory import ConversationSummaryMemory
 from tshub.utils.get_abs_path import get_abs_path
-from TSCAgent.callback_handler import create_file_callback
+from TSCAgent.callback_handler import create_file_callback, DeadlineCallback, DeadlineExceeded
+from TSCAgent.decision_memory import DecisionMemory, LLM_SOURCES
 from langchain.prompts import ChatPromptTemplate
 
 from TSCPrompt.llm_rl_prompt import (
@@ -28,14 +32,29 @@ class TSCAgent:
                  env,
                  llm:ChatOpenAI, 
                  tools:List[Tool],
-                 verbose:bool=True
+                 verbose:bool=True,
+                 deadline:float=None,
+                 token_budget:int=None,
+                 agent_message:str=AGENT_MESSAGE,
+                 memory_size:int=5,
+                 memory_tokens:int=300,
+                 metrics=None
                 ) -> None:
         self.env = env
         self.llm = llm # ChatGPT Model
+        self.agent_message = agent_message # tools 模式或者 snapshot 模式的 prompt
 
         # callback
         path_convert = get_abs_path(__file__)
         self.file_callback = create_file_callback(path_convert('../agent.log'))
+        self.deadline_callback = None # 每次决策的时间 (s) 和 token 预算
+        if (deadline is not None) or (token_budget is not None):
+            self.deadline_callback = DeadlineCallback(deadline=deadline, token_budget=token_budget)
+            if hasattr(self.llm, 'deadline_callback'): # PooledChatOpenAI, 每次请求的 timeout 为剩余的时间
+                self.llm.deadline_callback = self.deadline_callback
+        self.metrics = metrics # DecisionMetricsCallback, 动作解析之后调用 metrics.end_decision
+        self.num_runs = defaultdict(int) # 每个 episode 的决策次数
+        self.deadline_misses = [] # 每一次超过预算的记录
 
         self.tools = [] # agent 可以使用的 tools
         for ins in tools:
@@ -44,15 +63,12 @@ class TSCAgent:
                 Tool(name=func.name, description=func.description, func=func)
             )
         
-        self.memory = ConversationSummaryMemory(
-            llm=self.llm,
-        )
+        self.memory = DecisionMemory(max_decisions=memory_size, max_tokens=memory_tokens) # 不调用 LLM
         self.agent = initialize_agent(
             tools=self.tools, # 这里是所有可以使用的工具
             llm=self.llm,
             agent=AgentType.CHAT_ZERO_SHOT_REACT_DESCRIPTION,
             verbose=verbose,
-            memory=self.memory,
             agent_kwargs={
                 'system_message_prefix': SYSTEM_MESSAGE_PREFIX,
                 'syetem_message_suffix': SYSTEM_MESSAGE_SUFFIX,
@@ -64,20 +80,81 @@ class TSCAgent:
             early_stopping_method="generate",
         )
     
-    def agent_run(self, sim_step:float, last_step_action, last_step_explanation):
-        """Agent Run
+    def agent_run(self, sim_step:float, last_step_action, last_step_explanation, last_step_source:str='llm'):
+        """Agent Run, 超过预算时抛出 DeadlineExceeded
+        last_step_source 是上一次决策的来源 (llm, cache, partial, rl, max_occupancy, random)
         """
         logger.info(f"SIM: Decision at step {sim_step} is running:")
-        prompt_templete = ChatPromptTemplate.from_template(AGENT_MESSAGE)
+        if sim_step > 0:
+            self.memory.add(sim_step, last_step_action, last_step_explanation, source=last_step_source) # 上一次的决策执行到 sim_step
+        if last_step_source not in LLM_SOURCES: # 不是 LLM 的决策, 没有解释
+            last_step_explanation = f'none, it was made by the {last_step_source} controller'
+        prompt_templete = ChatPromptTemplate.from_template(self.agent_message)
         custom_message = prompt_templete.format_messages(
             sim_step=sim_step,
             last_step_action=last_step_action,
-            last_step_explanation=last_step_explanation
+            last_step_explanation=last_step_explanation,
+            decision_history=self.memory.render(skip_latest=True) # 上一次的决策已经在 prompt 中
         )
+        callbacks = [self.file_callback]
+        if self.deadline_callback is not None:
+            self.deadline_callback.reset()
+            callbacks.append(self.deadline_callback)
+        episode = getattr(self.env, 'episode', 0)
+        self.num_runs[episode] += 1
+        if self.metrics is not None:
+            self.metrics.start_decision(sim_step=sim_step, episode=episode)
+            callbacks.append(self.metrics)
         # 找出接近的场景, 动作和解释
-        llm_response = self.agent.run(
-            custom_message,
-            callbacks=[self.file_callback]
-        )
-        self.memory.clear()
-        return llm_response
\ No newline at end of file
+        try:
+            llm_response = self.agent.run(
+                custom_message,
+                callbacks=callbacks
+            )
+        except Exception as e:
+            deadline_error = e if isinstance(e, DeadlineExceeded) else None
+            if (deadline_error is None) and (self.deadline_callback is not None) and self.deadline_callback.deadline_passed():
+                deadline_error = self.deadline_callback.error(f'request failed ({type(e).__name__})') # 例如 request_timeout
+            if deadline_error is None:
+                raise
+            logger.warning(f'SIM: Decision at step {sim_step} is stopped, {deadline_error}')
+            self.deadline_misses.append({
+                'episode': episode, 'sim_step': sim_step, 'reason': deadline_error.reason,
+                'elapsed': deadline_error.elapsed, 'tokens': deadline_error.tokens, 'fallback': None
+            })
+            raise deadline_error from (None if deadline_error is e else e)
+        return llm_response
+
+    def fallback_decision(self, o_parse, partial_output:str) -> Tuple[int, str, str]:
+        """超过预算时的动作: 部分的回答 -> RL 的决策 -> 最大 occupancy 的相位, 返回 (phase_id, explanation, source)
+        """
+        agent_action = None
+        if partial_output and ('Final Answer' in partial_output or 'decision' in partial_output.lower()):
+            agent_action = o_parse.parse_local(partial_output) # 只解析已经给出决策的回答, 不解析中间的 Thought
+        if agent_action is not None:
+            phase_id, explanation, source = int(agent_action['phase_id']), agent_action['explanation'], 'partial'
+        else:
+            try:
+                phase_id, source = int(self.env.get_rl_decision()), 'rl'
+            except Exception as e:
+                logger.warning(f'SIM: RL decision is not available, {e}')
+                phase_id, source = self.env.get_max_occupancy_phase(), 'max_occupancy'
+            explanation = f'The decision is made by the {source} fallback since the LLM exceeded its budget.'
+        if len(self.deadline_misses) > 0:
+            self.deadline_misses[-1]['fallback'] = source
+        logger.info(f'SIM: Fallback ({source}), Phase {phase_id}.')
+        return phase_id, explanation, source
+
+    def deadline_summary(self) -> Dict[int, Dict[str, Any]]:
+        """每个 episode 超过预算的次数, 用于确定预算的大小
+        """
+        summary = {}
+        for episode, num_runs in self.num_runs.items():
+            misses = [miss for miss in self.deadline_misses if miss['episode'] == episode]
+            summary[episode] = {
+                'decisions': num_runs,
+                'misses': len(misses),
+                'miss_rate': len(misses) / num_runs,
+                'fallback': {source: sum(miss['fallback'] == source for miss in misses) for source in ('partial', 'rl', 'max_occupancy')},
+            }
+        return summary
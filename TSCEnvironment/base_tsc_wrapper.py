@@ -4,44 +4,18 @@
 @Description: The Wrapper for RL
 + state: 5 个时刻的每一个 movement 的 queue length
 + reward: 路口总的 waiting time
-@LastEditTime: 2024-01-05 20:41:34
+@LastEditTime: 2026-10-19 15:21:40
 '''
 import numpy as np
 import gymnasium as gym
 
-from pathlib import Path
 from gymnasium.core import Env
-from collections import deque
 from typing import Any, SupportsFloat, Tuple, Dict, List
 
-from TSCEnvironment.wrapper_utils import convert_state_to_static_information, find_index
+from TSCPrompt.compact_encoding import CompactEncoder
+from TSCEnvironment.wrapper_mixins import JunctionStateMixin, EnvStateMixin
 
-class OccupancyList:
-    def __init__(self) -> None:
-        self.elements = []
-
-    def add_element(self, element) -> None:
-        if isinstance(element, list):
-            if all(isinstance(e, float) for e in element):
-                self.elements.append(element)
-            else:
-                raise ValueError("列表中的元素必须是浮点数类型")
-        else:
-            raise TypeError("添加的元素必须是列表类型")
-
-    def clear_elements(self) -> None:
-        self.elements = []
-
-    def calculate_average(self) -> float:
-        """计算一段时间的平均 occupancy
-        """
-        arr = np.array(self.elements)
-        averages = np.mean(arr, axis=0, dtype=np.float32)/100
-        self.clear_elements() # 清空列表
-        return averages
-
-
-class BaseTSCEnvWrapper(gym.Wrapper):
+class BaseTSCEnvWrapper(JunctionStateMixin, EnvStateMixin, gym.Wrapper):
     """TSC Env Wrapper for single junction with tls_id for RL-based model
     """
     def __init__(
@@ -50,29 +24,14 @@ class BaseTSCEnvWrapper(gym.Wrapper):
             phase_num:int, 
             max_states:int=5,
             copy_files:List[str]=[],
+            copy_obs:bool=True,
+            prompt_encoding:str='full',
         ) -> None:
         super().__init__(env)
-        self.tls_id = tls_id # 单路口的 id
-        self.phase_num = phase_num
-        self.states = deque([self._get_initial_state()] * max_states, maxlen=max_states) # 队列
-        self.movement_ids = None
-        self.phase2movements = None
-        self.occupancy = OccupancyList()
-        self.episode = 0
-        self.copy_files = copy_files # 需要保留的文件
-
-    def _get_initial_state(self) -> List[int]:
-        # 返回初始状态，这里假设所有状态都为 0
-        return [0]*12
-    
-    def get_state(self):
-        """返回 np.array, 同时根据 mask 遮住部分 movement 的信息
-        """
-        not_working_index = find_index(self.movement_ids, self.not_work_element) # 无法工作的探测器的 index
-        tsc_state = np.array(self.states, dtype=np.float32)
-        if not_working_index is not None: # 当存在传感器损坏的时候
-            tsc_state[:,not_working_index] = -1
-        return tsc_state
+        self._init_junction_state(tls_id, phase_num, max_states, copy_obs=copy_obs) # 时间序列 + phase 信息
+        self._init_env_state(copy_files)
+        self.prompt_encoding = prompt_encoding # full 或者 compact, LLM 看到的环境描述的格式
+        self.prompt_encoder = CompactEncoder() if prompt_encoding == 'compact' else None
     
     @property
     def action_space(self):
@@ -80,11 +39,12 @@ class BaseTSCEnvWrapper(gym.Wrapper):
     
     @property
     def observation_space(self):
+        obs_shape = (self.obs_builder.max_states+2, 12) # (max_states,12) 是 occ, (2,12) 是 this phase 和 next phase -> (7, 12)
         obs_space = gym.spaces.Box(
-            low=np.zeros((7,12)), # (5,12) 是 occ, (2,12) 是 this phase 和 next phase -> (7, 12)
-            high=np.ones((7,12)),
-            shape=(7,12)
-        ) # self.states 是一个时间序列
+            low=np.zeros(obs_shape),
+            high=np.ones(obs_shape),
+            shape=obs_shape
+        ) # 前 max_states 行是 occupancy 的时间序列
         return obs_space
     
     # Wrapper
@@ -93,91 +53,38 @@ class BaseTSCEnvWrapper(gym.Wrapper):
         """
         occupancy = state['tls'][self.tls_id]['last_step_occupancy']
         can_perform_action = state['tls'][self.tls_id]['can_perform_action']
-        one_hot_this_phase = np.array([int(value) for value in state['tls'][self.tls_id]['this_phase']]) # 当前状态
-        one_hot_next_phase = np.array([int(value) for value in state['tls'][self.tls_id]['next_phase']]) # 下一个状态
+        one_hot_this_phase = state['tls'][self.tls_id]['this_phase'] # 当前状态, list of bool
+        one_hot_next_phase = state['tls'][self.tls_id]['next_phase'] # 下一个状态
         return occupancy, can_perform_action, one_hot_this_phase, one_hot_next_phase
     
-    def reward_wrapper(self, states) -> float:
-        """返回整个路口的排队长度的平均值
-        """
-        total_waiting_time = 0
-        for _, veh_info in states['vehicle'].items():
-            total_waiting_time += veh_info['waiting_time']
-        return -total_waiting_time
-    
     def info_wrapper(self, infos, occupancy):
         """在 info 中加入一些信息:
         1. 当前的仿真时间
         2. 每个 phase 的占有率
         3. 当前的 phase index
         """
-        movement_occ = {key: value for key, value in zip(self.movement_ids, occupancy)}
-        if self.not_work_element in movement_occ:
-            movement_occ[self.not_work_element] = -1 # 如果存在无法工作的传感器
-        phase_occ = {}
-        for phase_index, phase_movements in self.phase2movements.items():
-            phase_occ[phase_index] = sum([movement_occ[phase] for phase in phase_movements])
-        
-        infos['phase_occ'] = phase_occ
+        infos['phase_occ'] = self.calculate_phase_occ(occupancy)
         return infos
 
     def reset(self, seed=1) -> Tuple[Any, Dict[str, Any]]:
         """reset 时初始化 (1) 静态信息; (2) 动态信息
         """
-        # reset 之前进行文件的复制
-        if self.episode > 0:
-            for file_path in self.copy_files:
-                file = Path(file_path)
-                new_file = file.with_stem(f"{file.stem}_{self.episode}")
-                file.rename(new_file)
-
-        self.episode += 1
-        
-        # 环境的 reset
-        state =  self.env.reset()
-        self.current_tls_state = state['tls'][self.tls_id].copy() # 当前的状态
-        
-        # 初始化路口静态信息
-        self.llm_static_information = convert_state_to_static_information(state['tls'][self.tls_id]) # 路口的静态信息
-        self.movement_ids = state['tls'][self.tls_id]['movement_ids']
-        self.phase2movements = state['tls'][self.tls_id]['phase2movements']
-        self.current_avg_occ = [0]*12 # 初始化每一个 movement 的占有率
-
-        # For Detector State
-        self.ls_elements = [element for element in self.movement_ids if element.endswith('--l') or element.endswith('--s')]
-        self.mask = ['Work'] * len(self.ls_elements)
-        self.not_work_element = None # 初始化时候没有传感器是损坏的
-
-        # 处理路口动态信息
-        occupancy, _, one_hot_this_phase, one_hot_next_phase = self.state_wrapper(state=state)
-        self.states.append(occupancy)
-        state = self.get_state()
-        # 合并路口的 state, (5,12) + (2,12) -> (7,12)
-        state = np.vstack((state, one_hot_this_phase[np.newaxis, :], one_hot_next_phase[np.newaxis, :])).astype(np.float32)
+        self._reset_env_state() # reset 之前进行文件的复制
+        state =  self.env.reset() # 环境的 reset
+        state = self._reset_junction_state(state['tls'][self.tls_id])
         return state, {'step_time':0}
     
     def step(self, action: int) -> Tuple[Any, SupportsFloat, bool, bool, Dict[str, Any]]:
-        can_perform_action = False
-        while not can_perform_action:
-            action = {self.tls_id: action} # 构建单路口 action 的动作
-            states, rewards, truncated, dones, infos = super().step(action) # 与环境交互
-            self.current_tls_state = states['tls'][self.tls_id].copy() # 当前的状态
-            occupancy, can_perform_action, one_hot_this_phase, one_hot_next_phase = self.state_wrapper(state=states) # 处理每一帧的数据
-            # 记录每一时刻的数据
-            self.occupancy.add_element(occupancy)
-        
-        # 处理好的时序的 state
-        avg_occupancy = self.occupancy.calculate_average() # 计算平均占有率
-        self.current_avg_occ = avg_occupancy.copy()
+        action = {self.tls_id: action} # 构建单路口 action 的动作
+        # 在环境内部推进到下一个决策点, 每一秒的 occupancy 直接写入 self.occupancy
+        states, rewards, truncated, dones, infos = self.env.step_until_decision(action, occupancy=self.occupancy)
+        self.decision_step += 1
+        state = self._update_junction_state(states['tls'][self.tls_id]) # 平均占有率原地写入 current_avg_occ, 得到时序的 state
         rewards = self.reward_wrapper(states=states) # 计算 vehicle waiting time
         # Update info
         infos['this_phase_index'] = states['tls'][self.tls_id]['this_phase_index']
-        infos = self.info_wrapper(infos, occupancy=avg_occupancy) # info 里面包含每个 phase 的排队
-        
-        self.states.append(avg_occupancy) # 获得时间序列
-        state = self.get_state() # 得到 state, 需要根据 mask 进行处理
-        # 合并路口的 state, (5,12) + (2,12) -> (7,12)
-        state = np.vstack((state, one_hot_this_phase[np.newaxis, :], one_hot_next_phase[np.newaxis, :])).astype(np.float32)
+        infos['occupancy_samples'] = self.occupancy.last_window_samples # 这次决策窗口内的样本数
+        infos = self.info_wrapper(infos, occupancy=self.current_avg_occ) # info 里面包含每个 phase 的排队
         return state, rewards, truncated, dones, infos
     
     def close(self) -> None:
@@ -186,10 +93,13 @@ class BaseTSCEnvWrapper(gym.Wrapper):
     # ##############
     # Tools for LLM
     # ##############
-    def transform_occ_data(self) -> Dict[str, float]:
+    def transform_occ_data(self, occupancy=None) -> Dict[str, float]:
         """将 avg_occupancy 与每一个 movement id 对应起来
         Note: 这里和 mask 对应起来, 如果传感器损坏, 则对应的 movement 的占有率变为 -1
 
+        Args:
+            occupancy (optional): 每个 movement 的占有率, 默认是当前时刻的 current_avg_occ
+
         Returns:
             Dict[str, float]: 每一个 movement 的占有率, 如果损坏, 则是 -1
                 {
@@ -201,7 +111,8 @@ class BaseTSCEnvWrapper(gym.Wrapper):
         """
         output_dict = {} # 每个 movement 的占有率
         detector_work = self.get_detector_state() # 传感器的状态
-        for movement_id, value in zip(self.movement_ids, self.current_avg_occ):
+        occupancy = self.current_avg_occ if occupancy is None else occupancy
+        for movement_id, value in zip(self.movement_ids, occupancy):
             if 'r' in movement_id:
                 continue
             if detector_work.get(movement_id, 'Work') == 'Not Work':
@@ -240,7 +151,26 @@ class BaseTSCEnvWrapper(gym.Wrapper):
         """获得当前时刻的路口状态(每一个 movement 的占有率)
         """
         return self.transform_occ_data()
+
+    def get_previous_occupancy(self) -> Dict[str, float]:
+        """获得上一个决策时刻的路口状态
+        """
+        return self.transform_occ_data(self.previous_avg_occ)
+
+    def get_phase_occupancy(self, previous:bool=False) -> List[float]:
+        """每个 phase 的占有率, 顺序与 get_signal_phase_structure 相同
+        """
+        occupancy = self.previous_avg_occ if previous else self.current_avg_occ
+        return list(self.calculate_phase_occ(occupancy).values())
     
+    def get_max_occupancy_phase(self) -> int:
+        """SOTL 类型的规则, 选择 occupancy 最大的相位; 有探测器损坏时按顺序切换相位
+        """
+        if self.not_work_element:
+            return (self.current_tls_state['this_phase_index'] + 1) % self.phase_num
+        phase_occ = self.calculate_phase_occ(self.current_avg_occ)
+        return int(max(phase_occ, key=phase_occ.get))
+
     def get_rescue_movement_ids(self):
         """获得当前 Emergency Vehicle 在什么车道上
         """
@@ -282,17 +212,4 @@ class BaseTSCEnvWrapper(gym.Wrapper):
     # #################################
     # Custom Tools for Change Env State
     # ##################################
-    def set_edge_speed(self, edge_id:str, speed:float=3) -> None:
-        """设置 edge 速度, 模拟道路是否发生事故等
-        + 出现事故则车速降低
-        + 前一个路口排队溢出, 进入的车辆车速较低
-        """
-        _sumo = self.env.tsc_env.sumo
-        _sumo.edge.setMaxSpeed(edge_id, speed)
-    
-    def set_occ_missing(self, not_work_element:str=None) -> None:
-        """设置某个 movement 对应的传感器发生损坏, 生成一个 mask
-        """
-        # Generate the mask
-        self.mask = ['Not Work' if element == not_work_element else 'Work' for element in self.ls_elements]
-        self.not_work_element = not_work_element
\ No newline at end of file
+    # set_edge_speed 和 set_occ_missing 见 EnvStateMixin 和 JunctionStateMixin
@@ -2,14 +2,18 @@
 @Author: WANG Maonan
 @Date: 2024-01-06 15:56:19
 @Description: Env Wrapper for LLM RL
-@LastEditTime: 2024-01-06 16:31:39
++ RL 的动作由 PolicyService 计算, 同一个进程中模型只加载一次, 多个 wrapper 的请求合并成 batch
++ rl_backend='numpy' 时使用 NumPy 推理, 不需要 torch
++ rl_backend='numpy-stream'/'numpy-recurrent' 时每个 wrapper 保存 LSTM 的状态, 每次决策只处理最新的 occupancy
+@LastEditTime: 2026-10-18 22:24:03
 '''
-import torch
 from gymnasium.core import Env
-from stable_baselines3 import PPO
 from tshub.utils.get_abs_path import get_abs_path
 from typing import List, Tuple, Any, Dict, SupportsFloat
 from TSCEnvironment.base_tsc_wrapper import BaseTSCEnvWrapper
+from TSCRL.rl_utils.policy_service import get_policy_service
+
+STREAM_BACKENDS = {'numpy-stream': 'exact', 'numpy-recurrent': 'recurrent'} # rl_backend -> StreamingTSCPolicy 的 mode
 
 path_convert = get_abs_path(__file__)
 
@@ -18,22 +22,42 @@ class LLMRLTSCWrapper(BaseTSCEnvWrapper):
             self, 
             env: Env, 
             tls_id: str, phase_num: int, max_states: int = 5, 
-            copy_files: List[str] = []
+            copy_files: List[str] = [],
+            prompt_encoding: str = 'full',
+            policy: Any = None,
+            rl_backend: str = 'sb3'
         ) -> None:
-        super().__init__(env, tls_id, phase_num, max_states, copy_files)
-        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        """
+        Args:
+            policy (Any, optional): PolicyService 或 PolicyClient, None 时使用本进程共享的 PolicyService. Defaults to None.
+            rl_backend (str, optional): sb3, numpy, numpy-stream 或 numpy-recurrent, policy 为 None 时使用. Defaults to 'sb3'.
+        """
+        super().__init__(env, tls_id, phase_num, max_states, copy_files, prompt_encoding=prompt_encoding)
         model_path = path_convert(f'../TSCRL/result/{phase_num}way/choose_next_phase/models/last_rl_model.zip')
-        self.model = PPO.load(model_path, device=device) # 导入的模型
+        self.stream_policy = None
+        if rl_backend in STREAM_BACKENDS:
+            from TSCRL.rl_utils.streaming_policy import StreamingTSCPolicy
+            shared_policy = get_policy_service(model_path, backend='numpy').model # 共享权重, 每个 wrapper 自己的 LSTM 状态
+            self.stream_policy = StreamingTSCPolicy(shared_policy, mode=STREAM_BACKENDS[rl_backend])
+        elif policy is None:
+            device = 'cpu'
+            if rl_backend == 'sb3':
+                import torch
+                device = 'cuda' if torch.cuda.is_available() else 'cpu'
+            policy = get_policy_service(model_path, device=device, backend=rl_backend) # 相同的模型只导入一次
+        self.policy = policy
 
 
     def reset(self, seed=1) -> Tuple[Any, Dict[str, Any]]:
         state, info =  super().reset(seed)
-        self.rl_state = state.copy()
+        self.rl_state = state # BaseTSCEnvWrapper 返回的已经是复制后的数组
+        if self.stream_policy is not None:
+            self.stream_policy.reset()
         return state, info
     
     def step(self, action: int) -> Tuple[Any, SupportsFloat, bool, bool, Dict[str, Any]]:
         state, rewards, truncated, dones, infos = super().step(action)
-        self.rl_state = state.copy() # 用于 RL 算法
+        self.rl_state = state # 用于 RL 算法
         return state, rewards, truncated, dones, infos
     
     # #######################
@@ -42,5 +66,7 @@ class LLMRLTSCWrapper(BaseTSCEnvWrapper):
     def get_rl_decision(self):
         """获得基于强化学习的结果
         """
-        action, _ = self.model.predict(self.rl_state, deterministic=True)
-        return action
\ No newline at end of file
+        if self.stream_policy is not None:
+            action, _ = self.stream_policy.predict(self.rl_state) # 只处理最新的一帧
+            return action
+        return self.policy.predict(self.rl_state) # 与其他 wrapper 的请求合并成 batch
\ No newline at end of file
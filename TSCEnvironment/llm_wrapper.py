@@ -9,15 +9,24 @@
 4. 每个 movement 是否可以通行
 5. 每个 movement 对应的探测器是否可以正常工作
 6. 所有的可以执行的动作
-@LastEditTime: 2024-01-05 20:05:38
+- prompt_cache_key, prompt 输入的规范形式 (occupancy 量化), 用于缓存 LLM 的回答
+- prompt_encoding='compact' 时使用紧凑的编码, 并记录 prompt 的 token 数量
+- langchain 只在创建 LLMTSCEnvWrapper 时导入, FT 和 SOTL 直接使用 BaseTSCEnvWrapper
+@LastEditTime: 2026-10-18 22:51:37
 '''
+import json
 from gymnasium.core import Env
 from loguru import logger
 from typing import Any, Dict, List, SupportsFloat, Tuple
-from langchain.prompts import ChatPromptTemplate
-from langchain.output_parsers import ResponseSchema, StructuredOutputParser
 
-from TSCPrompt.llm_prompt import LLM_TSC_PROMPT
+from TSCPrompt.llm_prompt import LLM_TSC_PROMPT, LLM_TSC_PROMPT_COMPACT
+from TSCPrompt.compact_encoding import (
+    count_tokens,
+    encode_layout,
+    encode_phases,
+    encode_occupancy,
+    encode_situation
+)
 from TSCEnvironment.base_tsc_wrapper import BaseTSCEnvWrapper
 
 
@@ -26,9 +35,11 @@ class LLMTSCEnvWrapper(BaseTSCEnvWrapper):
             self, 
             env: Env, 
             tls_id: str, phase_num: int, max_states: int = 5, 
-            copy_files: List[str] = []
+            copy_files: List[str] = [],
+            prompt_encoding: str = 'full'
         ) -> None:
-        super().__init__(env, tls_id, phase_num, max_states, copy_files)
+        super().__init__(env, tls_id, phase_num, max_states, copy_files, prompt_encoding=prompt_encoding)
+        from langchain.output_parsers import ResponseSchema, StructuredOutputParser # 只在需要 LLM 的时候导入
         # Output 模板
         decision_schema = ResponseSchema(
             name="decision",
@@ -43,24 +54,69 @@ class LLMTSCEnvWrapper(BaseTSCEnvWrapper):
     def description_env(self) -> str:
         """Traffic Signal Control Prompt
         """
+        from langchain.prompts import ChatPromptTemplate
         format_instructions = self.output_parser.get_format_instructions() # 转换为提示词
 
         # Input 模板
-        prompt_templete = ChatPromptTemplate.from_template(LLM_TSC_PROMPT)
-        custom_message = prompt_templete.format_messages(
-            movement_info=self.get_intersection_layout(),
-            phase_info=self.get_signal_phase_structure(),
-            current_phase=self.get_current_phase(),
-            occ=self.get_current_occupancy(),
-            rescue_state=self.get_rescue_movement_ids(),
-            movement_access=self.get_movement_state(),
-            detector_work=self.get_detector_state(),
-            available_actions=self.get_available_actions(),
-            format_instructions=format_instructions
-        )
+        if self.prompt_encoding == 'compact':
+            prompt_templete = ChatPromptTemplate.from_template(LLM_TSC_PROMPT_COMPACT)
+            custom_message = prompt_templete.format_messages(
+                movement_info=encode_layout(self.get_intersection_layout()),
+                phase_info=encode_phases(self.get_signal_phase_structure()),
+                current_phase=self.get_current_phase(),
+                occ=encode_occupancy(self.get_current_occupancy()),
+                situation=encode_situation(
+                    self.get_rescue_movement_ids(), self.get_movement_state(), self.get_detector_state()
+                ),
+                available_actions=self.get_available_actions(),
+                format_instructions=format_instructions
+            )
+        else:
+            prompt_templete = ChatPromptTemplate.from_template(LLM_TSC_PROMPT)
+            custom_message = prompt_templete.format_messages(
+                movement_info=self.get_intersection_layout(),
+                phase_info=self.get_signal_phase_structure(),
+                current_phase=self.get_current_phase(),
+                occ=self.get_current_occupancy(),
+                rescue_state=self.get_rescue_movement_ids(),
+                movement_access=self.get_movement_state(),
+                detector_work=self.get_detector_state(),
+                available_actions=self.get_available_actions(),
+                format_instructions=format_instructions
+            )
 
+        self.prompt_tokens = count_tokens(custom_message[0].content) # 每个 prompt 的 token 数量
         logger.info(f'SIM: {custom_message[0].content}')
+        logger.info(f'SIM: Prompt ({self.prompt_encoding}) tokens, {self.prompt_tokens}.')
         return custom_message
+
+    def prompt_cache_key(self, occ_bin:float=5) -> str:
+        """description_env 输入的规范形式, 相同的 key 认为是相同的 prompt
+
+        Args:
+            occ_bin (float, optional): occupancy 量化的间隔 (百分比). Defaults to 5.
+        """
+        detector_work = self.get_detector_state()
+        quantized_occ = {} # 损坏的探测器为 -1, 与 transform_occ_data 相同
+        for movement_id, value in zip(self.movement_ids, self.current_avg_occ):
+            if 'r' in movement_id:
+                continue
+            if detector_work.get(movement_id, 'Work') == 'Not Work':
+                quantized_occ[movement_id] = -1
+            else:
+                quantized_occ[movement_id] = int(round(float(value)*100/occ_bin))
+        return json.dumps({
+            'tls_id': self.tls_id,
+            'prompt_encoding': self.prompt_encoding, # 不同的编码不共享回答
+            'movement_info': self.get_intersection_layout(),
+            'phase_info': self.get_signal_phase_structure(),
+            'current_phase': self.get_current_phase(),
+            'occ_bin': occ_bin,
+            'occ': quantized_occ,
+            'rescue_state': self.get_rescue_movement_ids(),
+            'movement_access': self.get_movement_state(),
+            'detector_work': detector_work,
+        }, sort_keys=True, default=str)
     
     def reset(self, seed=1) -> Tuple[Any, Dict[str, Any]]:
         state, info =  super().reset(seed)
@@ -0,0 +1,127 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 11:10:32
+@Description: The Wrapper for multi-junction RL, 所有路口共享同一次仿真的 step
++ state: (N,7,12), 每个路口 5 个时刻的每一个 movement 的 occupancy + this/next phase
++ action: (N,), 每个路口的动作
++ reward: 整个路网的 waiting time
+使用方法:
+-> env = TSCEnvironment(..., tls_ids=['J1', 'J2'])
+-> env = MultiTSCEnvWrapper(env, tls_ids=['J1', 'J2'], phase_num=4)
+@LastEditTime: 2026-10-19 15:28:53
+'''
+import numpy as np
+import gymnasium as gym
+
+from gymnasium.core import Env
+from typing import Any, SupportsFloat, Tuple, Dict, List
+
+from TSCEnvironment.wrapper_mixins import JunctionStateMixin, EnvStateMixin
+
+
+class JunctionWrapper(JunctionStateMixin):
+    """单个路口的 state 处理, 与 BaseTSCEnvWrapper 共用 JunctionStateMixin
+    observation 直接写入 MultiTSCEnvWrapper 的 batch buffer 中
+    """
+    def __init__(self, tls_id:str, phase_num:int, max_states:int, out:np.ndarray) -> None:
+        self._init_junction_state(tls_id, phase_num, max_states, copy_obs=False, out=out) # 原地写入 batch
+
+    def reset(self, tls_state) -> None:
+        """初始化路口的静态信息和动态信息
+        """
+        self._reset_junction_state(tls_state)
+
+    def finish_decision(self, tls_state) -> None:
+        """到达决策点, 计算平均占有率并更新 observation
+        """
+        self._update_junction_state(tls_state)
+
+    def get_phase_occ(self) -> Dict[int, float]:
+        """每个 phase 的占有率
+        """
+        return self.calculate_phase_occ(self.current_avg_occ)
+
+
+class MultiTSCEnvWrapper(EnvStateMixin, gym.Wrapper):
+    """TSC Env Wrapper for multiple junctions in one SUMO process, env 是使用 tls_ids 创建的 TSCEnvironment
+    + 每一次 step 推进仿真 (step_until_decision), 直到至少一个路口可以执行动作
+    + 不能执行动作的路口继续累积自己的 occupancy, observation 保持上一次决策时的值
+    + infos['can_perform_action'] 表示本次返回时哪些路口到达了决策点
+    """
+    def __init__(
+            self, env: Env,
+            tls_ids:List[str],
+            phase_num:int|List[int],
+            max_states:int=5,
+            copy_files:List[str]=[],
+        ) -> None:
+        super().__init__(env)
+        self.tls_ids = tls_ids
+        self.phase_nums = phase_num if isinstance(phase_num, list) else [phase_num]*len(tls_ids)
+        self.batch_obs = np.zeros((len(tls_ids), max_states+2, 12), dtype=np.float32) # (N,7,12)
+        self.junctions = {
+            tls_id: JunctionWrapper(tls_id, _phase_num, max_states, out=self.batch_obs[index])
+            for index, (tls_id, _phase_num) in enumerate(zip(tls_ids, self.phase_nums))
+        } # 每个路口的 wrapper, 共享同一次 step
+        self.occupancies = {tls_id: junction.occupancy for tls_id, junction in self.junctions.items()}
+        self._init_env_state(copy_files)
+
+    @property
+    def action_space(self):
+        return gym.spaces.MultiDiscrete(self.phase_nums)
+
+    @property
+    def observation_space(self):
+        obs_space = gym.spaces.Box(
+            low=np.zeros(self.batch_obs.shape),
+            high=np.ones(self.batch_obs.shape),
+            shape=self.batch_obs.shape
+        )
+        return obs_space
+
+    def reset(self, seed=1) -> Tuple[Any, Dict[str, Any]]:
+        self._reset_env_state() # reset 之前进行文件的复制
+        state = self.env.reset()
+        for tls_id, junction in self.junctions.items():
+            junction.reset(state['tls'][tls_id])
+        return self.batch_obs.copy(), {'step_time':0}
+
+    def step(self, actions) -> Tuple[Any, SupportsFloat, bool, bool, Dict[str, Any]]:
+        """actions 是长度为 N 的动作向量, 顺序与 tls_ids 相同
+        """
+        actions = {tls_id: int(_action) for tls_id, _action in zip(self.tls_ids, actions)}
+        states, rewards, truncated, dones, infos = self.env.step_until_decision(
+            actions, occupancy=self.occupancies
+        ) # 所有路口共享仿真, 每一秒的 occupancy 写入各自的 OccupancyList
+        self.decision_step += 1
+        can_perform_action = np.array([infos['can_perform_action'][tls_id] for tls_id in self.tls_ids], dtype=bool)
+        for tls_id, junction in self.junctions.items():
+            if infos['can_perform_action'][tls_id] or dones:
+                junction.finish_decision(states['tls'][tls_id]) # 只更新到达决策点的路口, 仿真结束时全部更新
+            else:
+                junction.current_tls_state = states['tls'][tls_id]
+
+        rewards = self.reward_wrapper(states=states)
+        infos['can_perform_action'] = can_perform_action
+        infos['this_phase_index'] = {
+            tls_id: junction.current_tls_state['this_phase_index'] for tls_id, junction in self.junctions.items()
+        }
+        infos['phase_occ'] = {
+            tls_id: junction.get_phase_occ() for tls_id, junction in self.junctions.items()
+        }
+        return self.batch_obs.copy(), rewards, truncated, dones, infos
+
+    def close(self) -> None:
+        return super().close()
+
+    # #################################
+    # Custom Tools for Change Env State
+    # ##################################
+    # set_edge_speed 见 EnvStateMixin, 与 BaseTSCEnvWrapper 相同
+    def set_occ_missing(self, tls_id:str, not_work_element:str=None) -> None:
+        """设置某个路口的某个 movement 对应的传感器发生损坏
+        """
+        junction = self.junctions[tls_id]
+        if not_work_element != junction.not_work_element:
+            self.state_version += 1
+        junction.set_occ_missing(not_work_element)
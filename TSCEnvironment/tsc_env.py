@@ -2,11 +2,13 @@
 @Author: WANG Maonan
 @Date: 2023-09-04 20:43:53
 @Description: 信号灯控制环境
-@LastEditTime: 2023-11-25 15:17:53
++ tls_id, 单路口
++ tls_ids, 多个路口共用一个 SUMO 进程 (MultiTSCEnvWrapper)
+@LastEditTime: 2026-10-19 12:58:40
 '''
 import gymnasium as gym
 
-from typing import Dict
+from typing import Dict, List
 from tshub.tshub_env.tshub_env import TshubEnvironment
 
 class TSCEnvironment(gym.Env):
@@ -15,13 +17,18 @@ class TSCEnvironment(gym.Env):
                  net_file:str,
                  trip_info: str, 
                  num_seconds:int, 
-                 tls_id:str, 
-                 tls_action_type:str, 
-                 use_gui:bool=False
+                 tls_id:str=None, 
+                 tls_action_type:str='choose_next_phase', 
+                 use_gui:bool=False,
+                 tls_ids:List[str]=None,
         ) -> None:
+        """tls_id 和 tls_ids 只能指定一个
+        """
         super().__init__()
+        assert (tls_id is None) != (tls_ids is None), '需要指定 tls_id 或者 tls_ids 中的一个'
 
-        self.tls_id = tls_id
+        self.tls_ids = [tls_id] if tls_ids is None else list(tls_ids)
+        self.tls_id = self.tls_ids[0] if len(self.tls_ids) == 1 else None # 单路口的 id
 
         self.tsc_env = TshubEnvironment(
             sumo_cfg=sumo_cfg,
@@ -32,7 +39,7 @@ class TSCEnvironment(gym.Env):
             is_traffic_light_builder_initialized=True,
             is_person_builder_initialized=False,
             trip_info=trip_info, # 记录仿真中所有 object 的指标
-            tls_ids=[tls_id], 
+            tls_ids=self.tls_ids, 
             num_seconds=num_seconds,
             tls_action_type=tls_action_type,
             use_gui=use_gui
@@ -48,6 +55,43 @@ class TSCEnvironment(gym.Env):
         truncated = dones
 
         return states, rewards, truncated, dones, infos
+
+    def step_until_decision(self, action: Dict[str, int], occupancy=None):
+        """一直推进仿真直到信号灯可以执行下一个动作, 只返回决策点的 state
+        + 中间的每一秒不经过 wrapper, 只累计 occupancy 与 waiting time
+        + occupancy 是 OccupancyList, 每一秒的 occupancy 会写入其中
+        + 多路口时 occupancy 为 {tls_id: OccupancyList}, 任意一个路口可以执行动作时返回
+
+        Returns:
+            与 step 相同, infos 中额外包含:
+            - sim_steps: 这次推进的仿真秒数
+            - accumulated_waiting_time: 每一秒所有车辆 waiting time 的累加
+            - can_perform_action: 每个路口是否到达决策点, {tls_id: bool}
+        """
+        action = {'tls': action}
+        occupancies = occupancy if isinstance(occupancy, dict) else dict.fromkeys(self.tls_ids, occupancy)
+        sim_steps = 0
+        accumulated_waiting_time = 0
+        can_perform_action = dict.fromkeys(self.tls_ids, False)
+        while not any(can_perform_action.values()):
+            states, rewards, infos, dones = self.tsc_env.step(action)
+            for tls_id in self.tls_ids:
+                tls_state = states['tls'][tls_id]
+                tls_occupancy = occupancies.get(tls_id)
+                if tls_occupancy is not None:
+                    tls_occupancy.add_element(tls_state['last_step_occupancy'])
+                can_perform_action[tls_id] = tls_state['can_perform_action']
+            for veh_info in states['vehicle'].values():
+                accumulated_waiting_time += veh_info['waiting_time']
+            sim_steps += 1
+            if dones: # 仿真结束
+                break
+        
+        infos['can_perform_action'] = can_perform_action
+        infos['sim_steps'] = sim_steps
+        infos['accumulated_waiting_time'] = accumulated_waiting_time
+        truncated = dones
+        return states, rewards, truncated, dones, infos
     
     def close(self) -> None:
         self.tsc_env._close_simulation()
\ No newline at end of file
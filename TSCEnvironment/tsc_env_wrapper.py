@@ -11,10 +11,11 @@
     - （c）作出某个动作后, phase 对应排队长度的变化的预测（这里预测可以直接使用 MCT 来进行预测，或者服从某个分布，这里需要做一个预测）
     - （d）比较前后两次 phase 之间的排队的增加
     - （e）分析路口的性能（就是根据 c 的结果做进一步的计算）
-@LastEditTime: 2024-01-06 15:56:59
+@LastEditTime: 2026-10-19 12:21:44
 '''
 import os
 import sqlite3
+import numpy as np
 import gymnasium as gym
 from gymnasium.core import Env
 from typing import Any, SupportsFloat, Tuple, Dict, List
@@ -25,6 +26,12 @@ from TSCEnvironment.wrapper_utils import (
     predict_queue_length, 
     OccupancyList
 )
+from utils.junction_database import (
+    DecisionLogWriter, 
+    JUNCTION_STATIC_INSERT, 
+    static_row, 
+    decision_row
+)
 
 
 class TSCEnvWrapper(gym.Wrapper):
@@ -32,26 +39,11 @@ class TSCEnvWrapper(gym.Wrapper):
         super().__init__(env)
         # Init database
         self.database = database # 数据库路径
-        if os.path.exists(self.database):
-            os.remove(self.database)
+        for _file in [self.database, f'{self.database}-wal', f'{self.database}-shm']:
+            if os.path.exists(_file): # 包括 WAL 模式的临时文件
+                os.remove(_file)
         
-        connection, cursor = self.connect_sql()
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS junctionINFO(
-                junction_id TEXT,
-                frame REAL,
-                intersection_layout TEXT,
-                phase_structure TEXT,
-                emergency_vehicle TEXT,
-                current_occupancy TEXT, 
-                previous_occupancy TEXT,
-                thoughtsAndActions TEXT,
-                action INTEGER,
-                PRIMARY KEY (junction_id, frame));"""
-        )
-        connection.commit()
-        connection.close()
+        self.writer = DecisionLogWriter(self.database) # 后台批量写入 decision_log
             
         # Static Information
         self.movement_ids = None
@@ -61,8 +53,12 @@ class TSCEnvWrapper(gym.Wrapper):
         # Dynamic Information
         self.state = None
         self.last_state = None
+        self.occ_index = None # transform_occ_data 中保留的 movement 的 index
+        self.occ_vector = None # 与 self.state 相同, 数值形式 (0-1), 用于写入数据库
+        self.last_occ_vector = None
         self.rescue_movement = None
         self.occupancy = OccupancyList()
+        self.avg_occupancy = None # calculate_average 的结果, 第一次决策时分配, 之后原地写入
     
     def connect_sql(self):
         connection = sqlite3.connect(self.database)
@@ -103,15 +99,24 @@ class TSCEnvWrapper(gym.Wrapper):
         return occupancy, last_step_vehicle_id_list
 
     def reset(self) -> Tuple[Any, Dict[str, Any]]:
-        state =  self.env.reset()
+        state =  self.env.reset()['tls'][self.env.tls_id] # 单路口的 state
         # Initialize static information
         self.phase_num = len(state['phase2movements'])
         self.movement_ids = state['movement_ids']
         self.llm_static_information = convert_state_to_static_information(state)
+        self.occ_index = [index for index, movement_id in enumerate(self.movement_ids) if 'r' not in movement_id]
+        self.writer.write(
+            static_row(
+                self.env.tls_id, [self.movement_ids[index] for index in self.occ_index],
+                self.llm_static_information["movement_infos"], self.llm_static_information["phase_infos"]
+            ), insert_sql=JUNCTION_STATIC_INSERT
+        ) # 路口的静态信息只保存一次
 
         # Dynamic junction information
         occupancy, last_step_vehicle_id_list = self.state_wrapper(state=state)
         self.state = self.transform_occ_data(occupancy)
+        self.occ_vector = np.asarray(occupancy, dtype=np.float32)[self.occ_index]
+        self.last_occ_vector = None
         self.rescue_movement = self.get_rescue_movement_ids(last_step_vehicle_id_list)
         return self.state
     
@@ -119,16 +124,18 @@ class TSCEnvWrapper(gym.Wrapper):
     def step(self, action: Any, explanation:str="") -> Tuple[Any, SupportsFloat, bool, bool, Dict[str, Any]]:
         """更新路口的 state
         """
-        can_perform_action = False
-        while not can_perform_action:
-            states, rewards, truncated, dones, infos = super().step(action) # 与环境交互
-            occupancy, last_step_vehicle_id_list = self.state_wrapper(state=states) # 处理每一帧的数据
-            self.occupancy.add_element(occupancy)
-            can_perform_action = states['can_perform_action']
-
-        avg_occupancy = self.occupancy.calculate_average() # 计算平均的 average occupancy
+        # 在环境内部推进到下一个决策点, 每一秒的 occupancy 直接写入 self.occupancy
+        states, rewards, truncated, dones, infos = self.env.step_until_decision(
+            {self.env.tls_id: action}, occupancy=self.occupancy
+        )
+        _, last_step_vehicle_id_list = self.state_wrapper(state=states['tls'][self.env.tls_id])
+
+        self.avg_occupancy = self.occupancy.calculate_average(out=self.avg_occupancy) # 计算平均的 average occupancy, 原地写入
+        avg_occupancy = self.avg_occupancy
         self.last_state = self.state
         self.state = self.transform_occ_data(avg_occupancy) # 计算每一个 phase 的 occupancy
+        self.last_occ_vector = self.occ_vector
+        self.occ_vector = avg_occupancy[self.occ_index]
         self.rescue_movement = self.get_rescue_movement_ids(last_step_vehicle_id_list)
 
         self.data_commit(action=action, explanation=explanation) # 更新数据库
@@ -136,28 +143,22 @@ class TSCEnvWrapper(gym.Wrapper):
         return self.state, dones, infos
     
     def close(self) -> None:
+        self.writer.close() # 写入剩余的数据
         return super().close()
     
     def data_commit(self, action, explanation) -> None:
-        connection, cursor = self.connect_sql()
-        # get junction info, (1) statistic, (2) dynamic, (3) action
+        # get junction info, (1) dynamic, (2) action. 静态信息在 reset 时已经写入 junction_static
         junction_id = self.env.tls_id
         frame = self.env.tsc_env.sim_step
-        intersection_layout = self.llm_static_information["movement_infos"]
-        phase_structure = self.llm_static_information["phase_infos"]
-        emergency_vehicle = self.rescue_movement
-        current_occupancy = self.state
-        previous_occupancy = self.last_state
-        
-        cursor.execute(
-            "INSERT INTO junctionINFO VALUES (?,?,?,?,?,?,?,?,?)",
-            (junction_id, frame, 
-             str(intersection_layout), str(phase_structure),
-             str(emergency_vehicle), str(current_occupancy), str(previous_occupancy),
-             explanation, action)
+        self.writer.write(
+            decision_row(
+                junction_id, frame, 
+                emergency_movements=self.rescue_movement,
+                current_occupancy=self.occ_vector, 
+                previous_occupancy=self.last_occ_vector,
+                explanation=explanation, action=action
+            )
         )
-        connection.commit()
-        connection.close()
 
     # ###########################
     # Custom Tools for TSC Agent
@@ -0,0 +1,146 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-19 15:10:26
+@Description: BaseTSCEnvWrapper 和 MultiTSCEnvWrapper 共用的处理
++ JunctionStateMixin, 单个路口的静态信息, 探测器 mask, 决策窗口内的 occupancy 和 observation
++ EnvStateMixin, episode 的文件复制, reward, 修改仿真环境 (set_edge_speed) 和 state_version
+@LastEditTime: 2026-10-19 15:10:26
+'''
+import numpy as np
+
+from pathlib import Path
+from typing import Dict, List
+
+from TSCEnvironment.wrapper_utils import (
+    convert_state_to_static_information,
+    find_index,
+    get_ls_elements,
+    detector_mask,
+    calculate_phase_occ,
+    OccupancyList,
+    ObservationBuilder
+)
+
+
+class JunctionStateMixin:
+    """单个路口的 state 处理, 需要先调用 _init_junction_state
+    """
+    def _init_junction_state(self, tls_id:str, phase_num:int, max_states:int, copy_obs:bool=True, out:np.ndarray=None) -> None:
+        """
+        Args:
+            copy_obs (bool, optional): False 时返回内部 buffer 的 view, 下一次 step 会被覆盖. Defaults to True.
+            out (np.ndarray, optional): observation 写入的外部 buffer, 例如多路口 batch 中的一个 view. Defaults to None.
+        """
+        self.tls_id = tls_id # 单路口的 id
+        self.phase_num = phase_num
+        self.obs_builder = ObservationBuilder(max_states=max_states, num_movements=12, out=out) # 时间序列 + phase 信息
+        self.copy_obs = copy_obs
+        self.movement_ids = None
+        self.phase2movements = None
+        self.occupancy = OccupancyList(num_movements=12)
+        self.current_avg_occ = np.zeros(12, dtype=np.float32) # 每一个 movement 的平均占有率
+        self.previous_avg_occ = np.zeros(12, dtype=np.float32) # 上一个决策时刻的平均占有率
+        self.current_tls_state = None
+        self.not_work_element = None
+        self.state_version = 0 # set_edge_speed/set_occ_missing 修改环境时增加, 用于 tool 缓存失效
+
+    def _reset_junction_state(self, tls_state) -> np.ndarray:
+        """reset 时初始化路口的 (1) 静态信息; (2) 动态信息, 返回初始的 observation
+        """
+        self.current_tls_state = tls_state # 当前的状态, 每一步都是新的 dict, 不需要复制
+
+        # 初始化路口静态信息
+        self.llm_static_information = convert_state_to_static_information(tls_state) # 路口的静态信息
+        self.movement_ids = tls_state['movement_ids']
+        self.phase2movements = tls_state['phase2movements']
+        self.current_avg_occ[:] = 0 # 初始化每一个 movement 的占有率
+        self.previous_avg_occ[:] = 0
+
+        # For Detector State
+        self.ls_elements = get_ls_elements(self.movement_ids)
+        self.mask = detector_mask(self.ls_elements)
+        self.not_work_element = None # 初始化时候没有传感器是损坏的
+
+        # 处理路口动态信息
+        self.occupancy.clear_elements() # 丢弃上一个 episode 没有结束的窗口
+        self.obs_builder.reset()
+        self.obs_builder.push_occupancy(tls_state['last_step_occupancy'])
+        return self.get_state(tls_state['this_phase'], tls_state['next_phase'])
+
+    def _update_junction_state(self, tls_state) -> np.ndarray:
+        """到达决策点, 计算决策窗口内的平均占有率 (原地写入 current_avg_occ) 并更新 observation
+        """
+        self.current_tls_state = tls_state
+        self.previous_avg_occ[:] = self.current_avg_occ
+        self.occupancy.calculate_average(out=self.current_avg_occ)
+        self.obs_builder.push_occupancy(self.current_avg_occ) # 获得时间序列
+        return self.get_state(tls_state['this_phase'], tls_state['next_phase']) # 需要根据 mask 进行处理
+
+    def get_state(self, this_phase, next_phase):
+        """返回 np.array, 同时根据 mask 遮住部分 movement 的信息
+        合并路口的 state, (max_states,12) + (2,12) -> (max_states+2,12)
+        """
+        not_working_index = find_index(self.movement_ids, self.not_work_element) # 无法工作的探测器的 index
+        return self.obs_builder.build(
+            this_phase, next_phase,
+            mask_index=not_working_index, copy=self.copy_obs
+        )
+
+    def calculate_phase_occ(self, occupancy) -> Dict[int, float]:
+        """每个 phase 的占有率 (phase 中所有 movement 的占有率之和), 损坏的传感器占有率为 -1
+        """
+        return calculate_phase_occ(self.movement_ids, self.phase2movements, occupancy, self.not_work_element)
+
+    def set_occ_missing(self, not_work_element:str=None) -> None:
+        """设置某个 movement 对应的传感器发生损坏, 生成一个 mask
+        """
+        if not_work_element != self.not_work_element:
+            self.state_version += 1
+        # Generate the mask
+        self.mask = detector_mask(self.ls_elements, not_work_element)
+        self.not_work_element = not_work_element
+
+
+class EnvStateMixin:
+    """整个仿真环境的处理, 需要先调用 _init_env_state, self.env 是 TSCEnvironment
+    """
+    def _init_env_state(self, copy_files:List[str]) -> None:
+        self.episode = 0
+        self.decision_step = 0 # 当前 episode 中的决策次数
+        self.state_version = 0 # set_edge_speed/set_occ_missing 修改环境时增加, 用于 tool 缓存失效
+        self.edge_speeds = {} # 通过 set_edge_speed 设置过的速度
+        self.copy_files = copy_files # 需要保留的文件
+
+    def _reset_env_state(self) -> None:
+        """reset 之前进行文件的复制, 并开始新的 episode
+        """
+        if self.episode > 0:
+            for file_path in self.copy_files:
+                file = Path(file_path)
+                new_file = file.with_stem(f"{file.stem}_{self.episode}")
+                file.rename(new_file)
+
+        self.episode += 1
+        self.decision_step = 0
+        self.state_version += 1
+        self.edge_speeds = {}
+
+    def reward_wrapper(self, states) -> float:
+        """返回整个路网的 waiting time
+        """
+        total_waiting_time = 0
+        for _, veh_info in states['vehicle'].items():
+            total_waiting_time += veh_info['waiting_time']
+        return -total_waiting_time
+
+    def set_edge_speed(self, edge_id:str, speed:float=3) -> None:
+        """设置 edge 速度, 模拟道路是否发生事故等
+        + 出现事故则车速降低
+        + 前一个路口排队溢出, 进入的车辆车速较低
+        """
+        if self.edge_speeds.get(edge_id) == speed:
+            return # 速度没有变化, 不需要重复设置
+        _sumo = self.env.tsc_env.sumo
+        _sumo.edge.setMaxSpeed(edge_id, speed)
+        self.edge_speeds[edge_id] = speed
+        self.state_version += 1
@@ -2,35 +2,159 @@
 @Author: WANG Maonan
 @Date: 2023-09-05 15:26:11
 @Description: 处理 State 的特征
-@LastEditTime: 2023-12-02 17:35:36
+@LastEditTime: 2026-10-19 12:21:44
 '''
 import numpy as np
 from typing import List, Dict, Any
 from tshub.utils.nested_dict_conversion import create_nested_defaultdict, defaultdict2dict
 
 class OccupancyList:
-    def __init__(self) -> None:
-        self.elements = []
+    """决策窗口内每一秒 occupancy 的聚合器 (预分配的缓冲区)
+    + add_element 为 O(1), 只写入预分配的 buffer, 不产生新的对象
+    + 窗口结束时一次性向量化计算 mean/ewma/max
+    + 窗口超过 capacity 时 buffer 扩大为两倍 (不丢弃数据), 之后的窗口继续使用扩大后的 buffer
+    """
+    def __init__(self, num_movements:int=None, capacity:int=60, ewma_alpha:float=0.3) -> None:
+        self.capacity = capacity
+        self.ewma_alpha = ewma_alpha
+        self.num_movements = num_movements
+        self.buffer = None # (capacity, num_movements), 第一次 add 时分配
+        self.size = 0 # 当前窗口内的样本数量, 按时间顺序保存在 buffer[:size]
+        self.last_window_samples = 0 # 上一个窗口的样本数量
+        self._init_ewma_weights()
+        if num_movements is not None:
+            self._allocate(num_movements)
+
+    def _init_ewma_weights(self) -> None:
+        """EWMA 权重, 按时间顺序排列, 最后一个是最新的样本
+        """
+        self.ewma_weights = (self.ewma_alpha * (1-self.ewma_alpha)**np.arange(self.capacity-1, -1, -1)).astype(np.float32)
+
+    def _allocate(self, num_movements:int) -> None:
+        self.num_movements = num_movements
+        self.buffer = np.zeros((self.capacity, num_movements), dtype=np.float32)
+
+    def _grow(self) -> None:
+        """窗口比 capacity 长 (例如决策间隔很长), 扩大 buffer, 只在第一次遇到更长的窗口时分配
+        """
+        buffer = np.zeros((self.capacity*2, self.num_movements), dtype=np.float32)
+        buffer[:self.size] = self.buffer[:self.size]
+        self.buffer = buffer
+        self.capacity *= 2
+        self._init_ewma_weights()
 
     def add_element(self, element) -> None:
-        if isinstance(element, list):
-            if all(isinstance(e, float) for e in element):
-                self.elements.append(element)
-            else:
-                raise ValueError("列表中的元素必须是浮点数类型")
-        else:
+        if not isinstance(element, (list, tuple, np.ndarray)):
             raise TypeError("添加的元素必须是列表类型")
+        if self.buffer is None:
+            self._allocate(len(element))
+        if self.size == self.capacity:
+            self._grow()
+        self.buffer[self.size] = element # 直接写入 buffer, 类型检查由 numpy 完成
+        self.size += 1
 
     def clear_elements(self) -> None:
-        self.elements = []
+        self.last_window_samples = self.size
+        self.size = 0
+
+    def _prepare_out(self, out):
+        if out is None:
+            out = np.zeros(self.num_movements, dtype=np.float32)
+        return out
 
-    def calculate_average(self) -> float:
-        """计算一段时间的平均 occupancy
+    def calculate_average(self, out:np.ndarray=None) -> np.ndarray:
+        """计算一段时间的平均 occupancy (0-1 之间), 并清空窗口
+
+        Args:
+            out (np.ndarray, optional): 结果写入的数组, 传入时不会分配新的内存. Defaults to None.
         """
-        arr = np.array(self.elements)
-        averages = np.mean(arr, axis=0, dtype=np.float32)/100
-        self.clear_elements() # 清空列表
-        return averages
+        out = self._prepare_out(out)
+        if self.size == 0:
+            out[:] = 0
+        else:
+            np.sum(self.buffer[:self.size], axis=0, out=out)
+            out *= 1 / (100 * self.size)
+        self.clear_elements() # 清空窗口
+        return out
+
+    def calculate_max(self, out:np.ndarray=None, clear:bool=False) -> np.ndarray:
+        """窗口内每个 movement 的最大 occupancy (0-1 之间)
+        """
+        out = self._prepare_out(out)
+        if self.size == 0:
+            out[:] = 0
+        else:
+            np.max(self.buffer[:self.size], axis=0, out=out)
+            out *= 1 / 100
+        if clear:
+            self.clear_elements()
+        return out
+
+    def calculate_ewma(self, out:np.ndarray=None, clear:bool=False) -> np.ndarray:
+        """窗口内的指数加权平均 (越新的样本权重越大, 权重归一化), 结果在 0-1 之间
+        """
+        out = self._prepare_out(out)
+        if self.size == 0:
+            out[:] = 0
+        else:
+            weights = self.ewma_weights[self.capacity-self.size:] # 按时间顺序对齐
+            np.matmul(weights, self.buffer[:self.size], out=out)
+            out *= 1 / (100 * weights.sum())
+        if clear:
+            self.clear_elements()
+        return out
+
+class ObservationBuilder:
+    """在预分配的 (max_states+2, num_movements) buffer 中原地组装 observation
+    + 前 max_states 行是 occupancy 的时间序列 (最新的在最后一行)
+    + 最后两行是 this phase 和 next phase 的 one-hot
+    occupancy 的历史使用环形缓冲区保存, 每一步只写入一行, 不再重新构造数组
+    """
+    def __init__(self, max_states:int=5, num_movements:int=12, out:np.ndarray=None) -> None:
+        """
+        Args:
+            out (np.ndarray, optional): 外部的 (max_states+2, num_movements) buffer, 例如多路口 batch 中的一个 view. Defaults to None.
+        """
+        self.max_states = max_states
+        self.history = np.zeros((max_states, num_movements), dtype=np.float32) # 未 mask 的原始数据
+        if out is None:
+            out = np.zeros((max_states+2, num_movements), dtype=np.float32)
+        assert out.shape == (max_states+2, num_movements), f'out 的大小需要是 {(max_states+2, num_movements)}'
+        self.obs = out
+        self.head = 0 # 最早的一行在 history 中的位置
+
+    def reset(self) -> None:
+        self.history[:] = 0
+        self.head = 0
+
+    def push_occupancy(self, occupancy) -> None:
+        """加入最新时刻的 occupancy, 覆盖最早的一行
+        """
+        self.history[self.head] = occupancy
+        self.head = (self.head + 1) % self.max_states
+
+    @property
+    def latest_occupancy(self) -> np.ndarray:
+        return self.history[self.head-1] # head=0 时为 -1, 即最后一行
+
+    def build(self, this_phase, next_phase, mask_index:int=None, copy:bool=True) -> np.ndarray:
+        """按时间顺序写入 occupancy, 对损坏的探测器进行 mask, 并写入 phase 的 one-hot
+
+        Args:
+            this_phase: 当前相位的 one-hot (list of bool/int)
+            next_phase: 下一个相位的 one-hot
+            mask_index (int, optional): 损坏的探测器对应的 movement index. Defaults to None.
+            copy (bool, optional): 为 False 时直接返回内部 buffer 的 view, 下一次 build 时会被覆盖. Defaults to True.
+        """
+        split = self.max_states - self.head
+        self.obs[:split] = self.history[self.head:]
+        self.obs[split:self.max_states] = self.history[:self.head]
+        if mask_index is not None: # 当存在传感器损坏的时候
+            self.obs[:self.max_states, mask_index] = -1
+        self.obs[-2] = this_phase
+        self.obs[-1] = next_phase
+        return self.obs.copy() if copy else self.obs
+
 
 def find_index(lst, element):
     try:
@@ -39,6 +163,30 @@ def find_index(lst, element):
         return None
 
 
+def get_ls_elements(movement_ids:List[str]) -> List[str]:
+    """有探测器的 movement (直行和左转)
+    """
+    return [element for element in movement_ids if element.endswith('--l') or element.endswith('--s')]
+
+
+def detector_mask(ls_elements:List[str], not_work_element:str=None) -> List[str]:
+    """每个探测器的状态, 'Work' 或者 'Not Work'
+    """
+    return ['Not Work' if element == not_work_element else 'Work' for element in ls_elements]
+
+
+def calculate_phase_occ(movement_ids:List[str], phase2movements:Dict[str, List[str]], occupancy, not_work_element:str=None) -> Dict[int, float]:
+    """每个 phase 的占有率 (phase 中所有 movement 的占有率之和), 损坏的传感器占有率为 -1
+    """
+    movement_occ = {key: value for key, value in zip(movement_ids, occupancy)}
+    if not_work_element in movement_occ:
+        movement_occ[not_work_element] = -1 # 如果存在无法工作的传感器
+    phase_occ = {}
+    for phase_index, phase_movements in phase2movements.items():
+        phase_occ[phase_index] = sum([movement_occ[phase] for phase in phase_movements])
+    return phase_occ
+
+
 def calculate_queue_lengths(movement_ids:List[str], jam_length_meters:List[float], phase2movements:Dict[str, List[str]]) -> Dict[str, Dict[str, float]]:
     """计算每个相位的平均和最大排队长度
 
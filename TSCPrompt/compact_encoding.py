@@ -0,0 +1,99 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 20:40:05
+@Description: 紧凑的 prompt 编码, 减少输入的 token
++ occupancy 保留整数百分比, movement id 使用短的 key (E2--s -> E2s)
++ phase -> movement 使用表格, 每个 phase 一行
++ 同一次决策中重复的静态信息 (路口结构, 信号灯结构) 只输出一次
++ count_tokens, 估计 prompt 的 token 数量 (第一次调用时才导入 tiktoken)
+@LastEditTime: 2026-10-19 14:20:11
+'''
+from functools import lru_cache
+from typing import Any, Dict, Hashable, List
+
+DIRECTION_CODES = {'Left Turn': 'l', 'Through': 's', 'Right Turn': 'r'} # 与 short_id 中的方向相同, 都是小写
+
+
+@lru_cache(maxsize=None)
+def _get_encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding('cl100k_base')
+    except Exception: # 没有 tiktoken 时使用字符数估计
+        return None
+
+
+def count_tokens(text:str) -> int:
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4 # 英文大约 4 个字符一个 token
+
+
+def short_id(movement_id:str) -> str:
+    """E2--s -> E2s, E2_l -> E2l
+    """
+    for separator in ('--', '_'):
+        if separator in movement_id:
+            edge_id, direction = movement_id.rsplit(separator, 1)
+            return f'{edge_id}{direction}'
+    return movement_id
+
+
+def encode_layout(movement_infos:Dict[str, Dict[str, Any]]) -> str:
+    """路口结构, 例如 E2s:s2 E2l:l1 (s 直行, l 左转, 数字是车道数)
+    """
+    movements = [
+        f'{short_id(movement_id)}:{DIRECTION_CODES.get(info["direction"], info["direction"])}{info["number_of_lanes"]}'
+        for movement_id, info in movement_infos.items()
+    ]
+    return ' '.join(movements)
+
+
+def encode_phases(phase_infos:Dict[str, Dict[str, List[str]]]) -> str:
+    """信号灯结构, 每个 phase 一行, 例如 Phase-0| E2s E1s
+    """
+    rows = []
+    for phase_key, phase_info in phase_infos.items():
+        phase_index = str(phase_key).split()[-1]
+        rows.append(f'Phase-{phase_index}| ' + ' '.join(short_id(movement_id) for movement_id in phase_info['movements']))
+    return '\n'.join(rows)
+
+
+def encode_occupancy(occupancy:Dict[str, Any]) -> str:
+    """每个 movement 的占有率 (整数百分比), 损坏的探测器为 -1, 例如 E2s:36 E1s:-1
+    """
+    values = []
+    for movement_id, value in occupancy.items():
+        value = float(str(value).rstrip('%'))
+        values.append(f'{short_id(movement_id)}:{-1 if value < 0 else round(value)}')
+    return ' '.join(values)
+
+
+def encode_list(values:List[str]|None) -> str:
+    return ','.join(short_id(value) for value in values) if values else 'none'
+
+
+def encode_situation(rescue_movement_ids:List[str]|None, movement_state:Dict[str, bool], detector_state:Dict[str, str]) -> str:
+    """长尾场景, 只列出有问题的 movement
+    """
+    blocked = [_id for _id, _pass in movement_state.items() if not _pass]
+    broken = [_id for _id, _state in detector_state.items() if _state == 'Not Work']
+    return f'emergency:{encode_list(rescue_movement_ids)} blocked:{encode_list(blocked)} detector_down:{encode_list(broken)}'
+
+
+class CompactEncoder:
+    """记录当前对话中已经输出的静态信息, 相同的内容不再重复输出
+    """
+    def __init__(self) -> None:
+        self.scope = None
+        self.sent = {} # section -> text
+
+    def static_section(self, section:str, text:str, scope:Hashable) -> str:
+        if scope != self.scope: # 新的对话 (例如新的决策)
+            self.scope = scope
+            self.sent = {}
+        if self.sent.get(section) == text:
+            return f'{section}: unchanged, see above.'
+        self.sent[section] = text
+        return text
@@ -2,7 +2,7 @@
 @Author: WANG Maonan
 @Date: 2023-12-02 12:07:17
 @Description: Prompt for Simple LLM
-@LastEditTime: 2024-01-05 20:24:14
+@LastEditTime: 2026-10-18 20:40:05
 '''
 LLM_TSC_PROMPT = """As an AI controlling the traffic signal light at a busy intersection, make a decision based on the following information and rules: 
 - The intersection's structure and signal phase: {movement_info}, {phase_info}
@@ -21,4 +21,17 @@ Suggestions:
 - Remember to consider the presence of emergency vehicles, which may require priority.
 - If the Accessibility status of a movement is False, it means that the movement is currently blocked and cannot be passed, you don't need to give green light to this movements.
 - Check the functionality of each detector. If a detector isn't working, that may influence your decision.
-"""
\ No newline at end of file
+"""
+
+# 紧凑的编码 (TSCPrompt/compact_encoding.py), 与 LLM_TSC_PROMPT 的信息相同
+LLM_TSC_PROMPT_COMPACT = """You control the traffic signal of one intersection. Movement keys are <edge><direction>, direction l=left s=through r=right.
+Layout (movement:direction lanes): {movement_info}
+Phases (phase| green movements):
+{phase_info}
+Current phase: {current_phase}
+Occupancy % (-1 = detector not working): {occ}
+Situation: {situation}
+
+Choose ONE action: {available_actions}. Give priority to emergency vehicles, do not give green to blocked movements, and be careful with movements whose detector is down.
+{format_instructions}
+"""
@@ -2,10 +2,16 @@
 @Author: WANG Maonan
 @Date: 2024-01-06 16:40:15
 @Description: Agent Tools Prompts
-@LastEditTime: 2024-01-06 20:26:05
++ AGENT_MESSAGE, 逐个调用 tools 获得信息
++ AGENT_MESSAGE_SNAPSHOT, 只调用一次 Get Junction Snapshot 获得所有的信息
++ decision_history, DecisionMemory 中最近的决策, 不包括上一次的决策 (已经在第一句中给出)
+@LastEditTime: 2026-10-19 13:48:02
 '''
 AGENT_MESSAGE = """As the 'traffic signal light', you are tasked with controlling the traffic signal at an intersection. You've been in control for {sim_step} seconds. The last decision you made was {last_step_action}, with the explanation {last_step_explanation}. Now, you need to assess the current situation and make a decision for the next step.
 
+Your earlier decisions, before the last one (oldest first):
+{decision_history}
+
 To do this, you must describe the Static State and Dynamic State of the traffic light, including the Intersection Layout, Signal Phase Structure, and Current Occupancy. Determine if you are facing a long-tail problem, such as the presence of an ambulance, impassable movements or the detectors are not work well. 
 
 If it's a standard situation, refer to the Traditional Decision and justify your decision based on the observed scene. If it's a long-tail scenario, analyze the possible actions, make a judgment, and output your decision.
@@ -25,6 +31,28 @@ Final Answer:
 ``` \n
 """
 
+AGENT_MESSAGE_SNAPSHOT = """As the 'traffic signal light', you are tasked with controlling the traffic signal at an intersection. You've been in control for {sim_step} seconds. The last decision you made was {last_step_action}, with the explanation {last_step_explanation}. Now, you need to assess the current situation and make a decision for the next step.
+
+Your earlier decisions, before the last one (oldest first):
+{decision_history}
+
+Call the tool `Get Junction Snapshot` exactly ONCE. It returns the Intersection Layout, Signal Phase Structure, Current and Previous Occupancy, the long-tail situation (ambulance, impassable movements, detectors that do not work), the Traditional Decision and the Available Actions. DONOT call any other tool.
+
+If it's a standard situation, follow the Traditional Decision. If it's a long-tail scenario, analyze the possible actions and make a judgment. Prioritize emergency vehicles and do not give a green light to impassable movements.
+
+Right after the snapshot, output your decision in the following format: \n
+```
+Final Answer: 
+    "decision":{{"traffic signal light decision, ONE of the available actions"}},
+    "expalanations":{{"your explaination about your decision, described your suggestions to the Crossing Guard"}}
+``` \n
+"""
+
+AGENT_MESSAGES = {
+    'tools': AGENT_MESSAGE,
+    'snapshot': AGENT_MESSAGE_SNAPSHOT,
+} # prompt mode -> agent message
+
 
 SYSTEM_MESSAGE_PREFIX = """You are ChatGPT, a large language model trained by OpenAI. 
 You are now act as a mature traffic signal control assistant, who can give accurate and correct advice for human in complex traffic light control scenarios with different cases. 
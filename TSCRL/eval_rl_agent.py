@@ -24,10 +24,14 @@ Command:
 @ Scenario-3
 -> python eval_rl_agent.py --tls_action_type 'next_or_not' --env_name '3way' --phase_num 3 --detector_break 'E0--s'
 -> python eval_rl_agent.py --tls_action_type 'next_or_not' --env_name '4way' --phase_num 4 --detector_break 'E2--s'
-@LastEditTime: 2023-12-02 23:01:23
+
+---> Streaming LSTM (每次决策只处理最新的 occupancy) <---
+-> python eval_rl_agent.py --tls_action_type 'choose_next_phase' --env_name '4way' --phase_num 4 --stream exact
+@LastEditTime: 2026-10-18 23:14:52
 '''
 import torch
 import argparse
+import numpy as np
 from loguru import logger
 from stable_baselines3 import PPO
 from stable_baselines3.common.vec_env import VecNormalize, SubprocVecEnv
@@ -45,6 +49,7 @@ if __name__ == '__main__':
     parser.add_argument('--tls_action_type', type=str, default='choose_next_phase', help='TLS Action Type')
     parser.add_argument('--edge_block', type=str, default=None, help='Edge block')
     parser.add_argument('--detector_break', type=str, default=None, help='Detector break')
+    parser.add_argument('--stream', type=str, default=None, choices=['exact', 'recurrent'], help='Use the streaming NumPy policy instead of model.predict')
 
     args = parser.parse_args()
     env_name = args.env_name # 3way, 4way
@@ -74,8 +79,9 @@ if __name__ == '__main__':
         'copy_files': [trip_info] # 将对应的 trip 文件进行复制, 方便后续进行分析
     }
     env = SubprocVecEnv([make_env(env_index=f'{i}', **params) for i in range(1)])
+    vec_normalize_path = path_convert(f'./result/{env_name}/{tls_action_type}/models/last_vec_normalize.pkl')
     env = VecNormalize.load(
-        load_path=path_convert(f'./result/{env_name}/{tls_action_type}/models/last_vec_normalize.pkl'), 
+        load_path=vec_normalize_path, 
         venv=env
     )
     env.training = False
@@ -84,6 +90,12 @@ if __name__ == '__main__':
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     model_path = path_convert(f'./result/{env_name}/{tls_action_type}/models/last_rl_model.zip')
     model = PPO.load(model_path, env=env, device=device)
+    stream_policies = None
+    if args.stream is not None:
+        from TSCRL.rl_utils.model_cache import load_cached_policy # make_env 已经把根目录加入 sys.path
+        from TSCRL.rl_utils.streaming_policy import StreamingTSCPolicy
+        numpy_policy = load_cached_policy(model_path) # memmap 的权重, obs 已经经过 VecNormalize, 不再归一化
+        stream_policies = [StreamingTSCPolicy(numpy_policy, mode=args.stream) for _ in range(env.num_envs)] # 每个 env 一个 LSTM 状态
 
     # 使用模型进行测试
     obs = env.reset()
@@ -105,7 +117,10 @@ if __name__ == '__main__':
             else:
                 env.env_method('set_occ_missing', not_work_element='')
         
-        action, _state = model.predict(obs, deterministic=True)
+        if stream_policies is None:
+            action, _state = model.predict(obs, deterministic=True)
+        else:
+            action = np.array([policy.predict(env_obs)[0] for policy, env_obs in zip(stream_policies, obs)])
         obs, rewards, dones, infos = env.step(action)
         total_reward += rewards
         sim_step = infos[0]['step_time'] # 取出第 0 个仿真
@@ -2,7 +2,8 @@
 @Author: WANG Maonan
 @Date: 2023-09-08 18:34:24
 @Description: Custom Model
-@LastEditTime: 2023-11-27 23:03:32
++ occupancy 的时间长度 T 由 observation 决定 (最后两行是 phase), 不同的 max_states 可以使用同一个模型
+@LastEditTime: 2026-10-18 22:24:03
 '''
 import gym
 import torch
@@ -11,10 +12,10 @@ from stable_baselines3.common.torch_layers import BaseFeaturesExtractor
 
 class CustomTSCModel(BaseFeaturesExtractor):
     def __init__(self, observation_space: gym.Space, features_dim: int = 16):
-        """特征提取网络, (7,12) 由两个部分组成:
-        1. (5,12), 每个 movement 的占有率
-            -> embedding, (B,5,12) -> (B,5,32)
-            -> lstm, (B,5,32) -> (B,64)
+        """特征提取网络, (T+2,12) 由两个部分组成 (训练时 T=5):
+        1. (T,12), 每个 movement 的占有率
+            -> embedding, (B,T,12) -> (B,T,32)
+            -> lstm, (B,T,32) -> (B,64)
         2. (2,12), phase 的信息
             -> phase_embedding, (B,2,12) -> (B,2,16)
             -> flatten, (B,2,16) -> (B,32)
@@ -53,12 +54,12 @@ class CustomTSCModel(BaseFeaturesExtractor):
 
     def forward(self, observations):
         # Extract occupancy (occ) and phase information from x
-        occ = observations[:, :5, :]  # Assuming x is (B, 7, 12) and occ is (B, 5, 12)
-        phase = observations[:, 5:, :]  # Assuming phase is (B, 2, 12)
-        B = occ.size(0) # 获得 batch_size 大小
+        occ = observations[:, :-2, :]  # x is (B, T+2, 12) and occ is (B, T, 12)
+        phase = observations[:, -2:, :]  # Assuming phase is (B, 2, 12)
+        B, T = occ.size(0), occ.size(1) # 获得 batch_size 和时间长度
         
         # Process occupancy information
-        occ_embedded = self.occ_embedding(occ).view(B, 5, -1)
+        occ_embedded = self.occ_embedding(occ).view(B, T, -1)
         _, (occ_lstm_out, _)  = self.occ_lstm(occ_embedded)
         occ_lstm_out = occ_lstm_out[-1] # (B,64)
         occ_vector = self.relu(occ_lstm_out)
@@ -0,0 +1,208 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 23:14:52
+@Description: 模型文件的缓存, 多个进程 (SubprocVecEnv 的 worker) 共享同一份权重
++ 使用 model zip 和 VecNormalize pkl 的 sha256 作为 key, 相同的内容只解包一次
++ 解包为一个 float32 的 weights.bin (所有参数连续存放) 和 index.json (name -> offset, shape)
++ 先写入临时目录再 os.replace, 多个进程同时解包时不会读到一半的文件
++ 使用 np.memmap 只读打开, 所有进程共享 page cache, worker 的内存不随数量增加
++ VecNormalize 的 obs_rms 等统计量一起保存, worker 不需要 stable_baselines3 反序列化 pkl (只允许 VecNormalize 中出现的类)
++ norm_obs 为 True 时, NumpyTSCPolicy 使用保存的 obs_rms 归一化 observation
+使用方法:
+-> policy = load_cached_policy(model_path, vec_normalize_path)
+-> python model_cache.py --model_path ../result/4way/choose_next_phase/models/last_rl_model.zip
+@LastEditTime: 2026-10-19 10:41:08
+'''
+import os
+import json
+import pickle
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+from tshub.utils.get_abs_path import get_abs_path
+from TSCRL.rl_utils.numpy_policy import NumpyTSCPolicy, extract_policy_weights, read_policy_state_dict
+
+path_convert = get_abs_path(__file__)
+
+DEFAULT_CACHE_DIR = path_convert('../.model_cache/')
+WEIGHTS_FILE = 'weights.bin'
+INDEX_FILE = 'index.json'
+ALIGNMENT = 16 # 每个参数的起始位置对齐到 64 bytes
+VEC_NORMALIZE_PREFIX = 'vec_normalize.'
+
+
+# ###############
+# VecNormalize
+# ###############
+class _PickledObject:
+    """代替 stable_baselines3 和 gymnasium 的类, 只保留 __dict__
+    """
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+    def __setstate__(self, state:Any) -> None:
+        if isinstance(state, tuple): # (state, slotstate)
+            state = {key: value for part in state if isinstance(part, dict) for key, value in part.items()}
+        self.__dict__.update(state)
+
+
+# VecNormalize.save 中出现的类, 其他的 global (例如 builtins.eval) 一律拒绝
+SAFE_GLOBALS = {
+    (numpy_module, name)
+    for numpy_module in ('numpy.core.multiarray', 'numpy._core.multiarray')
+    for name in ('_reconstruct', 'scalar')
+} | {
+    ('numpy', 'dtype'), ('numpy', 'ndarray'),
+    ('numpy.random._pickle', '__generator_ctor'), ('numpy.random._pickle', '__bit_generator_ctor'), # space 的 _np_random
+    ('builtins', 'float'), ('builtins', 'int'), ('builtins', 'bool'),
+    ('collections', 'OrderedDict'),
+}
+PLACEHOLDER_GLOBALS = {
+    ('stable_baselines3.common.vec_env.vec_normalize', 'VecNormalize'),
+    ('stable_baselines3.common.running_mean_std', 'RunningMeanStd'),
+} | {
+    (f'{gym_module}.spaces.{space_module}', space_name)
+    for gym_module in ('gymnasium', 'gym')
+    for space_module, space_name in (('box', 'Box'), ('discrete', 'Discrete'), ('dict', 'Dict'))
+}
+
+
+class _VecNormalizeUnpickler(pickle.Unpickler):
+    def find_class(self, module:str, name:str) -> Any:
+        if (module, name) in SAFE_GLOBALS:
+            return super().find_class(module, name)
+        if (module, name) in PLACEHOLDER_GLOBALS:
+            return _PickledObject
+        raise pickle.UnpicklingError(f'Unsupported global {module}.{name} in the VecNormalize pkl')
+
+
+def read_vec_normalize(vec_normalize_path:str) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """读取 VecNormalize.save 的 pkl, 不需要 stable_baselines3, 返回 (统计量, 配置)
+    """
+    with open(vec_normalize_path, 'rb') as f:
+        vec_normalize = _VecNormalizeUnpickler(f).load()
+    arrays = {}
+    for name in ('obs_rms', 'ret_rms'):
+        rms = getattr(vec_normalize, name, None)
+        if isinstance(rms, _PickledObject): # norm_obs 为 False 时 obs_rms 也会保存
+            arrays[f'{VEC_NORMALIZE_PREFIX}{name}.mean'] = np.asarray(rms.mean, dtype=np.float32)
+            arrays[f'{VEC_NORMALIZE_PREFIX}{name}.var'] = np.asarray(rms.var, dtype=np.float32)
+    config = {
+        key: float(value) if isinstance(value, (np.floating, float)) else value
+        for key, value in vars(vec_normalize).items()
+        if key in ('norm_obs', 'norm_reward', 'clip_obs', 'clip_reward', 'epsilon', 'gamma')
+    }
+    return arrays, config
+
+
+# ########
+# Cache
+# ########
+def file_sha256(path:str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def artifact_key(model_path:str, vec_normalize_path:str=None) -> str:
+    """模型内容的 hash, 文件名或者路径不同但内容相同时使用同一个缓存
+    """
+    digest = hashlib.sha256(file_sha256(model_path).encode())
+    if vec_normalize_path is not None:
+        digest.update(file_sha256(vec_normalize_path).encode())
+    return digest.hexdigest()[:32]
+
+
+def _write_artifact(directory:Path, arrays:Dict[str, np.ndarray], meta:Dict[str, Any]) -> None:
+    index, offset = {}, 0
+    for name, value in arrays.items():
+        index[name] = {'offset': offset, 'shape': list(value.shape)}
+        offset += -(-value.size // ALIGNMENT) * ALIGNMENT
+    buffer = np.zeros(max(offset, 1), dtype=np.float32)
+    for name, value in arrays.items():
+        start = index[name]['offset']
+        buffer[start:start+value.size] = value.ravel()
+    buffer.tofile(directory / WEIGHTS_FILE)
+    with open(directory / INDEX_FILE, 'w') as f:
+        json.dump({'meta': meta, 'tensors': index}, f, indent=1)
+
+
+def unpack_artifact(model_path:str, vec_normalize_path:str=None, cache_dir:str=None, activation:str='tanh') -> Path:
+    """把模型解包到缓存中 (已经存在时直接返回), 返回缓存的目录
+    """
+    cache_dir = Path(DEFAULT_CACHE_DIR if cache_dir is None else cache_dir)
+    artifact_dir = cache_dir / artifact_key(model_path, vec_normalize_path)
+    if (artifact_dir / INDEX_FILE).exists():
+        return artifact_dir
+
+    arrays = extract_policy_weights(read_policy_state_dict(model_path))
+    meta = {'activation': activation, 'source': Path(model_path).name}
+    if vec_normalize_path is not None:
+        vec_arrays, meta['vec_normalize'] = read_vec_normalize(vec_normalize_path)
+        arrays.update(vec_arrays)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(prefix='.unpack-', dir=cache_dir))
+    try:
+        _write_artifact(tmp_dir, arrays, meta)
+        os.replace(tmp_dir, artifact_dir) # 原子操作, 其他进程要么看不到, 要么看到完整的目录
+    except OSError:
+        if not (artifact_dir / INDEX_FILE).exists(): # 不是因为其他进程已经完成解包
+            raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return artifact_dir
+
+
+def attach_artifact(artifact_dir:str) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """只读 memmap 缓存的权重, 返回 (name -> 只读的 np.ndarray, meta)
+    """
+    artifact_dir = Path(artifact_dir)
+    with open(artifact_dir / INDEX_FILE) as f:
+        index = json.load(f)
+    buffer = np.memmap(artifact_dir / WEIGHTS_FILE, dtype=np.float32, mode='r')
+    arrays = {
+        name: buffer[info['offset']:info['offset']+int(np.prod(info['shape']))].reshape(info['shape'])
+        for name, info in index['tensors'].items()
+    }
+    return arrays, index['meta']
+
+
+def find_vec_normalize(model_path:str) -> str|None:
+    """与模型一起保存的 VecNormalize, 例如 last_rl_model.zip -> last_vec_normalize.pkl, 不存在时为 None
+    """
+    model_path = Path(model_path)
+    vec_normalize_path = model_path.with_name(model_path.name.replace('rl_model', 'vec_normalize')).with_suffix('.pkl')
+    return str(vec_normalize_path) if (vec_normalize_path != model_path) and vec_normalize_path.exists() else None
+
+
+def load_cached_policy(model_path:str, vec_normalize_path:str=None, cache_dir:str=None) -> NumpyTSCPolicy:
+    """NumpyTSCPolicy, 权重来自缓存的 memmap (第一次使用时解包)
+    vec_normalize_path 的 norm_obs 为 True 时, predict 输入未归一化的 observation (与 VecNormalize 相同的处理)
+    """
+    arrays, meta = attach_artifact(unpack_artifact(model_path, vec_normalize_path, cache_dir))
+    weights = {name: value for name, value in arrays.items() if not name.startswith(VEC_NORMALIZE_PREFIX)}
+    config = meta.get('vec_normalize') or {}
+    obs_rms = None
+    if config.get('norm_obs') and f'{VEC_NORMALIZE_PREFIX}obs_rms.mean' in arrays:
+        obs_rms = {
+            'mean': arrays[f'{VEC_NORMALIZE_PREFIX}obs_rms.mean'], 'var': arrays[f'{VEC_NORMALIZE_PREFIX}obs_rms.var'],
+            'clip_obs': config.get('clip_obs', 10.0), 'epsilon': config.get('epsilon', 1e-8),
+        }
+    return NumpyTSCPolicy(weights, activation=meta.get('activation', 'tanh'), obs_rms=obs_rms)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Unpack a PPO model into the shared weight cache')
+    parser.add_argument('--model_path', type=str, required=True, help='Path of last_rl_model.zip')
+    parser.add_argument('--vec_normalize_path', type=str, default=None, help='Path of last_vec_normalize.pkl')
+    parser.add_argument('--cache_dir', type=str, default=None, help=f'Defaults to {DEFAULT_CACHE_DIR}')
+    args = parser.parse_args()
+    print(f'Cached at {unpack_artifact(args.model_path, args.vec_normalize_path, args.cache_dir)}')
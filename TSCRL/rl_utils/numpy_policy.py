@@ -0,0 +1,201 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 21:58:40
+@Description: 不依赖 torch 的 PPO (CustomTSCModel + MlpPolicy) 推理
++ read_policy_state_dict, 直接从 SB3 的 zip 中读取 policy.pth (torch 的 zip 格式), 不需要导入 torch
++ export_numpy_policy, 把 feature extractor 和 policy head 的权重保存为 .npz
++ NumpyTSCPolicy, 使用 NumPy 计算, predict(obs, deterministic=True) 与 SB3 相同 (只支持 deterministic)
++ obs_rms, 可选的 VecNormalize 归一化 (model_cache 从 pkl 中读取)
+网络结构:
+-> occ (B,5,12) -> Linear(12,32)+ReLU -> LSTM(32,64), gate 顺序为 i,f,g,o -> ReLU(h_T)
+-> phase (B,2,12) -> Linear(12,16)+ReLU -> flatten (B,32)
+-> concat (B,96) -> Linear(96,64)+ReLU -> Linear(64,32)+ReLU -> Linear(32,16)
+-> policy_net, Linear(16,64)+Tanh -> Linear(64,64)+Tanh -> action_net -> argmax
+使用方法:
+-> python numpy_policy.py --model_path ../result/4way/choose_next_phase/models/last_rl_model.zip
+@LastEditTime: 2026-10-19 16:40:33
+'''
+import io
+import json
+import pickle
+import zipfile
+import numpy as np
+from pathlib import Path
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+STORAGE_DTYPES = {
+    'FloatStorage': np.float32, 'DoubleStorage': np.float64, 'HalfStorage': np.float16,
+    'LongStorage': np.int64, 'IntStorage': np.int32, 'BoolStorage': np.bool_,
+}
+FEATURE_PREFIXES = ('pi_features_extractor.', 'features_extractor.') # share_features_extractor 时两者相同
+POLICY_PREFIXES = ('mlp_extractor.policy_net.', 'action_net.')
+ACTIVATIONS = {
+    'tanh': np.tanh,
+    'relu': lambda x: np.maximum(x, 0),
+}
+
+
+# ############
+# Read Weights
+# ############
+class _TensorUnpickler(pickle.Unpickler):
+    """读取 torch.save 的 state_dict, tensor 转换为 np.ndarray
+    """
+    def __init__(self, file, archive:zipfile.ZipFile, prefix:str) -> None:
+        super().__init__(file)
+        self.archive = archive
+        self.prefix = prefix
+
+    def find_class(self, module:str, name:str) -> Any:
+        if module == 'collections' and name == 'OrderedDict':
+            return OrderedDict
+        if module == 'torch._utils' and name == '_rebuild_tensor_v2':
+            return self._rebuild_tensor
+        if module == 'torch' and name in STORAGE_DTYPES:
+            return STORAGE_DTYPES[name]
+        raise pickle.UnpicklingError(f'Unsupported global {module}.{name} in policy.pth')
+
+    def persistent_load(self, pid:Tuple[Any, ...]) -> np.ndarray:
+        _, dtype, key, _, _ = pid # ('storage', storage_type, key, location, numel)
+        return np.frombuffer(self.archive.read(f'{self.prefix}data/{key}'), dtype=np.dtype(dtype).newbyteorder('<'))
+
+    @staticmethod
+    def _rebuild_tensor(storage:np.ndarray, storage_offset:int, size:Tuple[int, ...], stride:Tuple[int, ...], *args: Any) -> np.ndarray:
+        itemsize = storage.itemsize
+        tensor = np.lib.stride_tricks.as_strided(
+            storage[storage_offset:], shape=tuple(size), strides=tuple(s*itemsize for s in stride)
+        )
+        return np.array(tensor, dtype=storage.dtype.newbyteorder('='))
+
+
+def read_policy_state_dict(model_path:str) -> Dict[str, np.ndarray]:
+    """从 PPO.save 的 zip 中读取 policy 的参数, 不需要 torch
+    """
+    with zipfile.ZipFile(model_path) as model_zip:
+        policy_file = io.BytesIO(model_zip.read('policy.pth'))
+    with zipfile.ZipFile(policy_file) as archive:
+        pickle_name = next(name for name in archive.namelist() if name.endswith('data.pkl'))
+        prefix = pickle_name[:-len('data.pkl')]
+        return _TensorUnpickler(io.BytesIO(archive.read(pickle_name)), archive, prefix).load()
+
+
+def extract_policy_weights(state_dict:Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """只保留 deterministic predict 需要的参数, feature extractor 去掉前缀
+    """
+    feature_prefix = next(prefix for prefix in FEATURE_PREFIXES if any(key.startswith(prefix) for key in state_dict))
+    weights = {}
+    for key, value in state_dict.items():
+        if key.startswith(feature_prefix):
+            weights[key[len(feature_prefix):]] = value.astype(np.float32)
+        elif key.startswith(POLICY_PREFIXES):
+            weights[key] = value.astype(np.float32)
+    return weights
+
+
+def export_numpy_policy(model_path:str, output_path:str=None, activation:str='tanh') -> str:
+    """把 PPO 的 zip 导出为 .npz (默认与模型同名), 返回输出的路径
+
+    Args:
+        activation (str, optional): policy_net 的激活函数, MlpPolicy 默认是 tanh. Defaults to 'tanh'.
+    """
+    output_path = Path(model_path).with_suffix('.npz') if output_path is None else Path(output_path)
+    weights = extract_policy_weights(read_policy_state_dict(model_path))
+    meta = {'activation': activation, 'source': Path(model_path).name}
+    np.savez(output_path, __meta__=np.array(json.dumps(meta)), **weights)
+    return str(output_path)
+
+
+# ########
+# Runtime
+# ########
+def _sigmoid(x:np.ndarray) -> np.ndarray:
+    return 1 / (1 + np.exp(-x))
+
+
+class NumpyTSCPolicy:
+    def __init__(self, weights:Dict[str, np.ndarray], activation:str='tanh', obs_rms:Dict[str, Any]=None) -> None:
+        """
+        Args:
+            obs_rms (Dict[str, Any], optional): VecNormalize 的 mean, var, clip_obs, epsilon, None 时不归一化. Defaults to None.
+        """
+        self.weights = weights
+        self.obs_rms = obs_rms
+        self.activation = ACTIVATIONS[activation]
+        self.num_policy_layers = len([key for key in weights if key.startswith('mlp_extractor.policy_net.') and key.endswith('.weight')])
+        self.hidden_size = weights['occ_lstm.weight_hh_l0'].shape[1]
+        self.lstm_bias = weights['occ_lstm.bias_ih_l0'] + weights['occ_lstm.bias_hh_l0']
+
+    @classmethod
+    def load(cls, path:str) -> 'NumpyTSCPolicy':
+        """.npz (export_numpy_policy 的结果) 或者 SB3 的 .zip
+        """
+        if str(path).endswith('.zip'):
+            return cls(extract_policy_weights(read_policy_state_dict(path)))
+        with np.load(path, allow_pickle=False) as bundle:
+            meta = json.loads(str(bundle['__meta__']))
+            weights = {key: bundle[key] for key in bundle.files if key != '__meta__'}
+        return cls(weights, activation=meta.get('activation', 'tanh'))
+
+    def _linear(self, x:np.ndarray, name:str) -> np.ndarray:
+        return x @ self.weights[f'{name}.weight'].T + self.weights[f'{name}.bias']
+
+    def lstm_step(self, x:np.ndarray, h:np.ndarray, c:np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """LSTM 的一步, gate 的顺序与 torch 相同 (i, f, g, o)
+        """
+        gates = x @ self.weights['occ_lstm.weight_ih_l0'].T + h @ self.weights['occ_lstm.weight_hh_l0'].T + self.lstm_bias
+        i, f, g, o = np.split(gates, 4, axis=-1)
+        c = _sigmoid(f) * c + _sigmoid(i) * np.tanh(g)
+        h = _sigmoid(o) * np.tanh(c)
+        return h, c
+
+    def normalize_obs(self, observations:np.ndarray) -> np.ndarray:
+        """与 VecNormalize.normalize_obs 相同
+        """
+        if self.obs_rms is None:
+            return observations
+        normalized = (observations - self.obs_rms['mean']) / np.sqrt(self.obs_rms['var'] + self.obs_rms['epsilon'])
+        return np.clip(normalized, -self.obs_rms['clip_obs'], self.obs_rms['clip_obs']).astype(np.float32)
+
+    def features(self, observations:np.ndarray) -> np.ndarray:
+        """CustomTSCModel.forward, (B,7,12) -> (B,16)
+        """
+        observations = self.normalize_obs(observations)
+        occ, phase = observations[:, :-2, :], observations[:, -2:, :] # 最后两行是 phase 信息
+        B = observations.shape[0]
+        occ_embedded = np.maximum(self._linear(occ, 'occ_embedding.0'), 0)
+        h = np.zeros((B, self.hidden_size), dtype=np.float32)
+        c = np.zeros((B, self.hidden_size), dtype=np.float32)
+        for t in range(occ_embedded.shape[1]):
+            h, c = self.lstm_step(occ_embedded[:, t], h, c)
+        occ_vector = np.maximum(h, 0)
+        phase_embedded = np.maximum(self._linear(phase, 'phase_embedding.0'), 0).reshape(B, -1)
+        x = np.concatenate([occ_vector, phase_embedded], axis=1)
+        x = np.maximum(self._linear(x, 'output.0'), 0)
+        x = np.maximum(self._linear(x, 'output.2'), 0)
+        return self._linear(x, 'output.4')
+
+    def action_logits(self, observations:np.ndarray) -> np.ndarray:
+        x = self.features(observations)
+        for index in range(self.num_policy_layers):
+            x = self.activation(self._linear(x, f'mlp_extractor.policy_net.{2*index}')) # Linear 和激活函数交替
+        return self._linear(x, 'action_net')
+
+    def predict(self, observation:np.ndarray, state:Any=None, episode_start:Any=None, deterministic:bool=True) -> Tuple[np.ndarray, None]:
+        """与 SB3 的 predict 相同的接口, 单个 observation 返回标量的动作
+        """
+        if not deterministic:
+            raise ValueError('NumpyTSCPolicy only supports deterministic=True')
+        observation = np.asarray(observation, dtype=np.float32)
+        vectorized = observation.ndim == 3
+        actions = np.argmax(self.action_logits(observation if vectorized else observation[None]), axis=1)
+        return (actions if vectorized else actions[0]), None
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Export a PPO model to a NumPy weight bundle')
+    parser.add_argument('--model_path', type=str, required=True, help='Path of last_rl_model.zip')
+    parser.add_argument('--output_path', type=str, default=None, help='Output .npz, next to the model if None')
+    args = parser.parse_args()
+    print(f'Exported to {export_numpy_policy(args.model_path, args.output_path)}')
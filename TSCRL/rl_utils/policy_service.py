@@ -0,0 +1,297 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 21:32:16
+@Description: 共享的 PPO 策略推理服务
++ 每个模型文件在一个进程中只加载一次 (get_policy_service)
++ 多个 wrapper (多个路口, 多个线程) 的 rl_state 合并成 micro-batch, 一次 forward 得到所有的动作
++ predict_many, 同一个决策时刻所有路口的 rl_state 直接组成一个 batch
++ 可选的本地 socket (multiprocessing.connection), 多个进程共用一个模型 (PolicyClient)
++ socket 默认只监听 loopback, 每次启动随机生成 authkey, 写入只有当前用户可读的文件 (或者使用环境变量 TSC_POLICY_AUTHKEY)
++ submit 检查 observation 的 shape, 错误的请求不会影响同一个 batch 中的其他请求
++ 统计 batch size 与延迟的直方图
++ backend='numpy' 时使用 NumpyTSCPolicy, 不需要导入 torch 和 stable_baselines3
++ backend='numpy' 的 .zip 模型使用 model_cache 中 memmap 的权重, 多个进程共享内存
+使用方法:
+-> policy = get_policy_service(model_path)
+-> action = policy.predict(rl_state)
+-> policy.serve(('127.0.0.1', 6010)); PolicyClient(('127.0.0.1', 6010)).predict(rl_state) # 其他进程, 从 authkey 文件读取 authkey
+@LastEditTime: 2026-10-19 11:05:26
+'''
+import os
+import time
+import queue
+import secrets
+import tempfile
+import threading
+import ipaddress
+import numpy as np
+from loguru import logger
+from collections import Counter
+from concurrent.futures import Future
+from pathlib import Path
+from multiprocessing.connection import Client, Listener
+from typing import Any, Dict, List, Tuple
+
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100) # ms, 最后一个区间是 >100ms
+AUTHKEY_ENV = 'TSC_POLICY_AUTHKEY' # hex 格式的 authkey, 优先于 authkey 文件
+
+_services: Dict[Tuple[str, str, str], 'PolicyService'] = {} # (model_path, device, backend) -> PolicyService
+_services_lock = threading.Lock()
+
+
+class PolicyService:
+    def __init__(self, model, max_batch:int=64, max_wait:float=0, observation_shape:Tuple[int, ...]=None) -> None:
+        """
+        Args:
+            model: stable_baselines3 的模型, 需要 predict(obs, deterministic)
+            max_batch (int, optional): 一个 batch 中最多的请求数. Defaults to 64.
+            max_wait (float, optional): 收到第一个请求之后, 等待其他请求的时间 (s), 0 时只合并已经在队列中的请求. Defaults to 0.
+            observation_shape (Tuple[int, ...], optional): 单个 observation 的 shape, None 时使用模型的 observation_space, 
+                模型没有 observation_space 时使用第一个请求的 shape. Defaults to None.
+        """
+        self.model = model
+        if observation_shape is None:
+            observation_shape = getattr(getattr(model, 'observation_space', None), 'shape', None)
+        self.observation_shape = None if observation_shape is None else tuple(observation_shape)
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = queue.Queue() # (obs, Future)
+        self.lock = threading.Lock()
+        self.batch_sizes = Counter() # batch size -> 次数
+        self.latency = Counter() # 延迟的区间 -> 次数
+        self.num_requests = 0
+        self.num_forwards = 0
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+        self.listener = None
+
+    @classmethod
+    def load(cls, model_path:str, device:str='cpu', backend:str='sb3', **kwargs: Any) -> 'PolicyService':
+        """
+        Args:
+            backend (str, optional): sb3 (PPO.load) 或者 numpy (NumpyTSCPolicy, 支持 .zip 和 .npz). Defaults to 'sb3'.
+        """
+        if backend == 'numpy':
+            from TSCRL.rl_utils.numpy_policy import NumpyTSCPolicy
+            from TSCRL.rl_utils.model_cache import find_vec_normalize, load_cached_policy
+            if str(model_path).endswith('.zip'):
+                try:
+                    return cls(load_cached_policy(model_path, find_vec_normalize(model_path)), **kwargs) # 多个进程共享同一份权重, 输入未归一化的 rl_state
+                except OSError as e: # 例如缓存目录不可写
+                    logger.warning(f'SIM: Model cache unavailable ({e}), load {model_path} directly.')
+            return cls(NumpyTSCPolicy.load(model_path), **kwargs)
+        from stable_baselines3 import PPO # 只在需要 RL 的时候导入
+        return cls(PPO.load(model_path, device=device), **kwargs)
+
+    # ##########
+    # Inference
+    # ##########
+    def forward(self, observations:np.ndarray) -> np.ndarray:
+        """一次 forward, observations 为 (B, ...)
+        """
+        start_time = time.perf_counter()
+        actions, _ = self.model.predict(observations, deterministic=True)
+        latency = (time.perf_counter() - start_time) * 1000
+        with self.lock:
+            self.num_forwards += 1
+            self.num_requests += len(observations)
+            self.batch_sizes[len(observations)] += 1
+            self.latency[next((bucket for bucket in LATENCY_BUCKETS if latency <= bucket), f'>{LATENCY_BUCKETS[-1]}')] += 1
+        return np.asarray(actions)
+
+    def predict_many(self, observations:List[np.ndarray]) -> np.ndarray:
+        """同一个决策时刻多个路口的 state, 一次 forward
+        """
+        return self.forward(np.stack(observations))
+
+    def check_observation(self, observation:Any) -> np.ndarray:
+        """shape 不同的 observation 无法组成 batch, 在进入队列之前抛出 ValueError
+        """
+        try:
+            observation = np.asarray(observation, dtype=np.float32)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f'Invalid observation, {e}') from None
+        with self.lock:
+            if self.observation_shape is None:
+                self.observation_shape = observation.shape # 第一个请求决定 shape
+        if observation.shape != self.observation_shape:
+            raise ValueError(f'Observation shape {observation.shape} does not match {self.observation_shape}')
+        return observation
+
+    def submit(self, observation:np.ndarray) -> Future:
+        """异步的请求, 与其他线程的请求合并成 batch
+        """
+        observation = self.check_observation(observation)
+        future = Future()
+        self.requests.put((observation, future))
+        return future
+
+    def predict(self, observation:np.ndarray) -> int:
+        """单个 state 的动作 (与 model.predict(obs, deterministic=True) 相同)
+        """
+        return self.submit(observation).result()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.requests.get()] # 等待第一个请求
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                try:
+                    batch.append(self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                actions = self.forward(np.stack([observation for observation, _ in batch]))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), action in zip(batch, actions):
+                future.set_result(action)
+
+    # ######
+    # Stats
+    # ######
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'requests': self.num_requests,
+                'forwards': self.num_forwards,
+                'mean_batch_size': self.num_requests / self.num_forwards if self.num_forwards > 0 else 0,
+                'batch_size_histogram': dict(sorted(self.batch_sizes.items())),
+                'latency_ms_histogram': dict(self.latency),
+            }
+
+    # ######
+    # Socket
+    # ######
+    def serve(self, address:Tuple[str, int]|str, authkey:bytes=None, authkey_file:str=None, allow_remote:bool=False) -> Listener:
+        """在后台线程中监听本地 socket, 每个连接一个线程, 请求进入同一个 batch 队列
+        multiprocessing.connection 会 unpickle 收到的数据, 所以只监听 loopback, 并且使用随机的 authkey
+
+        Args:
+            authkey (bytes, optional): None 时使用 TSC_POLICY_AUTHKEY, 没有时随机生成. Defaults to None.
+            authkey_file (str, optional): 写入 authkey 的文件 (权限 600), None 时使用 default_authkey_file(address). Defaults to None.
+            allow_remote (bool, optional): 是否允许监听非 loopback 的地址. Defaults to False.
+        """
+        if not (allow_remote or is_loopback(address)):
+            raise ValueError(f'Policy service only listens on loopback addresses, got {address} (use allow_remote=True)')
+        authkey = authkey or authkey_from_env() or secrets.token_bytes(32)
+        authkey_file = default_authkey_file(address) if authkey_file is None else authkey_file
+        fd = os.open(authkey_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(authkey.hex())
+        self.listener = Listener(address, authkey=authkey)
+        threading.Thread(target=self._accept, daemon=True).start()
+        logger.info(f'SIM: Policy service on {self.listener.address}, authkey in {authkey_file}.')
+        return self.listener
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                connection = self.listener.accept()
+            except OSError: # listener 关闭
+                return
+            threading.Thread(target=self._handle, args=(connection,), daemon=True).start()
+
+    def _handle(self, connection) -> None:
+        with connection:
+            while True:
+                try:
+                    observation = connection.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    connection.send(('ok', self.predict(observation)))
+                except Exception as e:
+                    connection.send(('error', repr(e)))
+
+    def close(self) -> None:
+        if self.listener is not None:
+            self.listener.close()
+
+
+class PolicyClient:
+    """其他进程中使用 PolicyService.serve 的模型, 接口与 PolicyService.predict 相同
+    """
+    def __init__(self, address:Tuple[str, int]|str, authkey:bytes=None, authkey_file:str=None) -> None:
+        """
+        Args:
+            authkey (bytes, optional): None 时依次使用 TSC_POLICY_AUTHKEY 和 authkey_file. Defaults to None.
+            authkey_file (str, optional): PolicyService.serve 写入的文件, None 时使用 default_authkey_file(address). Defaults to None.
+        """
+        authkey = authkey or authkey_from_env()
+        if authkey is None:
+            with open(default_authkey_file(address) if authkey_file is None else authkey_file) as f:
+                authkey = bytes.fromhex(f.read().strip())
+        self.connection = Client(address, authkey=authkey)
+        self.lock = threading.Lock()
+
+    def predict(self, observation:np.ndarray) -> int:
+        with self.lock:
+            self.connection.send(np.asarray(observation))
+            status, result = self.connection.recv()
+        if status != 'ok':
+            raise RuntimeError(f'Policy service error, {result}')
+        return result
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def is_loopback(address:Tuple[str, int]|str) -> bool:
+    if isinstance(address, str): # unix socket
+        return True
+    host = address[0]
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def authkey_from_env() -> bytes|None:
+    value = os.environ.get(AUTHKEY_ENV)
+    return None if not value else bytes.fromhex(value)
+
+
+def default_authkey_file(address:Tuple[str, int]|str) -> str:
+    """同一台机器上 server 和 client 使用的 authkey 文件, 例如 /tmp/tsc-policy-6010.key
+    """
+    name = address[1] if isinstance(address, tuple) else Path(address).name
+    return os.path.join(tempfile.gettempdir(), f'tsc-policy-{name}.key')
+
+
+def get_policy_service(model_path:str, device:str='cpu', backend:str='sb3', **kwargs: Any) -> PolicyService:
+    """同一个进程中, 相同的模型只加载一次
+    """
+    key = (str(model_path), str(device), backend)
+    with _services_lock:
+        if key not in _services:
+            _services[key] = PolicyService.load(model_path, device=device, backend=backend, **kwargs)
+        return _services[key]
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve a PPO policy on a local socket')
+    parser.add_argument('--model_path', type=str, required=True, help='Path of last_rl_model.zip')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6010)
+    parser.add_argument('--max_batch', type=int, default=64)
+    parser.add_argument('--max_wait', type=float, default=0.002, help='Seconds to wait for more requests after the first one')
+    parser.add_argument('--backend', type=str, default='sb3', choices=['sb3', 'numpy'])
+    parser.add_argument('--authkey_file', type=str, default=None, help='Where to write the random authkey, /tmp/tsc-policy-<port>.key if None')
+    parser.add_argument('--allow_remote', action='store_true', help='Allow a non-loopback host (the peer must be trusted)')
+    args = parser.parse_args()
+
+    service = PolicyService.load(args.model_path, backend=args.backend, max_batch=args.max_batch, max_wait=args.max_wait)
+    service.serve((args.host, args.port), authkey_file=args.authkey_file, allow_remote=args.allow_remote)
+    try:
+        while True:
+            time.sleep(60)
+            logger.info(f'SIM: Policy service, {service.stats()}')
+    except KeyboardInterrupt:
+        service.close()
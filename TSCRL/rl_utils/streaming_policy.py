@@ -0,0 +1,107 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 22:24:03
+@Description: 流式的 LSTM 推理, 每次决策只处理最新的 occupancy
++ exact, 同时保存 T 条从不同时刻开始的 LSTM 状态 (staggered), 新的一帧只做一次 embedding 和一次 batch 的 LSTM step, 结果与窗口模型相同
++ recurrent, 只保存一条 LSTM 状态并一直向后传递 (看到完整的历史), 每次决策只有一次 LSTM step, 结果与窗口模型近似
++ 窗口与上一次不连续时 (reset, 探测器 mask 变化会修改历史中的整列) 使用完整的窗口重新初始化
++ 与 max_states 无关, embedding 和 LSTM 的参数不需要重新训练
+@LastEditTime: 2026-10-19 16:40:33
+'''
+import numpy as np
+from typing import Any, Tuple
+
+from TSCRL.rl_utils.numpy_policy import NumpyTSCPolicy
+
+STREAM_MODES = ('exact', 'recurrent')
+
+
+class StreamingTSCPolicy:
+    def __init__(self, policy:NumpyTSCPolicy, mode:str='exact') -> None:
+        """
+        Args:
+            policy (NumpyTSCPolicy): 共享的权重, 每个路口一个 StreamingTSCPolicy
+            mode (str, optional): exact 或者 recurrent. Defaults to 'exact'.
+        """
+        assert mode in STREAM_MODES, f'mode 需要是 {STREAM_MODES} 中的一个'
+        self.policy = policy
+        self.mode = mode
+        self.reset()
+
+    def reset(self) -> None:
+        self.window = None # 上一次的 occupancy 窗口 (T,12)
+        self.h = self.c = None # exact: (T-1,64) 还没有结束的 LSTM 状态, 最早开始的在第一行; recurrent: (1,64)
+        self.num_steps = 0 # 流式更新的次数
+        self.num_resyncs = 0 # 重新初始化的次数
+        self.last_h = None # 同一个决策时刻重复调用时直接使用
+
+    def _embed(self, frames:np.ndarray) -> np.ndarray:
+        return np.maximum(self.policy._linear(frames, 'occ_embedding.0'), 0)
+
+    def _advance(self, frame_embedded:np.ndarray) -> np.ndarray:
+        """输入新的一帧, 返回结束的 LSTM 的 h (1,64)
+        """
+        hidden_size = self.policy.hidden_size
+        if self.mode == 'recurrent':
+            self.h, self.c = self.policy.lstm_step(frame_embedded, self.h, self.c)
+            return self.h
+        zeros = np.zeros((1, hidden_size), dtype=np.float32)
+        h = np.concatenate([self.h, zeros]) # 新的一帧开始一条新的 LSTM
+        c = np.concatenate([self.c, zeros])
+        h, c = self.policy.lstm_step(frame_embedded, h, c) # 所有的 LSTM 一起前进一步
+        self.h, self.c = h[1:], c[1:] # 最早的一条已经看完 T 帧
+        return h[:1]
+
+    def _resync(self, occ:np.ndarray) -> np.ndarray:
+        """使用完整的窗口初始化状态, 返回窗口模型的 h
+        """
+        self.num_resyncs += 1
+        hidden_size = self.policy.hidden_size
+        embedded = self._embed(occ)
+        if self.mode == 'recurrent':
+            self.h = self.c = np.zeros((1, hidden_size), dtype=np.float32)
+            for t in range(len(occ)):
+                h = self._advance(embedded[t:t+1])
+            return h
+        self.h = self.c = np.zeros((0, hidden_size), dtype=np.float32)
+        for t in range(len(occ)):
+            zeros = np.zeros((1, hidden_size), dtype=np.float32)
+            self.h, self.c = self.policy.lstm_step(
+                embedded[t:t+1], np.concatenate([self.h, zeros]), np.concatenate([self.c, zeros])
+            )
+        h = self.h[:1]
+        self.h, self.c = self.h[1:], self.c[1:]
+        return h
+
+    def features(self, observation:np.ndarray) -> np.ndarray:
+        """与 NumpyTSCPolicy.features 相同, 输入单个 observation (T+2,12), 输出 (1,16)
+        """
+        observation = self.policy.normalize_obs(observation)
+        occ, phase = observation[:-2], observation[-2:]
+        if (self.window is not None) and (self.window.shape == occ.shape) and np.array_equal(self.window, occ):
+            h = self.last_h # 同一个决策时刻 (例如 tool 和 fallback 都需要 RL 的动作)
+        elif (self.window is not None) and (self.window.shape == occ.shape) and np.array_equal(self.window[1:], occ[:-1]):
+            self.num_steps += 1
+            h = self._advance(self._embed(occ[-1:]))
+        else: # 第一次, reset 之后, 或者历史被修改
+            h = self._resync(occ)
+        self.window, self.last_h = occ.copy(), h
+
+        phase_embedded = np.maximum(self.policy._linear(phase, 'phase_embedding.0'), 0).reshape(1, -1)
+        x = np.concatenate([np.maximum(h, 0), phase_embedded], axis=1)
+        x = np.maximum(self.policy._linear(x, 'output.0'), 0)
+        x = np.maximum(self.policy._linear(x, 'output.2'), 0)
+        return self.policy._linear(x, 'output.4')
+
+    def action_logits(self, observation:np.ndarray) -> np.ndarray:
+        x = self.features(np.asarray(observation, dtype=np.float32))
+        for index in range(self.policy.num_policy_layers):
+            x = self.policy.activation(self.policy._linear(x, f'mlp_extractor.policy_net.{2*index}'))
+        return self.policy._linear(x, 'action_net')
+
+    def predict(self, observation:np.ndarray, state:Any=None, episode_start:Any=None, deterministic:bool=True) -> Tuple[np.ndarray, None]:
+        """与 SB3 的 predict 相同的接口, 只支持单个 observation (一个路口按时间顺序调用)
+        """
+        if not deterministic:
+            raise ValueError('StreamingTSCPolicy only supports deterministic=True')
+        return np.argmax(self.action_logits(observation), axis=1)[0], None
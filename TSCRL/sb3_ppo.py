@@ -11,7 +11,7 @@
 + State Design: Last step occupancy for each movement + green phase id
 + Action Design: Next or Not
 + Reward Design: Total Waiting Time
-@LastEditTime: 2023-11-28 14:04:07
+@LastEditTime: 2026-10-18 23:14:52
 '''
 import os
 import torch
@@ -22,6 +22,7 @@ from tshub.utils.init_log import set_logger
 from rl_utils.make_tsc_env import make_env
 from TSCRL.rl_utils.custom_model import CustomTSCModel
 from rl_utils.sb3_utils import VecNormalizeCallback, linear_schedule
+from TSCRL.rl_utils.model_cache import unpack_artifact
 
 from stable_baselines3 import PPO
 from stable_baselines3.common.vec_env import SubprocVecEnv, VecNormalize
@@ -102,6 +103,7 @@ if __name__ == '__main__':
     # #################
     env.save(f'{model_path}/last_vec_normalize.pkl')
     model.save(f'{model_path}/last_rl_model.zip')
-    print('训练结束, 达到最大步数.')
+    artifact_dir = unpack_artifact(f'{model_path}/last_rl_model.zip', f'{model_path}/last_vec_normalize.pkl') # 之后的 worker 直接 memmap
+    print(f'训练结束, 达到最大步数. 模型缓存在 {artifact_dir}.')
 
     env.close()
\ No newline at end of file
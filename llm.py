@@ -11,19 +11,27 @@
 @ Scenario-3, Detector Break
 -> python llm.py --env_name '3way' --phase_num 3 --detector_break 'E0--s'
 -> python llm.py --env_name '4way' --phase_num 4 --detector_break 'E2--s'
-@LastEditTime: 2024-01-16 16:51:46
+@ Response Cache, 相同的 prompt (occupancy 量化之后) 不再调用 LLM, 默认关闭
+-> python llm.py --env_name '4way' --phase_num 4 --use_cache --occ_bin 5
+-> python llm.py --env_name '4way' --phase_num 4 --response_cache './llm_response.db' --occ_bin 5
+@ Compact Prompt, 紧凑的环境描述, 减少输入的 token
+-> python llm.py --env_name '4way' --phase_num 4 --prompt_encoding compact
+@ LLM Client Pool, 限制每分钟的请求数/token 数与并发数
+-> python llm.py --env_name '4way' --phase_num 4 --llm_rpm 60 --llm_tpm 40000
+@LastEditTime: 2026-10-19 12:30:17
 '''
 import argparse
 import langchain
 from loguru import logger
-from langchain.chat_models import ChatOpenAI
 
 from tshub.utils.get_abs_path import get_abs_path
 from tshub.utils.init_log import set_logger
 
 from TSCEnvironment.tsc_env import TSCEnvironment
 from TSCEnvironment.llm_wrapper import LLMTSCEnvWrapper
+from TSCAgent.response_cache import ResponseCache
 from utils.readConfig import read_config
+from utils.llm_client import LLMClientPool
 
 langchain.debug = False # 开启详细的显示
 path_convert = get_abs_path(__file__)
@@ -35,25 +43,28 @@ if __name__ == '__main__':
     parser.add_argument('--phase_num', type=int, default=4, help='Phase number')
     parser.add_argument('--edge_block', type=str, default=None, help='Edge block')
     parser.add_argument('--detector_break', type=str, default=None, help='Detector break')
+    parser.add_argument('--use_cache', action='store_true', help='Reuse LLM responses for the same quantized prompt')
+    parser.add_argument('--response_cache', type=str, default=None, help='SQLite file of the response cache (implies --use_cache), memory only if not set')
+    parser.add_argument('--cache_capacity', type=int, default=1024, help='Max responses kept in memory')
+    parser.add_argument('--occ_bin', type=float, default=5, help='Occupancy bin (percent) of the cache key')
+    parser.add_argument('--llm_rpm', type=float, default=None, help='Max LLM requests per minute, unlimited if None')
+    parser.add_argument('--llm_tpm', type=float, default=None, help='Max LLM tokens per minute, unlimited if None')
+    parser.add_argument('--llm_concurrency', type=int, default=8, help='Max concurrent LLM requests')
+    parser.add_argument('--prompt_encoding', type=str, default='full', choices=['full', 'compact'], help='Encoding of the environment description')
 
     args = parser.parse_args()
     env_name = args.env_name # 3way, 4way
     phase_num = args.phase_num # 3, 4
     edge_block = args.edge_block # 是否 block 堵塞
     detector_break = args.detector_break # 检测器损坏, 导致 state 无法获得好的
+    occ_bin = args.occ_bin # occupancy 量化的间隔
 
     # Init LLM Model
     config = read_config()
-    openai_proxy = config['OPENAI_PROXY']
-    openai_api_key = config['OPENAI_API_KEY']
-    openai_api_base = config['OPENAI_API_BASE']
-    chat = ChatOpenAI(
-        model=config['OPENAI_API_MODEL'], 
-        temperature=0.0,
-        openai_api_key=openai_api_key, 
-        openai_proxy=openai_proxy,
-        openai_api_base=openai_api_base,
-    )
+    llm_pool = LLMClientPool.from_config(
+        config, rpm=args.llm_rpm, tpm=args.llm_tpm, max_concurrency=args.llm_concurrency
+    ) # 共享连接, 限流与重试
+    chat = llm_pool.chat(caller='llm')
 
     # Init Scenario
     route_type = 'vehicle' # vehicle_pedestrian
@@ -75,9 +86,15 @@ if __name__ == '__main__':
     tsc_wrapper = LLMTSCEnvWrapper(
         env=tsc_scenario, 
         tls_id='J1',
-        phase_num=phase_num
+        phase_num=phase_num,
+        prompt_encoding=args.prompt_encoding
     )
     
+    # Init Response Cache, 只有指定时使用 (缓存的回答不会随着 LLM 的随机性变化)
+    response_cache = None
+    if args.use_cache or (args.response_cache is not None):
+        response_cache = ResponseCache(capacity=args.cache_capacity, database=args.response_cache)
+
     # Simulate with ENV
     dones = False
     tsc_wrapper.reset()
@@ -99,10 +116,19 @@ if __name__ == '__main__':
                 tsc_wrapper.set_occ_missing(not_work_element='')
                 
         states, rewards, truncated, dones, infos = tsc_wrapper.step(action=action)
-        tsc_message = tsc_wrapper.description_env() # 描述环境
-        llm_decision = chat(tsc_message) # chat 作出决策
-        logger.info(f'SIM: {llm_decision.content}')
-        final_action = tsc_wrapper.output_parser.parse(llm_decision.content)
+        llm_response = None
+        if response_cache is not None:
+            cache_key = ResponseCache.make_key(
+                f"{config['OPENAI_API_MODEL']}|{tsc_wrapper.prompt_cache_key(occ_bin=occ_bin)}"
+            ) # 不同的模型不共享回答
+            llm_response = response_cache.get(cache_key)
+        if llm_response is None:
+            tsc_message = tsc_wrapper.description_env() # 描述环境
+            llm_response = chat(tsc_message).content # chat 作出决策
+            if response_cache is not None:
+                response_cache.put(cache_key, llm_response)
+        logger.info(f'SIM: {llm_response}')
+        final_action = tsc_wrapper.output_parser.parse(llm_response)
         try:
             action = int(final_action['decision'][-1])
             logger.info(f'SIM: {action}.')
@@ -112,4 +138,9 @@ if __name__ == '__main__':
 
         sim_step = infos['step_time']
         
+    if response_cache is not None:
+        response_cache.log_stats(episode=tsc_wrapper.episode)
+        response_cache.close()
+    llm_pool.log_stats()
+    llm_pool.close()
     tsc_wrapper.close()
\ No newline at end of file
@@ -21,7 +21,6 @@
 '''
 import langchain
 import numpy as np
-from langchain.chat_models import ChatOpenAI
 
 from tshub.utils.get_abs_path import get_abs_path
 from tshub.utils.init_log import set_logger
@@ -41,6 +40,7 @@ from TSCAgent.custom_tools import (
     GetJunctionSituation
 )
 from utils.readConfig import read_config
+from utils.llm_client import LLMClientPool
 
 langchain.debug = False # 开启详细的显示
 path_convert = get_abs_path(__file__)
@@ -49,16 +49,8 @@ set_logger(path_convert('./'))
 if __name__ == '__main__':
     # Init Chat
     config = read_config()
-    openai_proxy = config['OPENAI_PROXY']
-    openai_api_key = config['OPENAI_API_KEY']
-    openai_api_base = config['OPENAI_API_BASE']
-    chat = ChatOpenAI(
-        model=config['OPENAI_API_MODEL'], 
-        temperature=0.0,
-        openai_api_key=openai_api_key, 
-        openai_proxy=openai_proxy,
-        openai_api_base=openai_api_base,
-    )
+    llm_pool = LLMClientPool.from_config(config) # 共享连接与重试
+    chat = llm_pool.chat(caller='agent')
 
     # Init scenario
     sumo_cfg = path_convert("./TSCScenario/J1/env/J1.sumocfg")
@@ -76,7 +68,7 @@ if __name__ == '__main__':
     )
 
     # Init Agent
-    o_parse = OutputParse(env=None, llm=chat)
+    o_parse = OutputParse(env=tsc_wrapper, llm=llm_pool.chat(caller='parser')) # 本地解析失败时才调用 LLM
     tools = [
         GetIntersectionLayout(env=tsc_wrapper),
         GetSignalPhaseStructure(env=tsc_wrapper),
@@ -122,4 +114,7 @@ if __name__ == '__main__':
         sim_step = infos['step_time']
         print(f'---\nSim Time, {sim_step}\n---')
     
+    print(f'Output parse fallback rate, {o_parse.fallback_rate():.2%} ({o_parse.num_fallback}/{o_parse.num_parse})')
+    llm_pool.log_stats()
+    llm_pool.close()
     tsc_wrapper.close()
@@ -10,12 +10,23 @@
 
 @4way
 -> python llm_rl.py --env_name '4way' --phase_num 4 --edge_block 'E1' --detector_break 'E2--s'
-@LastEditTime: 2024-01-06 20:45:24
+
+@async, LLM 在后台线程中运行, 没有结果时使用 RL 的动作 (--deadline 同样生效)
+-> python llm_rl.py --env_name '4way' --phase_num 4 --edge_block 'E1' --detector_break 'E2--s' --async_llm
+
+@long-tail gate, 只在长尾场景 (急救车, 道路堵塞, 探测器损坏, occupancy 异常) 调用 LLM
+-> python llm_rl.py --env_name '4way' --phase_num 4 --edge_block 'E1' --detector_break 'E2--s' --long_tail_gate --occ_jump 0.3
+
+@snapshot, 一次 tool 调用获得所有的信息 (减少 ReAct 的轮数)
+-> python llm_rl.py --env_name '4way' --phase_num 4 --edge_block 'E1' --detector_break 'E2--s' --prompt_mode snapshot
+-> python llm_rl.py --env_name '4way' --phase_num 4 --prompt_mode snapshot --prompt_encoding compact
+@LastEditTime: 2026-10-19 16:31:07
 '''
+import time
 import argparse
 import langchain
 import numpy as np
-from langchain.chat_models import ChatOpenAI
+from loguru import logger
 
 from tshub.utils.get_abs_path import get_abs_path
 from tshub.utils.init_log import set_logger
@@ -23,7 +34,13 @@ from tshub.utils.init_log import set_logger
 from TSCEnvironment.tsc_env import TSCEnvironment
 from TSCEnvironment.llm_rl_wrapper import LLMRLTSCWrapper
 from TSCAgent.tsc_agent import TSCAgent
+from TSCAgent.callback_handler import DeadlineExceeded
 from TSCAgent.output_parse import OutputParse
+from TSCAgent.decision_cache import DecisionCache, get_junction_features
+from TSCAgent.tool_cache import ToolCache
+from TSCAgent.async_agent import AsyncTSCAgent
+from TSCAgent.long_tail_gate import LongTailGate
+from TSCAgent.decision_metrics import DecisionMetricsCallback
 from TSCAgent.custom_tools import (
     GetAvailableActions, 
     GetCurrentOccupancy,
@@ -31,9 +48,13 @@ from TSCAgent.custom_tools import (
     GetIntersectionLayout,
     GetSignalPhaseStructure,
     GetTraditionalDecision,
-    GetJunctionSituation
+    GetJunctionSituation,
+    GetJunctionSnapshot
 )
+from TSCPrompt.llm_rl_prompt import AGENT_MESSAGES
 from utils.readConfig import read_config
+from utils.llm_client import LLMClientPool
+from TSCRL.rl_utils.policy_service import PolicyClient
 
 langchain.debug = False # 开启详细的显示
 path_convert = get_abs_path(__file__)
@@ -46,6 +67,23 @@ if __name__ == '__main__':
     parser.add_argument('--phase_num', type=int, default=4, help='Phase number')
     parser.add_argument('--edge_block', type=str, default=None, help='Edge block')
     parser.add_argument('--detector_break', type=str, default=None, help='Detector break')
+    parser.add_argument('--decision_cache', type=str, default=None, help='SQLite file of the decision cache, disabled if None')
+    parser.add_argument('--cache_threshold', type=float, default=0.05, help='Reuse a cached decision when the similarity score is below it')
+    parser.add_argument('--async_llm', action='store_true', help='Run the LLM agent in a worker thread while the simulation continues with RL actions')
+    parser.add_argument('--metrics_path', type=str, default=None, help='Write per-decision latency/token metrics to <path>.csv and <path>.jsonl')
+    parser.add_argument('--prompt_mode', type=str, default='tools', choices=['tools', 'snapshot'], help='Call the tools one by one, or one Get Junction Snapshot')
+    parser.add_argument('--prompt_encoding', type=str, default='full', choices=['full', 'compact'], help='Encoding of the tool outputs, compact uses fewer tokens')
+    parser.add_argument('--long_tail_gate', action='store_true', help='Only call the LLM agent in long-tail scenarios, use RL otherwise')
+    parser.add_argument('--occ_threshold', type=float, default=None, help='Occupancy (0-1) above which the gate escalates to the LLM')
+    parser.add_argument('--occ_jump', type=float, default=None, help='Occupancy change between decisions above which the gate escalates to the LLM')
+    parser.add_argument('--deadline', type=float, default=None, help='Wall-clock budget (s) of one agent decision')
+    parser.add_argument('--token_budget', type=int, default=None, help='Token budget of one agent decision')
+    parser.add_argument('--policy_address', type=str, default=None, help='host:port of a policy service (TSCRL/rl_utils/policy_service.py), load the model in-process if None. The authkey comes from TSC_POLICY_AUTHKEY or the key file written by the service')
+    parser.add_argument('--rl_backend', type=str, default='sb3', choices=['sb3', 'numpy', 'numpy-stream', 'numpy-recurrent'], help='numpy runs the PPO policy without torch, numpy-stream/numpy-recurrent carry the LSTM state across decisions')
+    parser.add_argument('--llm_rpm', type=float, default=None, help='Max LLM requests per minute, unlimited if None')
+    parser.add_argument('--llm_tpm', type=float, default=None, help='Max LLM tokens per minute, unlimited if None')
+    parser.add_argument('--llm_concurrency', type=int, default=8, help='Max concurrent LLM requests')
+    parser.add_argument('--max_staleness', type=float, default=10, help='Discard async LLM decisions older than this (sim seconds)')
 
     args = parser.parse_args()
     env_name = args.env_name # 3way, 4way
@@ -55,16 +93,15 @@ if __name__ == '__main__':
 
     # Init Chat
     config = read_config()
-    openai_proxy = config['OPENAI_PROXY']
-    openai_api_key = config['OPENAI_API_KEY']
-    openai_api_base = config['OPENAI_API_BASE']
-    chat = ChatOpenAI(
-        model=config['OPENAI_API_MODEL'], 
-        temperature=0.0,
-        openai_api_key=openai_api_key, 
-        openai_proxy=openai_proxy,
-        openai_api_base=openai_api_base,
+    llm_pool = LLMClientPool.from_config(
+        config, rpm=args.llm_rpm, tpm=args.llm_tpm, max_concurrency=args.llm_concurrency
+    ) # Agent 与 OutputParse 共享连接, 限流与重试
+    chat = llm_pool.chat(
+        caller='agent',
+        request_timeout=args.deadline, # TSCAgent 在每次请求前改为剩余的时间
+        max_retries=0 if args.deadline is not None else 6, # 有预算时不重试
     )
+    parse_chat = llm_pool.chat(caller='parser')
 
     # Init scenario
     route_type = 'vehicle' # vehicle_pedestrian
@@ -86,27 +123,58 @@ if __name__ == '__main__':
     tsc_wrapper = LLMRLTSCWrapper(
         env=tsc_scenario, 
         tls_id='J1',
-        phase_num=phase_num # 相位数量
+        phase_num=phase_num, # 相位数量
+        prompt_encoding=args.prompt_encoding,
+        policy=None if args.policy_address is None else PolicyClient(
+            (args.policy_address.split(':')[0], int(args.policy_address.split(':')[1]))
+        ), # 多个进程共用一个模型
+        rl_backend=args.rl_backend
     )
 
     # Init Agent
-    o_parse = OutputParse(env=None, llm=chat)
-    tools = [
-        GetIntersectionLayout(env=tsc_wrapper),
-        GetSignalPhaseStructure(env=tsc_wrapper),
-        GetCurrentOccupancy(env=tsc_wrapper),
-        GetPreviousOccupancy(env=tsc_wrapper),
-        GetTraditionalDecision(env=tsc_wrapper),
-        GetAvailableActions(env=tsc_wrapper),
-        GetJunctionSituation(env=tsc_wrapper),
-    ]
-    tsc_agent = TSCAgent(env=tsc_wrapper, llm=chat, tools=tools, verbose=True)
+    o_parse = OutputParse(env=tsc_wrapper, llm=parse_chat) # 本地解析失败时才调用 LLM
+    tool_cache = ToolCache(env=tsc_wrapper) # 同一个决策时刻内, 重复的 tool 调用直接返回结果
+    if args.prompt_mode == 'snapshot':
+        tool_classes = [GetJunctionSnapshot] # 一次获得所有的信息
+    else:
+        tool_classes = [
+            GetIntersectionLayout,
+            GetSignalPhaseStructure,
+            GetCurrentOccupancy,
+            GetPreviousOccupancy,
+            GetTraditionalDecision,
+            GetAvailableActions,
+            GetJunctionSituation,
+        ]
+    tools = [tool(env=tsc_wrapper, cache=tool_cache) for tool in tool_classes]
+    decision_metrics = DecisionMetricsCallback(
+        output_path=None if args.metrics_path is None else path_convert(args.metrics_path)
+    ) # 每次决策的耗时与 token
+    agent_kwargs = dict(
+        deadline=args.deadline, token_budget=args.token_budget,
+        agent_message=AGENT_MESSAGES[args.prompt_mode],
+        metrics=decision_metrics
+    )
+    tsc_agent = None if args.async_llm else TSCAgent(
+        env=tsc_wrapper, llm=chat, tools=tools, verbose=True, **agent_kwargs
+    )
+    decision_cache = None if args.decision_cache is None else DecisionCache(
+        database=path_convert(args.decision_cache), threshold=args.cache_threshold
+    ) # 相似场景直接复用之前的决策
+    long_tail_gate = None if not args.long_tail_gate else LongTailGate(
+        occ_threshold=args.occ_threshold, occ_jump=args.occ_jump
+    ) # 普通场景直接使用 RL
+    async_agent = None if not args.async_llm else AsyncTSCAgent(
+        llm=chat, tools=tool_classes, parser_llm=parse_chat, long_tail_gate=long_tail_gate,
+        max_staleness=args.max_staleness, **agent_kwargs
+    ) # tools 绑定在决策时刻的快照上
 
     # Start Simulation
     dones = False
     sim_step = 0
     phase_id = 0 # 当前动作 id
     last_step_explanation = "" # 作出决策的原因
+    last_step_source = 'random' # 决策的来源, 只有 LLM 的决策有解释
     states = tsc_wrapper.reset()
     while not dones:
         if (sim_step > 150) and (sim_step < 300):
@@ -124,23 +192,88 @@ if __name__ == '__main__':
                 else:
                     tsc_wrapper.set_occ_missing(not_work_element='')
             
-            agent_response = tsc_agent.agent_run(
-                sim_step=sim_step, 
-                last_step_action=phase_id, # 上一步的动作
-                last_step_explanation=last_step_explanation # 上一步的解释
-            ) # 让 LLM Agent 来回答问题
-            print(f'Parser Output, {agent_response}')
-            agent_action = o_parse.parser_output(agent_response)
-            phase_id = agent_action['phase_id']
-            last_step_explanation = agent_action['explanation']
+            escalate = (long_tail_gate is None) or long_tail_gate.should_escalate(tsc_wrapper)
+            junction_features = None if (decision_cache is None) or (not escalate) else get_junction_features(tsc_wrapper)
+            cached_decision = None if junction_features is None else decision_cache.lookup(junction_features)
+            if not escalate:
+                phase_id = int(tsc_wrapper.get_rl_decision()) # 不是长尾场景, 直接使用 RL 的动作
+                last_step_explanation, last_step_source = "", 'rl'
+            elif cached_decision is not None:
+                phase_id, last_step_explanation = cached_decision
+                last_step_source = 'cache'
+            elif async_agent is not None:
+                rl_action = None
+                async_decision = async_agent.poll(sim_step)
+                if async_decision is not None:
+                    phase_id, last_step_explanation, last_step_source, submit_features = async_decision # 超过预算时是 fallback 的动作
+                    if (decision_cache is not None) and (last_step_source == 'llm'):
+                        decision_cache.insert(submit_features, phase_id, last_step_explanation)
+                else:
+                    rl_action = int(tsc_wrapper.get_rl_decision())
+                    phase_id = rl_action # LLM 还没有结果, 使用 RL 的动作
+                    last_step_explanation, last_step_source = "", 'rl'
+                async_agent.submit(
+                    env=tsc_wrapper, sim_step=sim_step,
+                    last_step_action=phase_id, last_step_explanation=last_step_explanation,
+                    rl_decision=rl_action, context=junction_features, last_step_source=last_step_source
+                ) # 上一个请求没有结束时不会提交
+            else:
+                llm_start_time = time.perf_counter()
+                try:
+                    agent_response = tsc_agent.agent_run(
+                        sim_step=sim_step, 
+                        last_step_action=phase_id, # 上一步的动作
+                        last_step_explanation=last_step_explanation, # 上一步的解释
+                        last_step_source=last_step_source # 上一步的动作是否来自 LLM
+                    ) # 让 LLM Agent 来回答问题
+                except DeadlineExceeded as e:
+                    phase_id, last_step_explanation, last_step_source = tsc_agent.fallback_decision(o_parse, e.partial_output) # 超过预算
+                    decision_metrics.end_decision(action=phase_id, source=f'fallback-{last_step_source}')
+                else:
+                    if long_tail_gate is not None:
+                        long_tail_gate.record_llm_latency(time.perf_counter()-llm_start_time)
+                    print(f'Parser Output, {agent_response}')
+                    agent_action = o_parse.parser_output(agent_response, callbacks=[decision_metrics]) # LLM 解析也计入这次决策
+                    phase_id = int(agent_action['phase_id'])
+                    last_step_explanation = agent_action['explanation']
+                    last_step_source = 'llm'
+                    decision_metrics.end_decision(action=phase_id, source='llm')
+                    if decision_cache is not None:
+                        decision_cache.insert(
+                            junction_features, phase_id, last_step_explanation, 
+                            llm_latency=time.perf_counter()-llm_start_time
+                        )
         elif sim_step < 150:
             phase_id = np.random.randint(phase_num) # 随机选择相位
+            last_step_explanation, last_step_source = "", 'random'
         else:
             action = tsc_wrapper.get_rl_decision() # 获得强化学习的动作
             phase_id = int(action)
+            last_step_explanation, last_step_source = "", 'rl'
+            if (async_agent is not None) and async_agent.busy:
+                async_agent.poll(sim_step, apply=False) # 窗口结束之后完成的结果, 计入 discarded
 
         state, rewards, truncated, dones, infos = tsc_wrapper.step(action=phase_id)
         sim_step = infos['step_time']
         print(f'---\nSim Time, {sim_step}\n---')
     
+    logger.info(f'SIM: Tool cache, {tool_cache.stats()}')
+    logger.info(f'SIM: Deadline misses, {(tsc_agent or async_agent.agent).deadline_summary()}')
+    logger.info(f'SIM: Decision metrics, {decision_metrics.summary()}')
+    decision_metrics.close()
+    if long_tail_gate is not None:
+        logger.info(f'SIM: Long-tail gate, {long_tail_gate.stats()}')
+    if async_agent is not None:
+        async_agent.close(sim_step) # 不等待正在运行的请求
+        logger.info(f'SIM: Async agent, {async_agent.stats()}')
+    logger.info(f'SIM: Output parse fallback rate, {o_parse.fallback_rate():.2%} ({o_parse.num_fallback}/{o_parse.num_parse})')
+    if decision_cache is not None:
+        logger.info(f'SIM: Decision cache, {decision_cache.stats()}')
+        decision_cache.close()
+    llm_pool.log_stats()
+    llm_pool.close()
+    if tsc_wrapper.stream_policy is not None:
+        logger.info(f'SIM: Stream policy, steps {tsc_wrapper.stream_policy.num_steps}, resyncs {tsc_wrapper.stream_policy.num_resyncs}')
+    if tsc_wrapper.policy is not None and args.policy_address is None: # numpy-stream/numpy-recurrent 时 policy 为 None
+        logger.info(f'SIM: Policy service, {tsc_wrapper.policy.stats()}')
     tsc_wrapper.close()
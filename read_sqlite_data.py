@@ -2,30 +2,43 @@
 @Author: WANG Maonan
 @Date: 2023-09-19 16:48:27
 @Description: 读取 SQLite 的数据, 并计算相似度, 数字越小越相似
-@LastEditTime: 2023-09-19 20:54:26
++ 所有记录的特征只计算一次 (JunctionSimilarityIndex), 每次查询是一次向量化的距离计算
++ 旧版本的数据库 (junctionINFO) 会直接解析, 也可以先使用 utils/junction_database.py 进行转换
+@LastEditTime: 2026-10-18 15:40:12
 '''
 import sqlite3
 from tshub.utils.get_abs_path import get_abs_path
-from utils.junction_similarity import calculate_similarity, find_min_indices
-from utils.convert_sql2description import convert_description
+from utils.junction_database import SCHEMA_VERSION, get_schema_version, load_decisions
+from utils.similarity_index import JunctionSimilarityIndex
 
 path_convert = get_abs_path(__file__)
 
 if __name__ == '__main__':
     database_path = path_convert("./junction.db")
     connection = sqlite3.connect(database_path)
-    cursor = connection.cursor()
+    schema_version = get_schema_version(connection)
 
-    rows = cursor.execute("SELECT * FROM junctionINFO;").fetchall()
-    scenario_anchor = rows[20]
-    similarity_score_list = list()
-    anchor_similarity = calculate_similarity(scenario_anchor)
-    for row_index, _scenario in enumerate(rows):
-        similarity_score = anchor_similarity(_scenario)
+    if schema_version < SCHEMA_VERSION:
+        rows = connection.execute("SELECT * FROM junctionINFO;").fetchall()
+        similarity_index = JunctionSimilarityIndex.from_legacy_rows(rows)
+        descriptions = [f'Junction {row[0]}, Frame {row[1]}, Action {row[8]}, Explanation {row[7]}' for row in rows]
+    else:
+        decisions = load_decisions(database_path)
+        similarity_index = JunctionSimilarityIndex.from_decisions(decisions)
+        descriptions = [
+            f'Junction {junction_id}, Frame {frame}, Action {action}, Explanation {explanation}'
+            for junction_id, frame, action, explanation in zip(
+                decisions['junction_id'], decisions['frame'], decisions['action'], decisions['explanation']
+            )
+        ]
+    connection.close()
+
+    scenario_anchor = 20
+    similarity_score_list = similarity_index.scores_of(scenario_anchor)
+    for row_index, similarity_score in enumerate(similarity_score_list):
         print(f'Index, {row_index}; Similarity Score, {similarity_score}')
-        similarity_score_list.append(similarity_score)
-    
+
     # 找出最接近的前 n 个例子
-    similarity_indexs = find_min_indices(similarity_score_list, 2)
+    similarity_indexs, _ = similarity_index.query_index(scenario_anchor, k=2)
     for _i in similarity_indexs:
-        print(convert_description(rows[_i])) # 将 sql 内容转换为场景的描述
\ No newline at end of file
+        print(descriptions[_i]) # 场景的描述
@@ -0,0 +1,86 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 23:14:52
+@Description: 比较 N 个 worker 进程各自解析模型 zip 与使用 model_cache 的 memmap
++ cold start, worker 中导入模型的时间 (不包括 import)
++ 内存, 所有 worker 的模型权重占用的私有内存 (Linux, /proc/self/smaps) 与共享内存
+-> python benchmark_model_cache.py --phase_num 4 --num_workers 1 8 32
+@LastEditTime: 2026-10-18 23:14:52
+'''
+import sys
+from pathlib import Path
+
+parent_directory = Path(__file__).resolve().parent.parent
+if str(parent_directory) not in sys.path:
+    sys.path.insert(0, str(parent_directory))
+
+import time
+import argparse
+import multiprocessing as mp
+from tshub.utils.get_abs_path import get_abs_path
+
+path_convert = get_abs_path(__file__)
+
+
+def weight_memory_kb() -> tuple:
+    """(private, shared) kB, 只统计匿名内存和 weights.bin 的映射
+    """
+    private, shared, in_region = 0, 0, False
+    with open('/proc/self/smaps') as f:
+        for line in f:
+            fields = line.split()
+            if '-' in fields[0] and not fields[0].endswith(':'): # 新的映射区域
+                in_region = len(fields) < 6 or fields[-1].endswith('weights.bin') or fields[-1] == '[heap]'
+            elif in_region and fields[0] in ('Private_Clean:', 'Private_Dirty:'):
+                private += int(fields[1])
+            elif in_region and fields[0] in ('Shared_Clean:', 'Shared_Dirty:'):
+                shared += int(fields[1])
+    return private, shared
+
+
+def worker(mode:str, model_path:str, vec_normalize_path:str, barrier, results) -> None:
+    from TSCRL.rl_utils.numpy_policy import NumpyTSCPolicy # import 的时间两者相同, 不计入
+    from TSCRL.rl_utils.model_cache import load_cached_policy
+    before, _ = weight_memory_kb()
+    start_time = time.perf_counter()
+    if mode == 'zip':
+        policy = NumpyTSCPolicy.load(model_path)
+    else:
+        policy = load_cached_policy(model_path, vec_normalize_path)
+    for value in policy.weights.values(): # 读取一次所有的权重, 让 page 进入内存
+        float(value.sum())
+    load_time = time.perf_counter() - start_time
+    barrier.wait() # 所有 worker 同时存活时统计共享内存
+    private, shared = weight_memory_kb()
+    results.put((load_time, private - before, shared))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--phase_num', type=int, default=4, help='Phase number')
+    parser.add_argument('--num_workers', type=int, nargs='+', default=[1, 8, 32], help='Worker counts to compare')
+    args = parser.parse_args()
+
+    from TSCRL.rl_utils.model_cache import unpack_artifact
+    model_dir = path_convert(f'../TSCRL/result/{args.phase_num}way/choose_next_phase/models/')
+    model_path, vec_normalize_path = f'{model_dir}/last_rl_model.zip', f'{model_dir}/last_vec_normalize.pkl'
+    print(f'Artifact: {unpack_artifact(model_path, vec_normalize_path)}')
+
+    context = mp.get_context('spawn') # 与 SubprocVecEnv 相同, 每个 worker 是新的进程
+    print(f'{"mode":<8}{"workers":>8}{"load (ms)":>12}{"private (kB)":>15}{"shared (kB)":>14}')
+    for num_workers in args.num_workers:
+        for mode in ('zip', 'cache'):
+            barrier, results = context.Barrier(num_workers), context.Queue()
+            processes = [
+                context.Process(target=worker, args=(mode, model_path, vec_normalize_path, barrier, results))
+                for _ in range(num_workers)
+            ]
+            for process in processes:
+                process.start()
+            stats = [results.get() for _ in range(num_workers)]
+            for process in processes:
+                process.join()
+            load_time = sum(stat[0] for stat in stats) / num_workers * 1000
+            private = sum(stat[1] for stat in stats)
+            shared = sum(stat[2] for stat in stats) / num_workers
+            print(f'{mode:<8}{num_workers:>8}{load_time:>12.2f}{private:>15.0f}{shared:>14.0f}')
@@ -0,0 +1,87 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 21:58:40
+@Description: 比较 SB3 (torch) 与 NumpyTSCPolicy 的推理
++ startup, 新的进程中 import + 导入模型的时间
++ 一致性, 随机 observation 上 action logits 的最大误差和动作是否相同
++ latency, 单个 observation 和 batch 的推理时间 (CPU)
+-> python benchmark_numpy_policy.py --phase_num 4 --num_samples 1000
+@LastEditTime: 2026-10-18 21:58:40
+'''
+import sys
+from pathlib import Path
+
+parent_directory = Path(__file__).resolve().parent.parent
+if str(parent_directory) not in sys.path:
+    sys.path.insert(0, str(parent_directory))
+
+import time
+import argparse
+import subprocess
+import numpy as np
+from tshub.utils.get_abs_path import get_abs_path
+
+path_convert = get_abs_path(__file__)
+
+STARTUP_CODE = {
+    'sb3': "from stable_baselines3 import PPO; PPO.load({model_path!r}, device='cpu')",
+    'numpy': "from TSCRL.rl_utils.numpy_policy import NumpyTSCPolicy; NumpyTSCPolicy.load({model_path!r})",
+}
+
+
+def measure_startup(backend:str, model_path:str, repeat:int=3) -> float:
+    """新进程中 import 和导入模型的时间 (s), 取最小值
+    """
+    code = f"import time; _start = time.perf_counter(); {STARTUP_CODE[backend].format(model_path=model_path)}; print(time.perf_counter() - _start)"
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], cwd=str(parent_directory), capture_output=True, text=True, check=True)
+        times.append(float(output.stdout.strip().splitlines()[-1]))
+    return min(times)
+
+
+def measure_latency(predict, observations:np.ndarray, repeat:int) -> float:
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        predict(observations)
+    return (time.perf_counter() - start_time) / repeat * 1000 # ms
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--phase_num', type=int, default=4, help='Phase number')
+    parser.add_argument('--num_samples', type=int, default=1000, help='Random observations for the equivalence check')
+    parser.add_argument('--repeat', type=int, default=200, help='Repeats of the latency measurement')
+    args = parser.parse_args()
+
+    import torch
+    from stable_baselines3 import PPO
+    from TSCRL.rl_utils.numpy_policy import NumpyTSCPolicy
+
+    model_path = path_convert(f'../TSCRL/result/{args.phase_num}way/choose_next_phase/models/last_rl_model.zip')
+    sb3_model = PPO.load(model_path, device='cpu')
+    numpy_policy = NumpyTSCPolicy.load(model_path)
+
+    # 一致性
+    rng = np.random.default_rng(0)
+    observations = rng.random((args.num_samples, 7, 12), dtype=np.float32)
+    observations[:, 5:] = np.eye(12, dtype=np.float32)[rng.integers(0, 12, size=(args.num_samples, 2))] # phase 是 one-hot
+    with torch.no_grad():
+        obs_tensor, _ = sb3_model.policy.obs_to_tensor(observations)
+        sb3_logits = sb3_model.policy.get_distribution(obs_tensor).distribution.logits.numpy()
+    numpy_logits = numpy_policy.action_logits(observations)
+    sb3_actions, _ = sb3_model.predict(observations, deterministic=True)
+    numpy_actions, _ = numpy_policy.predict(observations)
+    # SB3 的 logits 经过 log_softmax 归一化, 比较时减去各自的 logsumexp
+    max_logits = numpy_logits.max(1, keepdims=True)
+    numpy_log_probs = numpy_logits - max_logits - np.log(np.exp(numpy_logits - max_logits).sum(1, keepdims=True))
+    print(f'Max |log prob diff|: {np.abs(sb3_logits - numpy_log_probs).max():.2e}')
+    print(f'Action agreement: {np.mean(sb3_actions == numpy_actions):.2%} ({args.num_samples} samples)')
+
+    # 延迟
+    torch.set_num_threads(1)
+    print(f'\n{"backend":<10}{"startup (s)":>14}{"single (ms)":>14}{"batch 64 (ms)":>16}')
+    for backend, predict in [('sb3', sb3_model.predict), ('numpy', numpy_policy.predict)]:
+        single = measure_latency(lambda obs: predict(obs, deterministic=True), observations[0], args.repeat)
+        batch = measure_latency(lambda obs: predict(obs, deterministic=True), observations[:64], args.repeat)
+        print(f'{backend:<10}{measure_startup(backend, model_path):>14.3f}{single:>14.3f}{batch:>16.3f}')
@@ -0,0 +1,95 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 10:12:40
+@Description: 比较 observation 组装方式每一步的内存分配
++ legacy: deque(list) -> np.array -> np.vstack -> astype
++ builder: ObservationBuilder 在预分配的 (7,12) buffer 中原地写入
+@LastEditTime: 2026-10-18 10:12:40
+'''
+import sys
+from pathlib import Path
+
+parent_directory = Path(__file__).resolve().parent.parent
+if str(parent_directory) not in sys.path:
+    sys.path.insert(0, str(parent_directory))
+
+import time
+import tracemalloc
+import numpy as np
+from collections import deque
+
+from TSCEnvironment.wrapper_utils import ObservationBuilder, OccupancyList
+
+NUM_STEPS = 2000
+SECONDS_PER_DECISION = 5 # 每一次决策之间的仿真秒数
+
+
+def make_fake_frames(num_steps:int):
+    """生成和 tshub 格式相同的数据 (list of float, list of bool)
+    """
+    rng = np.random.default_rng(0)
+    occupancy = (rng.random((num_steps, SECONDS_PER_DECISION, 12))*100).tolist()
+    phases = [[i%4==j for j in range(12)] for i in range(num_steps)]
+    return occupancy, phases
+
+
+def legacy_step(states:deque, frames, this_phase, next_phase, not_working_index):
+    elements = []
+    for frame in frames:
+        if all(isinstance(e, float) for e in frame):
+            elements.append(frame)
+    avg_occupancy = np.mean(np.array(elements), axis=0, dtype=np.float32)/100
+    states.append(avg_occupancy)
+    tsc_state = np.array(states, dtype=np.float32)
+    if not_working_index is not None:
+        tsc_state[:,not_working_index] = -1
+    one_hot_this_phase = np.array([int(value) for value in this_phase])
+    one_hot_next_phase = np.array([int(value) for value in next_phase])
+    return np.vstack((tsc_state, one_hot_this_phase[np.newaxis, :], one_hot_next_phase[np.newaxis, :])).astype(np.float32)
+
+
+def builder_step(builder:ObservationBuilder, occupancy:OccupancyList, avg_occ, frames, this_phase, next_phase, not_working_index, copy):
+    for frame in frames:
+        occupancy.add_element(frame)
+    occupancy.calculate_average(out=avg_occ)
+    builder.push_occupancy(avg_occ)
+    return builder.build(this_phase, next_phase, mask_index=not_working_index, copy=copy)
+
+
+def measure(name, step_fn, num_steps):
+    """统计每一步的耗时与临时分配的内存 (tracemalloc 只统计 Python/NumPy 通过 PyMem 的分配)
+    """
+    for i in range(10):
+        step_fn(i) # warm up
+    start_time = time.perf_counter()
+    for i in range(num_steps):
+        step_fn(i)
+    elapsed = time.perf_counter() - start_time
+
+    tracemalloc.start()
+    transient_bytes = 0
+    for i in range(num_steps):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        step_fn(i)
+        _, peak = tracemalloc.get_traced_memory()
+        transient_bytes += peak - current
+    tracemalloc.stop()
+    print(f'{name:<20} | {elapsed/num_steps*1e6:8.2f} us/step | {transient_bytes/num_steps:8.1f} bytes allocated/step')
+
+
+if __name__ == '__main__':
+    occupancy_frames, phases = make_fake_frames(NUM_STEPS)
+
+    states = deque([[0]*12]*5, maxlen=5)
+    measure('legacy', lambda i: legacy_step(states, occupancy_frames[i], phases[i], phases[i-1], 3), NUM_STEPS)
+
+    for copy in (True, False):
+        builder = ObservationBuilder(max_states=5, num_movements=12)
+        occupancy = OccupancyList(num_movements=12)
+        avg_occ = np.zeros(12, dtype=np.float32)
+        measure(
+            f'builder(copy={copy})',
+            lambda i: builder_step(builder, occupancy, avg_occ, occupancy_frames[i], phases[i], phases[i-1], 3, copy),
+            NUM_STEPS
+        )
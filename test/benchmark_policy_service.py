@@ -0,0 +1,67 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 21:32:16
+@Description: 比较 N 个路口的 RL 动作: 每个路口单独 model.predict vs PolicyService 合并成 batch
++ sequential, 每个 state 一次 model.predict
++ predict_many, 所有 state 一次 forward
++ threads, 每个路口一个线程调用 PolicyService.predict, 由服务合并成 micro-batch
+-> python benchmark_policy_service.py --phase_num 4 --num_junctions 16 --repeat 100
+@LastEditTime: 2026-10-18 21:32:16
+'''
+import sys
+from pathlib import Path
+
+parent_directory = Path(__file__).resolve().parent.parent
+if str(parent_directory) not in sys.path:
+    sys.path.insert(0, str(parent_directory))
+
+import time
+import argparse
+import threading
+import numpy as np
+from tshub.utils.get_abs_path import get_abs_path
+
+from TSCRL.rl_utils.policy_service import get_policy_service
+
+path_convert = get_abs_path(__file__)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--phase_num', type=int, default=4, help='Phase number')
+    parser.add_argument('--num_junctions', type=int, default=16, help='Number of states per decision tick')
+    parser.add_argument('--repeat', type=int, default=100, help='Number of decision ticks')
+    args = parser.parse_args()
+
+    model_path = path_convert(f'../TSCRL/result/{args.phase_num}way/choose_next_phase/models/last_rl_model.zip')
+    service = get_policy_service(model_path, max_wait=0.002)
+    rng = np.random.default_rng(0)
+    observations = [rng.random((7, 12), dtype=np.float32) for _ in range(args.num_junctions)]
+
+    start_time = time.perf_counter()
+    for _ in range(args.repeat):
+        sequential = [service.model.predict(obs, deterministic=True)[0] for obs in observations]
+    sequential_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    for _ in range(args.repeat):
+        batched = service.predict_many(observations)
+    batched_time = time.perf_counter() - start_time
+
+    threaded = [None] * args.num_junctions
+    def _predict(index:int) -> None:
+        for _ in range(args.repeat):
+            threaded[index] = service.predict(observations[index])
+    threads = [threading.Thread(target=_predict, args=(i,)) for i in range(args.num_junctions)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    threaded_time = time.perf_counter() - start_time
+
+    assert np.array_equal(np.array(sequential), batched) and np.array_equal(batched, np.array(threaded))
+    print(f'{"mode":<15}{"ms / tick":>12}')
+    for mode, elapsed in [('sequential', sequential_time), ('predict_many', batched_time), ('threads', threaded_time)]:
+        print(f'{mode:<15}{elapsed/args.repeat*1000:>12.3f}')
+    print(service.stats())
@@ -0,0 +1,142 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 20:40:05
+@Description: 比较 full 和 compact 两种编码每个 prompt 的 token 数量
++ 在相同的决策时刻, 分别统计每个 tool 的输出, 7 个 tools 的总和, 以及 Get Junction Snapshot 的 token
++ --llm 时, 两种编码分别运行 snapshot 模式的 Agent, 比较耗时与决策是否一致
+仿真使用 RL 的动作推进
+-> python benchmark_prompt_encoding.py --env_name '4way' --phase_num 4 --num_decisions 20
+-> python benchmark_prompt_encoding.py --env_name '4way' --phase_num 4 --num_decisions 5 --llm
+@LastEditTime: 2026-10-18 20:40:05
+'''
+import sys
+from pathlib import Path
+
+parent_directory = Path(__file__).resolve().parent.parent
+if str(parent_directory) not in sys.path:
+    sys.path.insert(0, str(parent_directory))
+
+import time
+import argparse
+import numpy as np
+from loguru import logger
+from tshub.utils.get_abs_path import get_abs_path
+
+from TSCEnvironment.tsc_env import TSCEnvironment
+from TSCEnvironment.llm_rl_wrapper import LLMRLTSCWrapper
+from TSCAgent.custom_tools import (
+    GetAvailableActions,
+    GetCurrentOccupancy,
+    GetPreviousOccupancy,
+    GetIntersectionLayout,
+    GetSignalPhaseStructure,
+    GetTraditionalDecision,
+    GetJunctionSituation,
+    GetJunctionSnapshot
+)
+from TSCPrompt.compact_encoding import CompactEncoder, count_tokens
+
+path_convert = get_abs_path(__file__)
+logger.remove()
+
+TOOL_CLASSES = [
+    GetIntersectionLayout, GetSignalPhaseStructure, GetCurrentOccupancy, GetPreviousOccupancy,
+    GetTraditionalDecision, GetAvailableActions, GetJunctionSituation
+]
+ENCODINGS = ['full', 'compact']
+
+
+def set_encoding(tsc_wrapper, encoding:str) -> None:
+    tsc_wrapper.prompt_encoding = encoding
+    tsc_wrapper.prompt_encoder = CompactEncoder() if encoding == 'compact' else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--env_name', type=str, default='4way', help='Environment name')
+    parser.add_argument('--phase_num', type=int, default=4, help='Phase number')
+    parser.add_argument('--num_decisions', type=int, default=20, help='Number of decision steps')
+    parser.add_argument('--warmup', type=float, default=150, help='Sim seconds driven by RL before the benchmark')
+    parser.add_argument('--llm', action='store_true', help='Also run the snapshot agent with both encodings')
+    args = parser.parse_args()
+
+    tsc_scenario = TSCEnvironment(
+        sumo_cfg=path_convert(f"../TSCScenario/{args.env_name}/env/vehicle.sumocfg"),
+        net_file=path_convert(f"../TSCScenario/{args.env_name}/env/{args.env_name}.net.xml"),
+        trip_info=path_convert(f'./{args.env_name}_benchmark_encoding.tripinfo.xml'),
+        num_seconds=args.warmup + 10*args.num_decisions + 100,
+        tls_id='J1',
+        tls_action_type='choose_next_phase',
+        use_gui=False,
+    )
+    tsc_wrapper = LLMRLTSCWrapper(env=tsc_scenario, tls_id='J1', phase_num=args.phase_num)
+    tools = [tool(env=tsc_wrapper) for tool in TOOL_CLASSES]
+    snapshot_tool = GetJunctionSnapshot(env=tsc_wrapper)
+    tool_tokens = {encoding: {tool.inference.name: [] for tool in tools} for encoding in ENCODINGS}
+    snapshot_tokens = {encoding: [] for encoding in ENCODINGS}
+
+    agents, o_parse = {}, None
+    llm_results = {encoding: {'prompt_tokens': [], 'wall_time': [], 'phase_id': []} for encoding in ENCODINGS}
+    if args.llm:
+        from langchain.chat_models import ChatOpenAI
+        from TSCAgent.tsc_agent import TSCAgent
+        from TSCAgent.output_parse import OutputParse
+        from TSCAgent.decision_metrics import DecisionMetricsCallback
+        from TSCPrompt.llm_rl_prompt import AGENT_MESSAGE_SNAPSHOT
+        from utils.readConfig import read_config
+
+        config = read_config()
+        metrics = DecisionMetricsCallback(summary_every=0)
+        chat = ChatOpenAI(
+            model=config['OPENAI_API_MODEL'],
+            temperature=0.0,
+            openai_api_key=config['OPENAI_API_KEY'],
+            openai_proxy=config['OPENAI_PROXY'],
+            openai_api_base=config['OPENAI_API_BASE'],
+        )
+        o_parse = OutputParse(env=tsc_wrapper, llm=chat)
+        agent = TSCAgent(
+            env=tsc_wrapper, llm=chat, verbose=False, metrics=metrics,
+            tools=[snapshot_tool], agent_message=AGENT_MESSAGE_SNAPSHOT
+        ) # 同一个 Agent, 只切换 wrapper 的编码
+
+    tsc_wrapper.reset()
+    sim_step, dones, num_decisions = 0, False, 0
+    while (not dones) and (num_decisions < args.num_decisions):
+        if sim_step >= args.warmup:
+            for encoding in ENCODINGS:
+                set_encoding(tsc_wrapper, encoding)
+                for tool in tools:
+                    tool_tokens[encoding][tool.inference.name].append(count_tokens(tool.inference('J1')))
+                set_encoding(tsc_wrapper, encoding) # snapshot 单独使用时输出完整的静态信息
+                snapshot_tokens[encoding].append(count_tokens(snapshot_tool.inference('J1')))
+
+                if args.llm:
+                    set_encoding(tsc_wrapper, encoding)
+                    start_time = time.perf_counter()
+                    agent.memory.clear() # 两种编码的 prompt 中不包含对方的决策
+                    agent_response = agent.agent_run(sim_step=sim_step, last_step_action=0, last_step_explanation="")
+                    agent_action = o_parse.parser_output(agent_response)
+                    record = metrics.end_decision(action=agent_action['phase_id'], source=encoding)
+                    llm_results[encoding]['wall_time'].append(time.perf_counter() - start_time)
+                    llm_results[encoding]['prompt_tokens'].append(record['prompt_tokens'])
+                    llm_results[encoding]['phase_id'].append(agent_action['phase_id'])
+            num_decisions += 1
+        _, _, _, dones, infos = tsc_wrapper.step(action=int(tsc_wrapper.get_rl_decision()))
+        sim_step = infos['step_time']
+    tsc_wrapper.close()
+
+    print(f'{"prompt":<30}{"full":>10}{"compact":>10}{"saving":>10}')
+    rows = [(name, tool_tokens['full'][name], tool_tokens['compact'][name]) for name in tool_tokens['full']]
+    rows.append(('7 tools (total)', *[np.sum(list(tool_tokens[encoding].values()), axis=0) for encoding in ENCODINGS]))
+    rows.append(('Get Junction Snapshot', snapshot_tokens['full'], snapshot_tokens['compact']))
+    for name, full_tokens, compact_tokens in rows:
+        full_mean, compact_mean = np.mean(full_tokens), np.mean(compact_tokens)
+        print(f'{name:<30}{full_mean:>10.1f}{compact_mean:>10.1f}{1-compact_mean/full_mean:>10.1%}')
+
+    if args.llm:
+        agreement = np.mean(np.array(llm_results['full']['phase_id']) == np.array(llm_results['compact']['phase_id']))
+        print(f'\n{"encoding":<10}{"prompt tokens":>16}{"wall time (s)":>16}')
+        for encoding, result in llm_results.items():
+            print(f'{encoding:<10}{np.mean(result["prompt_tokens"]):>16.0f}{np.mean(result["wall_time"]):>16.2f}')
+        print(f'Decision agreement (full vs compact): {agreement:.1%}')
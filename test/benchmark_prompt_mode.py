@@ -0,0 +1,138 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 19:10:33
+@Description: 比较两种 prompt 模式每次决策的 LLM 调用次数与 token 数量
++ tools: 逐个调用 7 个 tools (AGENT_MESSAGE)
++ snapshot: 只调用一次 Get Junction Snapshot (AGENT_MESSAGE_SNAPSHOT)
+两种模式在相同的决策时刻 (相同的仿真状态) 上运行, 仿真使用 RL 的动作推进
+-> python benchmark_prompt_mode.py --env_name '4way' --phase_num 4 --num_decisions 5
+@LastEditTime: 2026-10-18 19:10:33
+'''
+import sys
+from pathlib import Path
+
+parent_directory = Path(__file__).resolve().parent.parent
+if str(parent_directory) not in sys.path:
+    sys.path.insert(0, str(parent_directory))
+
+import time
+import argparse
+import numpy as np
+from typing import Any
+from loguru import logger
+from langchain.chat_models import ChatOpenAI
+from langchain.callbacks.base import BaseCallbackHandler
+from tshub.utils.get_abs_path import get_abs_path
+
+from TSCEnvironment.tsc_env import TSCEnvironment
+from TSCEnvironment.llm_rl_wrapper import LLMRLTSCWrapper
+from TSCAgent.tsc_agent import TSCAgent
+from TSCAgent.output_parse import OutputParse
+from TSCAgent.custom_tools import (
+    GetAvailableActions,
+    GetCurrentOccupancy,
+    GetPreviousOccupancy,
+    GetIntersectionLayout,
+    GetSignalPhaseStructure,
+    GetTraditionalDecision,
+    GetJunctionSituation,
+    GetJunctionSnapshot
+)
+from TSCPrompt.llm_rl_prompt import AGENT_MESSAGES
+from utils.readConfig import read_config
+
+path_convert = get_abs_path(__file__)
+logger.remove()
+
+TOOL_CLASSES = {
+    'tools': [
+        GetIntersectionLayout, GetSignalPhaseStructure, GetCurrentOccupancy, GetPreviousOccupancy,
+        GetTraditionalDecision, GetAvailableActions, GetJunctionSituation
+    ],
+    'snapshot': [GetJunctionSnapshot],
+}
+
+
+class LLMUsageCallback(BaseCallbackHandler):
+    """统计 LLM 的调用次数与 token
+    """
+    def __init__(self) -> None:
+        super().__init__()
+        self.reset()
+
+    def reset(self) -> None:
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def on_llm_end(self, response, **kwargs: Any) -> None:
+        token_usage = (response.llm_output or {}).get('token_usage', {})
+        self.calls += 1
+        self.prompt_tokens += token_usage.get('prompt_tokens', 0)
+        self.completion_tokens += token_usage.get('completion_tokens', 0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--env_name', type=str, default='4way', help='Environment name')
+    parser.add_argument('--phase_num', type=int, default=4, help='Phase number')
+    parser.add_argument('--num_decisions', type=int, default=5, help='Number of decisions for each mode')
+    parser.add_argument('--warmup', type=float, default=150, help='Sim seconds driven by RL before the benchmark')
+    args = parser.parse_args()
+
+    config = read_config()
+    usage_callback = LLMUsageCallback()
+    chat = ChatOpenAI(
+        model=config['OPENAI_API_MODEL'],
+        temperature=0.0,
+        openai_api_key=config['OPENAI_API_KEY'],
+        openai_proxy=config['OPENAI_PROXY'],
+        openai_api_base=config['OPENAI_API_BASE'],
+        callbacks=[usage_callback],
+    )
+
+    tsc_scenario = TSCEnvironment(
+        sumo_cfg=path_convert(f"../TSCScenario/{args.env_name}/env/vehicle.sumocfg"),
+        net_file=path_convert(f"../TSCScenario/{args.env_name}/env/{args.env_name}.net.xml"),
+        trip_info=path_convert(f'./{args.env_name}_benchmark_prompt.tripinfo.xml'),
+        num_seconds=args.warmup + 10*args.num_decisions + 100,
+        tls_id='J1',
+        tls_action_type='choose_next_phase',
+        use_gui=False,
+    )
+    tsc_wrapper = LLMRLTSCWrapper(env=tsc_scenario, tls_id='J1', phase_num=args.phase_num)
+    o_parse = OutputParse(env=tsc_wrapper, llm=chat)
+    agents = {
+        mode: TSCAgent(
+            env=tsc_wrapper, llm=chat, verbose=False,
+            tools=[tool(env=tsc_wrapper) for tool in tool_classes],
+            agent_message=AGENT_MESSAGES[mode]
+        ) for mode, tool_classes in TOOL_CLASSES.items()
+    }
+    results = {mode: {'calls': [], 'prompt_tokens': [], 'completion_tokens': [], 'wall_time': []} for mode in agents}
+
+    tsc_wrapper.reset()
+    sim_step, dones, num_decisions = 0, False, 0
+    while (not dones) and (num_decisions < args.num_decisions):
+        if sim_step >= args.warmup:
+            for mode, tsc_agent in agents.items():
+                usage_callback.reset()
+                start_time = time.perf_counter()
+                agent_response = tsc_agent.agent_run(sim_step=sim_step, last_step_action=0, last_step_explanation="")
+                agent_action = o_parse.parser_output(agent_response)
+                results[mode]['wall_time'].append(time.perf_counter() - start_time)
+                results[mode]['calls'].append(usage_callback.calls)
+                results[mode]['prompt_tokens'].append(usage_callback.prompt_tokens)
+                results[mode]['completion_tokens'].append(usage_callback.completion_tokens)
+                print(f'{sim_step}s, {mode}, Phase {agent_action["phase_id"]}, {usage_callback.calls} LLM calls')
+            num_decisions += 1
+        _, _, _, dones, infos = tsc_wrapper.step(action=int(tsc_wrapper.get_rl_decision()))
+        sim_step = infos['step_time']
+    tsc_wrapper.close()
+
+    print(f'{"mode":<10}{"LLM calls":>12}{"prompt tokens":>16}{"completion tokens":>20}{"wall time (s)":>16}')
+    for mode, result in results.items():
+        print(
+            f'{mode:<10}{np.mean(result["calls"]):>12.2f}{np.mean(result["prompt_tokens"]):>16.0f}'
+            f'{np.mean(result["completion_tokens"]):>20.0f}{np.mean(result["wall_time"]):>16.2f}'
+        )
@@ -0,0 +1,87 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 11:48:05
+@Description: 比较两种推进仿真的方式的速度 (仿真秒数 / 实际秒数)
++ wrapper loop: 每一秒都经过 gym.Wrapper.step -> TSCEnvironment.step, 并在 wrapper 中处理 state
++ step_until_decision: 在 TSCEnvironment 内部推进到决策点, 只累计 occupancy 与 waiting time
+@LastEditTime: 2026-10-18 11:48:05
+'''
+import sys
+from pathlib import Path
+
+parent_directory = Path(__file__).resolve().parent.parent
+if str(parent_directory) not in sys.path:
+    sys.path.insert(0, str(parent_directory))
+
+import time
+import numpy as np
+from loguru import logger
+from tshub.utils.get_abs_path import get_abs_path
+
+from TSCEnvironment.tsc_env import TSCEnvironment
+from TSCEnvironment.base_tsc_wrapper import BaseTSCEnvWrapper
+
+path_convert = get_abs_path(__file__)
+logger.remove()
+
+
+def wrapper_loop_step(tsc_wrapper:BaseTSCEnvWrapper, action:int):
+    """之前 BaseTSCEnvWrapper.step 中逐秒推进的方式
+    """
+    action = {tsc_wrapper.tls_id: action}
+    can_perform_action = False
+    sim_steps = 0
+    while not can_perform_action:
+        states, rewards, truncated, dones, infos = super(BaseTSCEnvWrapper, tsc_wrapper).step(action)
+        occupancy, can_perform_action, _, _ = tsc_wrapper.state_wrapper(state=states)
+        tsc_wrapper.occupancy.add_element(occupancy)
+        sim_steps += 1
+        if dones:
+            break
+    tsc_wrapper.occupancy.calculate_average()
+    return dones, sim_steps
+
+
+def fused_step(tsc_wrapper:BaseTSCEnvWrapper, action:int):
+    """使用 step_until_decision 推进
+    """
+    states, rewards, truncated, dones, infos = tsc_wrapper.env.step_until_decision(
+        {tsc_wrapper.tls_id: action}, occupancy=tsc_wrapper.occupancy
+    )
+    tsc_wrapper.occupancy.calculate_average()
+    return dones, infos['sim_steps']
+
+
+def run(step_fn, env_name:str, phase_num:int, num_seconds:int) -> float:
+    sumo_cfg = path_convert(f"../TSCScenario/{env_name}/env/vehicle.sumocfg")
+    net_file = path_convert(f"../TSCScenario/{env_name}/env/{env_name}.net.xml")
+    tsc_scenario = TSCEnvironment(
+        sumo_cfg=sumo_cfg,
+        net_file=net_file,
+        trip_info=None,
+        num_seconds=num_seconds,
+        tls_id='J1',
+        tls_action_type='choose_next_phase',
+        use_gui=False,
+    )
+    tsc_wrapper = BaseTSCEnvWrapper(env=tsc_scenario, tls_id='J1', phase_num=phase_num)
+    tsc_wrapper.reset()
+
+    rng = np.random.default_rng(0)
+    dones = False
+    total_sim_steps = 0
+    start_time = time.perf_counter()
+    while not dones:
+        dones, sim_steps = step_fn(tsc_wrapper, int(rng.integers(phase_num)))
+        total_sim_steps += sim_steps
+    elapsed = time.perf_counter() - start_time
+    tsc_wrapper.close()
+    return total_sim_steps / elapsed
+
+
+if __name__ == '__main__':
+    env_name, phase_num, num_seconds = '4way', 4, 1000
+    loop_sps = run(wrapper_loop_step, env_name, phase_num, num_seconds)
+    fused_sps = run(fused_step, env_name, phase_num, num_seconds)
+    print(f'wrapper loop        | {loop_sps:8.1f} sim steps/s')
+    print(f'step_until_decision | {fused_sps:8.1f} sim steps/s ({fused_sps/loop_sps:.2f}x)')
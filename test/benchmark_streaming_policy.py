@@ -0,0 +1,82 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 22:24:03
+@Description: 比较窗口的 LSTM (每次处理 max_states 帧) 与流式的 LSTM (StreamingTSCPolicy)
++ 使用 ObservationBuilder 生成一个 episode 的 observation, 中间有一段探测器损坏 (mask)
++ exact, action logits 与窗口模型的最大误差
++ recurrent, 与窗口模型动作相同的比例
++ latency, 每个决策的推理时间, 不同的 max_states
+-> python benchmark_streaming_policy.py --phase_num 4 --num_steps 2000 --max_states 5 8 16
+@LastEditTime: 2026-10-18 22:24:03
+'''
+import sys
+from pathlib import Path
+
+parent_directory = Path(__file__).resolve().parent.parent
+if str(parent_directory) not in sys.path:
+    sys.path.insert(0, str(parent_directory))
+
+import time
+import argparse
+import numpy as np
+from tshub.utils.get_abs_path import get_abs_path
+
+from TSCEnvironment.wrapper_utils import ObservationBuilder
+from TSCRL.rl_utils.numpy_policy import NumpyTSCPolicy
+from TSCRL.rl_utils.streaming_policy import StreamingTSCPolicy
+
+path_convert = get_abs_path(__file__)
+
+
+def make_episode(max_states:int, num_steps:int, seed:int=0):
+    """随机 occupancy 的 episode, 中间 1/3 的时间第 0 个探测器损坏
+    """
+    rng = np.random.default_rng(seed)
+    builder = ObservationBuilder(max_states=max_states)
+    phases = np.eye(12, dtype=np.float32)
+    observations = []
+    for step in range(num_steps):
+        builder.push_occupancy(rng.random(12, dtype=np.float32))
+        mask_index = 0 if num_steps//3 <= step < 2*num_steps//3 else None
+        this_phase, next_phase = rng.integers(0, 12, size=2)
+        observations.append(builder.build(phases[this_phase], phases[next_phase], mask_index=mask_index))
+    return observations
+
+
+def run(predict, observations) -> float:
+    start_time = time.perf_counter()
+    for observation in observations:
+        predict(observation)
+    return (time.perf_counter() - start_time) / len(observations) * 1e6 # µs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--phase_num', type=int, default=4, help='Phase number')
+    parser.add_argument('--num_steps', type=int, default=2000, help='Decisions in the episode')
+    parser.add_argument('--max_states', type=int, nargs='+', default=[5, 8, 16], help='Window sizes to compare')
+    args = parser.parse_args()
+
+    model_path = path_convert(f'../TSCRL/result/{args.phase_num}way/choose_next_phase/models/last_rl_model.zip')
+    policy = NumpyTSCPolicy.load(model_path)
+
+    print(f'{"T":>4}{"max |logit diff|":>18}{"recurrent agree":>17}{"resyncs":>9}{"window (µs)":>13}{"exact (µs)":>12}{"recurrent (µs)":>16}')
+    for max_states in args.max_states:
+        observations = make_episode(max_states, args.num_steps)
+        window_logits = np.concatenate([policy.action_logits(observation[None]) for observation in observations])
+
+        exact = StreamingTSCPolicy(policy, mode='exact')
+        exact_logits = np.concatenate([exact.action_logits(observation) for observation in observations])
+        recurrent = StreamingTSCPolicy(policy, mode='recurrent')
+        recurrent_actions = np.array([recurrent.predict(observation)[0] for observation in observations])
+        agreement = np.mean(recurrent_actions == window_logits.argmax(1))
+
+        window_time = run(lambda obs: policy.predict(obs), observations)
+        exact.reset()
+        exact_time = run(exact.predict, observations)
+        recurrent.reset()
+        recurrent_time = run(recurrent.predict, observations)
+        print(
+            f'{max_states:>4}{np.abs(exact_logits - window_logits).max():>18.2e}{agreement:>17.2%}{exact.num_resyncs:>9}'
+            f'{window_time:>13.1f}{exact_time:>12.1f}{recurrent_time:>16.1f}'
+        )
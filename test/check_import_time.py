@@ -0,0 +1,117 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 22:51:37
+@Description: 检查每个入口的 import 时间 (python -X importtime), 防止重的依赖被提前导入
++ 每个入口在新的进程中导入自己需要的模块, 统计总的 import 时间和最慢的包
++ 超过 budget, 或者导入了不应该导入的包 (例如 FT/SOTL 导入了 langchain), 返回非 0
++ 只有缺少 OPTIONAL_DEPENDENCIES 中的第三方包时 SKIP, 其他的 import 错误为 FAIL
++ 所有入口都 SKIP (没有测量任何入口) 时返回非 0, 除非使用 --allow-skip
+-> python check_import_time.py
+-> python check_import_time.py --entry ft_sotl llm_rl_numpy --scale 2
+-> python check_import_time.py --allow-skip
+@LastEditTime: 2026-10-19 12:03:25
+'''
+import sys
+from pathlib import Path
+
+parent_directory = Path(__file__).resolve().parent.parent
+if str(parent_directory) not in sys.path:
+    sys.path.insert(0, str(parent_directory))
+
+import re
+import argparse
+import subprocess
+from collections import defaultdict
+
+# 入口 -> (需要导入的模块, budget (ms), 不应该导入的包)
+ENTRY_POINTS = {
+    'ft_sotl': (
+        ['TSCEnvironment.tsc_env', 'TSCEnvironment.base_tsc_wrapper'],
+        1500, ['langchain', 'openai', 'tiktoken', 'torch', 'stable_baselines3'],
+    ),
+    'rl_eval': (
+        ['TSCRL.rl_utils.make_tsc_env', 'stable_baselines3'],
+        6000, ['langchain', 'openai', 'tiktoken'],
+    ),
+    'llm': (
+        ['TSCEnvironment.llm_wrapper', 'TSCAgent.tsc_agent', 'utils.llm_client'],
+        5000, ['torch', 'stable_baselines3'],
+    ),
+    'llm_rl_numpy': (
+        ['TSCEnvironment.llm_rl_wrapper', 'TSCRL.rl_utils.numpy_policy', 'TSCAgent.tsc_agent'],
+        5000, ['torch', 'stable_baselines3'],
+    ),
+}
+
+# 可以没有安装的第三方包, 缺少时 SKIP 这个入口
+OPTIONAL_DEPENDENCIES = {
+    'tshub', 'traci', 'libsumo', 'sumolib', 'gymnasium', 'loguru',
+    'torch', 'stable_baselines3', 'langchain', 'openai', 'tiktoken', 'httpx',
+}
+
+
+class MissingDependency(RuntimeError):
+    """缺少 OPTIONAL_DEPENDENCIES 中的包
+    """
+
+
+def measure_imports(modules):
+    """在新的进程中导入 modules, 返回 (总时间 ms, 每个顶层包自身的时间 ms, 导入的所有模块)
+    """
+    code = '; '.join(f'import {module}' for module in modules)
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=str(parent_directory), capture_output=True, text=True
+    )
+    if output.returncode != 0:
+        error = output.stderr.strip().splitlines()[-1]
+        missing = re.match(r"ModuleNotFoundError: No module named '([^']+)'", error)
+        if missing and missing.group(1).split('.')[0] in OPTIONAL_DEPENDENCIES:
+            raise MissingDependency(f'missing optional dependency {missing.group(1)}')
+        raise RuntimeError(f'import {modules} failed:\n{error}')
+    total, packages, imported = 0, defaultdict(float), set()
+    for line in output.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        module = name.strip()
+        imported.add(module)
+        packages[module.split('.')[0]] += int(self_time) / 1000 # 例如 numpy 的时间不算在 TSCEnvironment 中
+        if not name.startswith('  '): # 只统计最外层的 import, 内层已经包含在 cumulative 中
+            total += int(cumulative) / 1000
+    return total, packages, imported
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entry', type=str, nargs='+', default=list(ENTRY_POINTS), choices=list(ENTRY_POINTS))
+    parser.add_argument('--scale', type=float, default=1, help='Multiply every budget, e.g. for slow machines')
+    parser.add_argument('--top', type=int, default=5, help='Slowest packages to print per entry point')
+    parser.add_argument('--allow-skip', action='store_true', help='Exit 0 even if no entry point could be measured')
+    args = parser.parse_args()
+
+    failed, measured = [], []
+    for entry in args.entry:
+        modules, budget, forbidden = ENTRY_POINTS[entry]
+        budget = budget * args.scale
+        try:
+            total, packages, imported = measure_imports(modules)
+        except MissingDependency as e:
+            print(f'{entry:<14} SKIP, {e}')
+            continue
+        except RuntimeError as e: # 入口本身的 import 错误
+            print(f'{entry:<14} FAIL, {e}')
+            failed.append(entry)
+            continue
+        measured.append(entry)
+        leaked = sorted({module.split('.')[0] for module in imported} & set(forbidden))
+        status = 'OK' if (total <= budget and not leaked) else 'FAIL'
+        print(f'{entry:<14}{total:>9.0f} ms / {budget:.0f} ms  {status}' + (f', imports {leaked}' if leaked else ''))
+        for package, elapsed in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+            print(f'{"":<14}{elapsed:>9.0f} ms  {package}')
+        if status == 'FAIL':
+            failed.append(entry)
+
+    if not measured and not args.allow_skip:
+        print('No entry point was measured, use --allow-skip to accept this')
+    sys.exit(1 if (failed or not (measured or args.allow_skip)) else 0)
@@ -0,0 +1,101 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-19 13:12:30
+@Description: 检查 MultiTSCEnvWrapper 的 batch observation
++ 形状为 (N,max_states+2,12), 与 observation_space 相同
++ 没有到达决策点的路口, observation 与上一次相同 (仿真结束时所有路口都会更新)
++ 只有一个路口时, 与 BaseTSCEnvWrapper 在相同动作下的 observation 相同
++ set_edge_speed/set_occ_missing 与 BaseTSCEnvWrapper 相同, 重复设置不增加 state_version
+-> python check_multi_tsc_env.py --env_name 4way --tls_ids J1
+@LastEditTime: 2026-10-19 15:36:08
+'''
+import sys
+from pathlib import Path
+
+parent_directory = Path(__file__).resolve().parent.parent
+if str(parent_directory) not in sys.path:
+    sys.path.insert(0, str(parent_directory))
+
+import argparse
+import numpy as np
+from loguru import logger
+from tshub.utils.get_abs_path import get_abs_path
+from tshub.utils.init_log import set_logger
+
+from TSCEnvironment.tsc_env import TSCEnvironment
+from TSCEnvironment.base_tsc_wrapper import BaseTSCEnvWrapper
+from TSCEnvironment.multi_tsc_wrapper import MultiTSCEnvWrapper
+
+path_convert = get_abs_path(__file__)
+set_logger(path_convert('./'))
+
+
+def make_env(env_name:str, num_seconds:int, **tls_kwargs) -> TSCEnvironment:
+    return TSCEnvironment(
+        sumo_cfg=path_convert(f"../TSCScenario/{env_name}/env/vehicle.sumocfg"),
+        net_file=path_convert(f"../TSCScenario/{env_name}/env/{env_name}.net.xml"),
+        trip_info=path_convert(f"./{env_name}_multi.tripinfo.xml"),
+        num_seconds=num_seconds,
+        tls_action_type='choose_next_phase',
+        **tls_kwargs
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--env_name', type=str, default='4way', help='Environment name')
+    parser.add_argument('--tls_ids', type=str, nargs='+', default=['J1'], help='Junctions in the scenario')
+    parser.add_argument('--phase_num', type=int, default=4, help='Phase number')
+    parser.add_argument('--num_seconds', type=int, default=300, help='Simulation seconds')
+    parser.add_argument('--edge_block', type=str, default='E1', help='Edge used to check set_edge_speed')
+    args = parser.parse_args()
+
+    multi_env = MultiTSCEnvWrapper(make_env(args.env_name, args.num_seconds, tls_ids=args.tls_ids), tls_ids=args.tls_ids, phase_num=args.phase_num)
+    single_env = None
+    if len(args.tls_ids) == 1:
+        single_env = BaseTSCEnvWrapper(make_env(args.env_name, args.num_seconds, tls_id=args.tls_ids[0]), tls_id=args.tls_ids[0], phase_num=args.phase_num)
+
+    rng = np.random.default_rng(0)
+    batch_obs, _ = multi_env.reset()
+    expected_shape = (len(args.tls_ids), 7, 12)
+    assert batch_obs.shape == expected_shape == multi_env.observation_space.shape, f'{batch_obs.shape} != {expected_shape}'
+    assert batch_obs.dtype == np.float32
+    if single_env is not None:
+        single_obs, _ = single_env.reset()
+        assert np.array_equal(batch_obs[0], single_obs), 'reset observation differs from BaseTSCEnvWrapper'
+
+    # 修改环境, 只有发生变化时增加 state_version
+    version = multi_env.state_version
+    multi_env.set_edge_speed(edge_id=args.edge_block, speed=1)
+    multi_env.set_edge_speed(edge_id=args.edge_block, speed=1)
+    assert multi_env.state_version == version + 1, 'set_edge_speed did not dedupe'
+    multi_env.set_occ_missing(args.tls_ids[0], not_work_element=multi_env.junctions[args.tls_ids[0]].ls_elements[0])
+    multi_env.set_occ_missing(args.tls_ids[0], not_work_element=multi_env.junctions[args.tls_ids[0]].ls_elements[0])
+    assert multi_env.state_version == version + 2, 'set_occ_missing did not dedupe'
+    multi_env.set_occ_missing(args.tls_ids[0], not_work_element=None)
+    multi_env.set_edge_speed(edge_id=args.edge_block, speed=13)
+    if single_env is not None: # 与单路口保持相同的 mask 和速度
+        single_env.set_edge_speed(edge_id=args.edge_block, speed=1)
+        single_env.set_edge_speed(edge_id=args.edge_block, speed=13)
+
+    dones, num_decisions = False, 0
+    while not dones:
+        actions = rng.integers(0, args.phase_num, size=len(args.tls_ids))
+        last_obs = batch_obs
+        batch_obs, rewards, truncated, dones, infos = multi_env.step(actions)
+        assert batch_obs.shape == expected_shape, f'{batch_obs.shape} != {expected_shape}'
+        can_perform_action = infos['can_perform_action']
+        assert can_perform_action.any() or dones, 'step returned before any junction reached a decision point'
+        waiting = [] if dones else np.flatnonzero(~can_perform_action) # 仿真结束时所有路口都会更新
+        for index in waiting:
+            assert np.array_equal(batch_obs[index], last_obs[index]), f'{args.tls_ids[index]} changed without a decision'
+        if single_env is not None:
+            single_obs, single_rewards, _, _, _ = single_env.step(int(actions[0]))
+            assert np.array_equal(batch_obs[0], single_obs), f'observation differs from BaseTSCEnvWrapper at decision {num_decisions}'
+            assert rewards == single_rewards, f'reward differs at decision {num_decisions}'
+        num_decisions += 1
+
+    multi_env.close()
+    if single_env is not None:
+        single_env.close()
+    logger.info(f'SIM: {num_decisions} decisions, batch observation {expected_shape} OK.')
@@ -0,0 +1,83 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-19 15:52:40
+@Description: 检查迁移到 v2 之后的相似度与旧版本 (junction_similarity.calculate_similarity) 相同
++ 包含探测器损坏 ('-1') 的记录, v2 中保存为 -1, 计算相似度时与旧版本一样当作 -0.01
++ 分数和排序都需要相同
+-> python check_similarity_migration.py
+@LastEditTime: 2026-10-19 15:52:40
+'''
+import sys
+from pathlib import Path
+
+parent_directory = Path(__file__).resolve().parent.parent
+if str(parent_directory) not in sys.path:
+    sys.path.insert(0, str(parent_directory))
+
+import sqlite3
+import tempfile
+import numpy as np
+from loguru import logger
+
+from utils.junction_similarity import calculate_similarity
+from utils.similarity_index import JunctionSimilarityIndex
+from utils.junction_database import (
+    JUNCTION_INFO_TABLE,
+    JUNCTION_INFO_INSERT,
+    load_decisions,
+    migrate_legacy_database
+)
+
+INTERSECTION_LAYOUT = {
+    '-E2_s': {'direction': 'Through', 'number_of_lanes': 2},
+    '-E2_l': {'direction': 'Left Turn', 'number_of_lanes': 1},
+    'E1_s': {'direction': 'Through', 'number_of_lanes': 2},
+    'E1_l': {'direction': 'Left Turn', 'number_of_lanes': 1},
+}
+PHASE_STRUCTURE = {
+    'Phase 0': {'movements': ['-E2_s', 'E1_s']},
+    'Phase 1': {'movements': ['E1_l', '-E2_l']},
+}
+
+
+def legacy_rows(num_rows:int, broken_row:int, seed:int=0):
+    """生成旧版本 junctionINFO 的记录, 第 broken_row 行 '-E2_s' 的探测器损坏
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for index in range(num_rows):
+        current = {movement: f'{value}%' for movement, value in zip(INTERSECTION_LAYOUT, rng.random(4)*100)}
+        previous = {movement: f'{value}%' for movement, value in zip(INTERSECTION_LAYOUT, rng.random(4)*100)}
+        if index == broken_row:
+            current['-E2_s'] = '-1'
+            previous['-E2_s'] = '-1'
+        rows.append((
+            'J1', float(index), str(INTERSECTION_LAYOUT), str(PHASE_STRUCTURE),
+            str(['-E2_s'] if index % 3 == 0 else None), str(current), str(previous),
+            f'explanation {index}', index % 2
+        ))
+    return rows
+
+
+if __name__ == '__main__':
+    num_rows, broken_row = 20, 7
+    rows = legacy_rows(num_rows, broken_row)
+    with tempfile.TemporaryDirectory() as folder:
+        database = str(Path(folder) / 'junction.db')
+        connection = sqlite3.connect(database)
+        with connection:
+            connection.execute(JUNCTION_INFO_TABLE)
+            connection.executemany(JUNCTION_INFO_INSERT, rows)
+        connection.close()
+
+        assert migrate_legacy_database(database) == num_rows
+        decisions = load_decisions(database)
+        assert decisions['current_occupancy'][broken_row, 0] == -1, 'broken detector should be stored as -1'
+        similarity_index = JunctionSimilarityIndex.from_decisions(decisions)
+
+    for anchor in (broken_row, 0):
+        legacy_scores = np.array([calculate_similarity(rows[anchor])(row) for row in rows])
+        v2_scores = similarity_index.scores_of(anchor)
+        assert np.allclose(legacy_scores, v2_scores, atol=1e-6), f'anchor {anchor}: {np.abs(legacy_scores - v2_scores).max()}'
+        assert np.array_equal(np.argsort(legacy_scores, kind='stable'), np.argsort(v2_scores, kind='stable')), f'anchor {anchor}: ranking differs'
+    logger.info(f'SIM: {num_rows} rows, legacy and v2 similarity scores match (broken detector at row {broken_row}).')
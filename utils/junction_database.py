@@ -0,0 +1,526 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 13:05:11
+@Description: 路口决策数据库的读写
++ DecisionLogWriter, 保持一个 SQLite 连接 (WAL), 在后台线程中批量写入, 后台线程出错之后 write/flush 抛出异常
++ Schema v2, 路口的静态信息每个路口只存一次, occupancy 存为 float32 的 BLOB
++ load_decisions, 直接读出 numpy 数组, 不需要 eval
++ migrate_legacy_database, 将旧的 junctionINFO (str(dict)) 转换为 v2, 中断之后可以重新运行 (从上一次的位置继续)
+@LastEditTime: 2026-10-19 16:02:14
+'''
+import ast
+import json
+import time
+import queue
+import atexit
+import sqlite3
+import argparse
+import threading
+import numpy as np
+from loguru import logger
+from typing import Any, Dict, List, Tuple
+
+SCHEMA_VERSION = 2
+
+# 旧版本 (v1) 的表, 所有的信息都以 str(dict) 保存
+JUNCTION_INFO_TABLE = """
+    CREATE TABLE IF NOT EXISTS junctionINFO(
+        junction_id TEXT,
+        frame REAL,
+        intersection_layout TEXT,
+        phase_structure TEXT,
+        emergency_vehicle TEXT,
+        current_occupancy TEXT,
+        previous_occupancy TEXT,
+        thoughtsAndActions TEXT,
+        action INTEGER,
+        PRIMARY KEY (junction_id, frame));"""
+
+JUNCTION_INFO_INSERT = "INSERT INTO junctionINFO VALUES (?,?,?,?,?,?,?,?,?)"
+
+# v2
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS schema_version(
+        version INTEGER NOT NULL);""",
+    """
+    CREATE TABLE IF NOT EXISTS junction_static(
+        junction_id TEXT PRIMARY KEY,
+        movement_ids TEXT NOT NULL,
+        intersection_layout TEXT NOT NULL,
+        phase_structure TEXT NOT NULL,
+        phase_movement_index TEXT NOT NULL,
+        phase_lane_counts BLOB NOT NULL);""",
+    """
+    CREATE TABLE IF NOT EXISTS decision_log(
+        junction_id TEXT NOT NULL,
+        frame REAL NOT NULL,
+        has_emergency INTEGER NOT NULL,
+        emergency_movements TEXT NOT NULL,
+        current_occupancy BLOB NOT NULL,
+        previous_occupancy BLOB,
+        explanation TEXT,
+        action INTEGER,
+        PRIMARY KEY (junction_id, frame));""",
+]
+
+JUNCTION_STATIC_INSERT = "INSERT OR REPLACE INTO junction_static VALUES (?,?,?,?,?,?)"
+DECISION_LOG_INSERT = "INSERT INTO decision_log VALUES (?,?,?,?,?,?,?,?)"
+
+# 迁移的进度, 与每个 batch 在同一个事务中更新
+MIGRATION_PROGRESS_TABLE = """
+    CREATE TABLE IF NOT EXISTS migration_progress(
+        last_rowid INTEGER NOT NULL);"""
+
+
+# ##########
+# Encoding
+# ##########
+def encode_vector(vector) -> bytes:
+    """将一维向量存为 float32 的 BLOB
+    """
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def decode_vector(blob:bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+def get_phase_movement_index(movement_ids:List[str], phase_structure:Dict[str, Dict[str, List[str]]]) -> Dict[str, List[int]]:
+    """每一个 phase 包含的 movement 在 occupancy 向量中的 index, 不在 occupancy 中的 movement 会被忽略
+    """
+    movement_index = {movement_id: index for index, movement_id in enumerate(movement_ids)}
+    return {
+        phase: [movement_index[movement] for movement in info['movements'] if movement in movement_index]
+        for phase, info in phase_structure.items()
+    }
+
+
+def get_phase_lane_counts(intersection_layout:Dict[str, Dict[str, Any]], phase_structure:Dict[str, Dict[str, List[str]]], junction_id:str=None) -> List[float]:
+    """每个 phase 控制的总的车道数, 与 junction_similarity.get_statistic_info 相同
+    phase 中的 movement 不在 intersection_layout 中时抛出 ValueError (不能忽略, 否则车道数与旧版本不同)
+    """
+    lane_counts = []
+    for phase_name, phase in phase_structure.items():
+        lanes = 0
+        for movement in phase['movements']:
+            if movement not in intersection_layout:
+                raise ValueError(f"Junction {junction_id}: movement {movement} of {phase_name} is not in the intersection layout.")
+            lanes += intersection_layout[movement]['number_of_lanes']
+        lane_counts.append(lanes)
+    return lane_counts
+
+
+def static_row(junction_id:str, movement_ids:List[str], intersection_layout, phase_structure) -> Tuple[Any, ...]:
+    """junction_static 的一行, movement_ids 是 occupancy 向量中 movement 的顺序
+    """
+    return (
+        junction_id,
+        json.dumps(list(movement_ids)),
+        json.dumps(intersection_layout),
+        json.dumps(phase_structure),
+        json.dumps(get_phase_movement_index(movement_ids, phase_structure)),
+        encode_vector(get_phase_lane_counts(intersection_layout, phase_structure, junction_id)),
+    )
+
+
+def decision_row(
+        junction_id:str, frame:float, 
+        emergency_movements:List[str], 
+        current_occupancy, previous_occupancy, 
+        explanation:str, action:int
+    ) -> Tuple[Any, ...]:
+    """decision_log 的一行, occupancy 的数值在 0-1 之间, previous_occupancy 可以是 None
+    """
+    emergency_movements = list(emergency_movements or [])
+    return (
+        junction_id, float(frame),
+        int(len(emergency_movements) > 0), json.dumps(emergency_movements),
+        encode_vector(current_occupancy),
+        None if previous_occupancy is None else encode_vector(previous_occupancy),
+        explanation, None if action is None else int(action)
+    )
+
+
+def connect_database(database:str, timeout:float=30) -> sqlite3.Connection:
+    """打开数据库并开启 WAL, 多个进程可以同时写入同一个数据库
+    """
+    connection = sqlite3.connect(database, timeout=timeout)
+    connection.execute("PRAGMA journal_mode=WAL;")
+    connection.execute("PRAGMA synchronous=NORMAL;")
+    return connection
+
+
+class DecisionLogWriter:
+    """批量写入决策记录
+    + write 只是将数据放入队列, 不会阻塞仿真
+    + 后台线程持有唯一的连接, 积累到 batch_size 条, 或者最早的一条已经等待了 flush_interval 秒时提交一次事务
+    + flush 立即提交队列中的数据
+    + 后台线程出错退出之后, write 和 flush 抛出 RuntimeError, 不会静默丢弃数据或一直等待
+    + close 时 (包括程序退出或异常退出时的 atexit) 将剩余的数据全部写入
+    """
+    _STOP = object()
+
+    def __init__(
+            self,
+            database:str,
+            schema:List[str]=SCHEMA,
+            insert_sql:str=DECISION_LOG_INSERT,
+            batch_size:int=64,
+            flush_interval:float=1.0,
+            set_version:bool=True
+        ) -> None:
+        """
+        Args:
+            set_version (bool, optional): 建表之后写入 SCHEMA_VERSION, 使用其他的 schema 时设置为 False. Defaults to True.
+        """
+        self.database = database
+        self.schema = schema # 写入前需要执行的建表语句
+        self.set_version = set_version
+        self.insert_sql = insert_sql
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.num_rows = 0 # 已经写入的行数
+        self.num_batches = 0 # 提交的事务数
+        self.closed = False
+        self._queue = queue.Queue()
+        self._ready = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='DecisionLogWriter', daemon=True)
+        self._thread.start()
+        self._ready.wait() # 等待建表完成
+        if self._error is not None:
+            raise self._error
+        atexit.register(self.close)
+
+    def _check_alive(self) -> None:
+        if (self._error is not None) or (not self._thread.is_alive()):
+            raise RuntimeError(f"DecisionLogWriter for {self.database} stopped unexpectedly.") from self._error
+
+    def write(self, row:Tuple[Any, ...], insert_sql:str=None) -> None:
+        """写入一行, insert_sql 默认为初始化时的 insert_sql
+        """
+        if self.closed:
+            raise RuntimeError(f"DecisionLogWriter for {self.database} is closed.")
+        self._check_alive()
+        self._queue.put((insert_sql or self.insert_sql, row))
+
+    def flush(self, timeout:float=None) -> bool:
+        """阻塞直到之前 write 的数据都已经提交, 超过 timeout (s) 时返回 False
+        """
+        if self.closed:
+            return True
+        self._check_alive()
+        done = threading.Event()
+        self._queue.put(done)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not done.wait(0.1):
+            self._check_alive() # 后台线程已经退出时不会再 set
+            if (deadline is not None) and (time.monotonic() > deadline):
+                return False
+        return True
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.put(self._STOP)
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        try:
+            connection = connect_database(self.database)
+            for statement in self.schema:
+                connection.execute(statement)
+            if self.set_version:
+                set_schema_version(connection)
+            connection.commit()
+        except sqlite3.Error as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+
+        try:
+            self._loop(connection)
+        except Exception as e: # 不是某一行的错误, 之后的 write/flush 会抛出异常
+            logger.error(f'SIM: DecisionLogWriter for {self.database} stopped, {e}')
+            self._error = e
+            connection.close()
+            return
+
+        # 写入 STOP 之后仍在队列中的数据
+        rows = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is not self._STOP:
+                rows.append(item)
+        self._commit(connection, rows)
+        connection.close()
+
+    def _loop(self, connection:sqlite3.Connection) -> None:
+        stop = False
+        rows, events = [], []
+        commit_time = None # 最早的一条数据需要提交的时间
+        while not stop:
+            timeout = self.flush_interval if commit_time is None else max(commit_time - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is self._STOP:
+                stop = True
+            elif isinstance(item, threading.Event):
+                events.append(item)
+            elif item is not None:
+                rows.append(item)
+                if commit_time is None:
+                    commit_time = time.monotonic() + self.flush_interval
+            timeout_reached = (commit_time is not None) and (time.monotonic() >= commit_time)
+            if stop or len(events) > 0 or len(rows) >= self.batch_size or timeout_reached:
+                self._commit(connection, rows)
+                for event in events:
+                    event.set()
+                rows, events, commit_time = [], [], None
+
+    def _commit(self, connection:sqlite3.Connection, rows:List[Tuple[str, Tuple[Any, ...]]]) -> None:
+        if len(rows) == 0:
+            return
+        # 连续的相同 sql 合并为一次 executemany
+        groups = []
+        for insert_sql, row in rows:
+            if len(groups) > 0 and groups[-1][0] == insert_sql:
+                groups[-1][1].append(row)
+            else:
+                groups.append((insert_sql, [row]))
+        try:
+            with connection: # 一个事务
+                for insert_sql, group_rows in groups:
+                    connection.executemany(insert_sql, group_rows)
+            self.num_rows += len(rows)
+            self.num_batches += 1
+        except sqlite3.Error:
+            # 整个 batch 回滚, 逐行写入, 只丢弃出错的行 (例如重复的 primary key)
+            for insert_sql, row in rows:
+                try:
+                    with connection:
+                        connection.execute(insert_sql, row)
+                    self.num_rows += 1
+                except sqlite3.Error as e:
+                    logger.error(f'SIM: Failed to write row {row[:2]} into {self.database}, {e}')
+            self.num_batches += 1
+
+
+# ########
+# Version
+# ########
+def get_schema_version(connection:sqlite3.Connection) -> int:
+    """0 表示空数据库, 1 表示只有旧的 junctionINFO
+    """
+    tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type='table';")}
+    if 'schema_version' in tables:
+        row = connection.execute("SELECT MAX(version) FROM schema_version;").fetchone()
+        if row[0] is not None:
+            return row[0]
+    return 1 if 'junctionINFO' in tables else 0
+
+
+def set_schema_version(connection:sqlite3.Connection, version:int=SCHEMA_VERSION) -> None:
+    connection.execute("DELETE FROM schema_version;")
+    connection.execute("INSERT INTO schema_version VALUES (?);", (version,))
+
+
+# #######
+# Loader
+# #######
+def load_junction_static(connection:sqlite3.Connection) -> Dict[str, Dict[str, Any]]:
+    """每个路口的静态信息
+    """
+    statics = {}
+    for junction_id, movement_ids, intersection_layout, phase_structure, phase_movement_index, phase_lane_counts in connection.execute(
+        "SELECT * FROM junction_static;"
+    ):
+        statics[junction_id] = {
+            'movement_ids': json.loads(movement_ids),
+            'intersection_layout': json.loads(intersection_layout),
+            'phase_structure': json.loads(phase_structure),
+            'phase_movement_index': json.loads(phase_movement_index),
+            'phase_lane_counts': decode_vector(phase_lane_counts),
+        }
+    return statics
+
+
+def _decode_matrix(blobs:List[bytes], width:int) -> np.ndarray:
+    """将多个相同长度的 BLOB 一次性转换为 (N, width) 的矩阵
+    """
+    if len(blobs) == 0:
+        return np.zeros((0, width), dtype=np.float32)
+    return np.frombuffer(b''.join(blobs), dtype=np.float32).reshape(len(blobs), width)
+
+
+def load_decisions(database:str, junction_id:str=None) -> Dict[str, Any]:
+    """读取 decision_log, 返回 numpy 数组 (按 junction_id, frame 排序)
+
+    Returns:
+        Dict[str, Any]: 
+            {
+                'junction_id': (N,) str, 
+                'frame': (N,) float64, 
+                'action': (N,) int64, -1 表示没有动作
+                'explanation': List[str],
+                'has_emergency': (N,) bool,
+                'emergency_movements': List[List[str]],
+                'current_occupancy': (N, M) float32, 不同路口的 movement 数量不同时, 用 0 填充到最大的 M
+                'previous_occupancy': (N, M) float32, 没有上一个时刻时为 0
+                'has_previous': (N,) bool,
+                'statics': 每个路口的静态信息 (见 load_junction_static)
+            }
+    """
+    connection = sqlite3.connect(database)
+    if get_schema_version(connection) < SCHEMA_VERSION:
+        connection.close()
+        raise ValueError(f"{database} uses an old schema, please run migrate_legacy_database first.")
+    statics = load_junction_static(connection)
+    junction_ids = [junction_id] if junction_id is not None else sorted(statics.keys())
+    width = max([len(statics[_id]['movement_ids']) for _id in junction_ids], default=0)
+
+    columns = {
+        'junction_id': [], 'frame': [], 'action': [], 'explanation': [],
+        'has_emergency': [], 'emergency_movements': [],
+        'current_occupancy': [], 'previous_occupancy': [], 'has_previous': []
+    }
+    for _id in junction_ids:
+        rows = connection.execute(
+            "SELECT frame, has_emergency, emergency_movements, current_occupancy, previous_occupancy, explanation, action "
+            "FROM decision_log WHERE junction_id=? ORDER BY frame;", (_id,)
+        ).fetchall()
+        num_movements = len(statics[_id]['movement_ids'])
+        empty_blob = encode_vector(np.zeros(num_movements))
+        current = _decode_matrix([row[3] for row in rows], num_movements)
+        previous = _decode_matrix([empty_blob if row[4] is None else row[4] for row in rows], num_movements)
+        pad = ((0, 0), (0, width - num_movements))
+
+        columns['junction_id'].append(np.full(len(rows), _id, dtype=object))
+        columns['frame'].append(np.array([row[0] for row in rows], dtype=np.float64))
+        columns['has_emergency'].append(np.array([row[1] for row in rows], dtype=bool))
+        columns['emergency_movements'].extend(json.loads(row[2]) for row in rows)
+        columns['current_occupancy'].append(np.pad(current, pad))
+        columns['previous_occupancy'].append(np.pad(previous, pad))
+        columns['has_previous'].append(np.array([row[4] is not None for row in rows], dtype=bool))
+        columns['explanation'].extend(row[5] for row in rows)
+        columns['action'].append(np.array([-1 if row[6] is None else row[6] for row in rows], dtype=np.int64))
+    connection.close()
+
+    decisions = {}
+    for key, value in columns.items():
+        if key in ('explanation', 'emergency_movements'):
+            decisions[key] = value
+        elif len(value) == 0:
+            decisions[key] = np.zeros((0, width) if key.endswith('occupancy') else 0, dtype=np.float32)
+        else:
+            decisions[key] = np.concatenate(value)
+    decisions['statics'] = statics
+    return decisions
+
+
+# ##########
+# Migration
+# ##########
+def _percentage(value:Any) -> float:
+    """'35.9%' -> 0.359, 损坏的探测器 '-1' 保持为 -1 (计算相似度时见 similarity_index.scoring_occupancy)
+    """
+    value = float(str(value).replace('%', ''))
+    return -1.0 if value == -1 else value/100
+
+
+def _percentage_vector(occupancy:Dict[str, str], movement_ids:List[str]) -> np.ndarray:
+    """{'E0--l': '35.9%', 'E0--s': '-1'} -> [0.359, -1]
+    """
+    return np.array([_percentage(occupancy[_id]) for _id in movement_ids], dtype=np.float32)
+
+
+def migrate_legacy_database(database:str, drop_legacy:bool=False, batch_size:int=10000) -> int:
+    """将旧的 junctionINFO 转换为 v2, 只需要执行一次. 使用 ast.literal_eval 解析, 不会执行任意代码
+    每个 batch 与 migration_progress 在同一个事务中提交, 中断之后重新运行会从上一次的 rowid 继续
+
+    Returns:
+        int: 转换的行数
+    """
+    connection = connect_database(database)
+    version = get_schema_version(connection)
+    if version >= SCHEMA_VERSION:
+        logger.info(f'SIM: {database} is already at schema version {version}.')
+        connection.close()
+        return 0
+
+    with connection:
+        for statement in SCHEMA + [MIGRATION_PROGRESS_TABLE]:
+            connection.execute(statement)
+
+    num_rows = 0
+    movement_orders = {
+        junction_id: json.loads(movement_ids)
+        for junction_id, movement_ids in connection.execute("SELECT junction_id, movement_ids FROM junction_static;")
+    } # 上一次中断之前已经写入的路口
+    last_rowid = connection.execute("SELECT MAX(last_rowid) FROM migration_progress;").fetchone()[0] or 0
+    if last_rowid > 0:
+        logger.info(f'SIM: Resume the migration of {database} after rowid {last_rowid}.')
+    cursor = connection.cursor()
+    if version == 1:
+        cursor.execute("SELECT rowid, * FROM junctionINFO WHERE rowid > ? ORDER BY rowid;", (last_rowid,))
+    while version == 1:
+        rows = cursor.fetchmany(batch_size)
+        if len(rows) == 0:
+            break
+        static_rows, decision_rows = [], []
+        for rowid, junction_id, frame, intersection_layout, phase_structure, emergency_vehicle, current_occupancy, previous_occupancy, explanation, action in rows:
+            current_occupancy = ast.literal_eval(current_occupancy)
+            previous_occupancy = ast.literal_eval(previous_occupancy)
+            if junction_id not in movement_orders:
+                movement_orders[junction_id] = list(current_occupancy.keys())
+                static_rows.append(static_row(
+                    junction_id, movement_orders[junction_id],
+                    ast.literal_eval(intersection_layout), ast.literal_eval(phase_structure)
+                ))
+            movement_ids = movement_orders[junction_id]
+            emergency_vehicle = ast.literal_eval(emergency_vehicle)
+            decision_rows.append(decision_row(
+                junction_id, frame, 
+                emergency_vehicle if isinstance(emergency_vehicle, list) else [], 
+                _percentage_vector(current_occupancy, movement_ids),
+                None if previous_occupancy is None else _percentage_vector(previous_occupancy, movement_ids),
+                explanation, action
+            ))
+        with connection: # batch 与进度在同一个事务中
+            connection.executemany(JUNCTION_STATIC_INSERT, static_rows)
+            connection.executemany(DECISION_LOG_INSERT.replace('INSERT', 'INSERT OR IGNORE', 1), decision_rows)
+            connection.execute("DELETE FROM migration_progress;")
+            connection.execute("INSERT INTO migration_progress VALUES (?);", (rows[-1][0],))
+        num_rows += len(decision_rows)
+
+    with connection:
+        set_schema_version(connection)
+        connection.execute("DROP TABLE migration_progress;")
+        if drop_legacy and version == 1:
+            connection.execute("DROP TABLE junctionINFO;")
+    connection.close()
+    logger.info(f'SIM: Migrate {num_rows} rows of {database} to schema version {SCHEMA_VERSION}.')
+    return num_rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migrate junction.db to the typed schema.')
+    parser.add_argument('database', type=str, help='Path of junction.db')
+    parser.add_argument('--drop_legacy', action='store_true', help='Drop the legacy junctionINFO table')
+    args = parser.parse_args()
+    migrate_legacy_database(args.database, drop_legacy=args.drop_legacy)
@@ -6,27 +6,39 @@
 + 2. 计算动态相似度 (余弦相似度)
 @LastEditTime: 2023-09-19 20:35:27
 '''
+import ast
+import numpy as np
 from typing import Tuple, Dict, List, Any, Literal
 from utils.euclidean_distance import euclidean_distance
 
+def topk_min_indices(scores:np.ndarray, k:int) -> np.ndarray:
+    """最小的 k 个值的 index, 结果与 sorted(enumerate(scores)) 的稳定排序相同 (相同的值按 index 排序)
+    """
+    scores = np.asarray(scores)
+    num = len(scores)
+    if k >= num:
+        return np.argsort(scores, kind='stable')
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    kth_value = scores[np.argpartition(scores, k-1)[:k]].max()
+    candidates = np.flatnonzero(scores <= kth_value) # 包含与第 k 个值相同的所有 index, 保证 tie 的顺序
+    return candidates[np.argsort(scores[candidates], kind='stable')][:k]
+
+
 def find_min_indices(lst, n):
-    # 使用enumerate函数获取每个元素的索引和值
-    indices_and_values = list(enumerate(lst))
-    
-    # 根据值进行排序
-    sorted_indices_and_values = sorted(indices_and_values, key=lambda x: x[1])
-    
-    # 获取最小的n个值的索引
-    min_indices = [index for index, _ in sorted_indices_and_values[:n]]
-    
-    return min_indices
+    """获取最小的 n 个值的索引 (按值从小到大排序)
+    """
+    return topk_min_indices(lst, n).tolist()
+
 
 def get_int_info(raw_int) -> Tuple[Any,Any,Any,Any,Any,Any]:
-    intersection_layout = eval(raw_int[2])
-    phase_structure = eval(raw_int[3])
-    emergency_vehicle = eval(raw_int[4])
-    current_occupancy = eval(raw_int[5])
-    previous_occupancy = eval(raw_int[6])
+    """解析旧版本 junctionINFO 的一行 (str(dict)), 新的数据库请使用 junction_database.load_decisions
+    """
+    intersection_layout = ast.literal_eval(raw_int[2])
+    phase_structure = ast.literal_eval(raw_int[3])
+    emergency_vehicle = ast.literal_eval(raw_int[4])
+    current_occupancy = ast.literal_eval(raw_int[5])
+    previous_occupancy = ast.literal_eval(raw_int[6])
     return (intersection_layout, phase_structure, emergency_vehicle, current_occupancy, previous_occupancy)
 
 
@@ -0,0 +1,281 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 21:05:48
+@Description: 共享的 LLM 客户端 (TSCAgent, OutputParse, llm.py 使用同一个 pool)
++ HTTP keep-alive, 所有请求共用一个连接池
++ token bucket 限流, 每分钟的请求数 (rpm) 和 token 数 (tpm); 请求前按估计的 token 预扣, 返回后按实际用量修正
++ 最大并发数 (semaphore)
++ 429/5xx/超时时使用 jittered exponential backoff 重试, 优先使用服务返回的 Retry-After
++ deadline_callback, 有决策预算时每次请求的 timeout 为剩余的时间 (作为请求的参数传入, 不修改共享的 chat)
++ 按照 caller (例如 agent, parser) 统计请求数, 重试次数, 429 次数, token 与等待时间
+Note: 限流只在一个进程内生效, 多个进程同时运行时需要按照进程数分配 rpm/tpm
+使用方法:
+-> pool = LLMClientPool.from_config(read_config(), rpm=500, tpm=200000, max_concurrency=8)
+-> chat = pool.chat(caller='agent')
+@LastEditTime: 2026-10-19 16:10:52
+'''
+import time
+import random
+import threading
+from loguru import logger
+from collections import defaultdict
+from typing import Any, Dict, List
+from langchain.chat_models import ChatOpenAI
+
+from TSCPrompt.compact_encoding import count_tokens
+
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRY_ERRORS = {
+    'RateLimitError', 'APIConnectionError', 'APITimeoutError', 'InternalServerError',
+    'ServiceUnavailableError', 'Timeout', 'TryAgain', 'APIError',
+} # openai 0.x 和 1.x 中可以重试的错误
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute:float, capacity:float=None) -> None:
+        """
+        Args:
+            rate_per_minute (float): 每分钟补充的数量
+            capacity (float, optional): 桶的容量, 默认为一分钟的数量. Defaults to None.
+        """
+        self.rate = rate_per_minute / 60
+        self.capacity = rate_per_minute if capacity is None else capacity
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount:float=1) -> float:
+        """等待直到可以取出 amount, 返回等待的时间 (s)
+        """
+        amount = min(amount, self.capacity) # 超过容量的请求在桶满时放行
+        start_time = time.monotonic()
+        while True:
+            with self.lock:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return time.monotonic() - start_time
+                wait_time = (amount - self.level) / self.rate
+            time.sleep(min(wait_time, 1))
+
+    def adjust(self, amount:float) -> None:
+        """按照实际用量修正 (正数表示多用, 负数表示退回), 可以为负 (之后的请求等待更久)
+        """
+        with self.lock:
+            self._refill()
+            self.level = min(self.capacity, self.level - amount)
+
+    def drain(self) -> None:
+        """收到 429 时清空, 其他线程也会等待
+        """
+        with self.lock:
+            self._refill()
+            self.level = min(self.level, 0)
+
+
+def retry_after(error:BaseException) -> float|None:
+    """服务返回的 Retry-After (s)
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(error, 'headers', None) or getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after') or headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def error_status(error:BaseException) -> int|None:
+    return getattr(error, 'http_status', None) or getattr(error, 'status_code', None)
+
+
+def is_retryable(error:BaseException) -> bool:
+    status = error_status(error)
+    if status is not None:
+        return status in RETRY_STATUS
+    return type(error).__name__ in RETRY_ERRORS
+
+
+class PooledChatOpenAI(ChatOpenAI):
+    """经过 LLMClientPool 限流和重试的 ChatOpenAI, 由 LLMClientPool.chat 创建
+    """
+    pool: Any = None
+    caller: str = 'default'
+    pool_retries: int = 6 # 由 pool 重试, 底层 client 的 max_retries 为 0
+    deadline_callback: Any = None # DeadlineCallback, 每次请求的 timeout 不超过剩余的时间
+
+    def _request(self, messages:List[Any], *args: Any, **kwargs: Any) -> Any:
+        """限流等待之后才计算 timeout, 等待的时间也计入预算
+        """
+        remaining = None if self.deadline_callback is None else self.deadline_callback.remaining()
+        if remaining is not None:
+            if remaining <= 0:
+                raise self.deadline_callback.error('time budget exceeded')
+            kwargs = dict(kwargs, **{self.pool.timeout_kwarg: remaining}) # 只作用于这一次请求, 多个线程共用同一个 chat
+        return super()._generate(messages, *args, **kwargs)
+
+    def _generate(self, messages:List[Any], *args: Any, **kwargs: Any) -> Any:
+        estimated_tokens = sum(count_tokens(str(message.content)) for message in messages) + (self.max_tokens or 256)
+        return self.pool.call(
+            caller=self.caller,
+            func=lambda: self._request(messages, *args, **kwargs),
+            estimated_tokens=estimated_tokens,
+            max_retries=self.pool_retries,
+        )
+
+
+class LLMClientPool:
+    def __init__(
+            self,
+            model_kwargs:Dict[str, Any],
+            rpm:float=None, tpm:float=None,
+            max_concurrency:int=8,
+            backoff_base:float=1, backoff_max:float=30,
+        ) -> None:
+        """
+        Args:
+            model_kwargs (Dict[str, Any]): ChatOpenAI 的参数 (model, openai_api_key, openai_api_base, openai_proxy)
+            rpm (float, optional): 每分钟的最大请求数, None 时不限制. Defaults to None.
+            tpm (float, optional): 每分钟的最大 token 数, None 时不限制. Defaults to None.
+            max_concurrency (int, optional): 同时进行的最大请求数. Defaults to 8.
+            backoff_base (float, optional): 第一次重试的等待时间 (s). Defaults to 1.
+            backoff_max (float, optional): 最长的等待时间 (s). Defaults to 30.
+        """
+        self.model_kwargs = dict(model_kwargs)
+        self.request_bucket = None if rpm is None else TokenBucket(rpm)
+        self.token_bucket = None if tpm is None else TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lock = threading.Lock()
+        self.stats = defaultdict(lambda: defaultdict(float)) # caller -> 统计
+        self.timeout_kwarg = 'request_timeout' # 每次请求的 timeout 参数, openai 1.x 为 timeout
+        self.http_kwargs = self._init_http()
+
+    @classmethod
+    def from_config(cls, config:Dict[str, Any], **kwargs: Any) -> 'LLMClientPool':
+        """使用 read_config 的结果初始化
+        """
+        model_kwargs = {
+            'model': config['OPENAI_API_MODEL'],
+            'openai_api_key': config['OPENAI_API_KEY'],
+            'openai_api_base': config['OPENAI_API_BASE'],
+            'openai_proxy': config['OPENAI_PROXY'],
+        }
+        return cls(model_kwargs=model_kwargs, **kwargs)
+
+    def _init_http(self) -> Dict[str, Any]:
+        """共享的 HTTP 连接池, openai 1.x 传入 http_client, 0.x 设置全局的 requestssession
+        """
+        import openai
+        if int(openai.__version__.split('.')[0]) >= 1:
+            import httpx
+            self.timeout_kwarg = 'timeout'
+            limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+            proxy = self.model_kwargs.get('openai_proxy')
+            http_client = httpx.Client(limits=limits, proxy=proxy) if proxy else httpx.Client(limits=limits)
+            return {'http_client': http_client}
+
+        import requests
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        openai.requestssession = session # 所有线程共用, 默认是每个线程一个 session
+        return {}
+
+    def chat(self, caller:str='default', temperature:float=0.0, max_retries:int=6, **kwargs: Any) -> PooledChatOpenAI:
+        """创建一个使用这个 pool 的 ChatOpenAI, caller 用于分别统计
+
+        Args:
+            caller (str, optional): 调用者的名称. Defaults to 'default'.
+            temperature (float, optional): Defaults to 0.0.
+            max_retries (int, optional): 可以重试的错误最多重试的次数. Defaults to 6.
+        """
+        model_kwargs = dict(self.model_kwargs, **self.http_kwargs)
+        model_kwargs.update(kwargs)
+        return PooledChatOpenAI(
+            temperature=temperature, max_retries=0,
+            pool=self, caller=caller, pool_retries=max_retries,
+            **model_kwargs
+        )
+
+    def call(self, caller:str, func, estimated_tokens:int=0, max_retries:int=6) -> Any:
+        """限流之后调用 func (一次 LLM 请求), 可以重试的错误使用 backoff 重试
+        """
+        stats = self.stats[caller]
+        for attempt in range(max_retries + 1):
+            wait_time = 0
+            if self.request_bucket is not None:
+                wait_time += self.request_bucket.acquire(1)
+            if self.token_bucket is not None:
+                wait_time += self.token_bucket.acquire(estimated_tokens)
+
+            start_time = time.monotonic()
+            with self.semaphore:
+                wait_time += time.monotonic() - start_time
+                start_time = time.monotonic()
+                try:
+                    result = func()
+                except Exception as e:
+                    error = e # except 结束之后 e 会被删除
+                    latency = time.monotonic() - start_time
+                    retryable = is_retryable(e) and attempt < max_retries
+                    with self.lock:
+                        stats['errors'] += 1
+                        stats['latency'] += latency
+                        stats['wait_time'] += wait_time
+                        stats['rate_limited'] += int(error_status(e) == 429 or type(e).__name__ == 'RateLimitError')
+                    if self.token_bucket is not None:
+                        self.token_bucket.adjust(-estimated_tokens) # 失败的请求不计 token
+                    if not retryable:
+                        raise
+                else:
+                    latency = time.monotonic() - start_time
+                    token_usage = (getattr(result, 'llm_output', None) or {}).get('token_usage', {})
+                    total_tokens = token_usage.get('total_tokens', estimated_tokens)
+                    if self.token_bucket is not None:
+                        self.token_bucket.adjust(total_tokens - estimated_tokens)
+                    with self.lock:
+                        stats['requests'] += 1
+                        stats['latency'] += latency
+                        stats['wait_time'] += wait_time
+                        stats['prompt_tokens'] += token_usage.get('prompt_tokens', 0)
+                        stats['completion_tokens'] += token_usage.get('completion_tokens', 0)
+                    return result
+
+            # 重试之前等待 (在 semaphore 外面, 不占用并发)
+            with self.lock:
+                stats['retries'] += 1
+            if (error_status(error) == 429 or type(error).__name__ == 'RateLimitError') and (self.request_bucket is not None):
+                self.request_bucket.drain() # 其他线程也暂停, 避免 429 风暴
+            delay = retry_after(error)
+            if delay is None:
+                delay = min(self.backoff_max, self.backoff_base * 2**attempt)
+                delay = random.uniform(0, delay) # full jitter
+            logger.info(f'SIM: LLM request from {caller} failed ({type(error).__name__}), retry {attempt+1}/{max_retries} in {delay:.2f}s.')
+            time.sleep(delay)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            summary = {}
+            for caller, stats in self.stats.items():
+                calls = stats['requests'] + stats['errors']
+                summary[caller] = dict(stats, mean_latency=stats['latency']/calls if calls > 0 else 0)
+            return summary
+
+    def log_stats(self) -> Dict[str, Dict[str, float]]:
+        summary = self.summary()
+        for caller, stats in summary.items():
+            logger.info(f'SIM: LLM client ({caller}), {dict(stats)}')
+        return summary
+
+    def close(self) -> None:
+        http_client = self.http_kwargs.get('http_client')
+        if http_client is not None:
+            http_client.close()
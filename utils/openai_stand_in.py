@@ -0,0 +1,257 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 19:52:20
+@Description: 本地的 OpenAI 兼容服务 (/v1/chat/completions), 用于离线, 可复现地测试完整的 Agent 流程
++ scripted, 根据 prompt 生成合法的回答: ReAct Agent 依次调用 tools 后给出 Final Answer; llm.py 和 OutputParse 返回 JSON
++ record, 把请求转发给真实的服务 (--upstream), 同时把回答保存到 cassette (JSONL)
++ replay, 从 cassette 中按照请求的顺序返回之前的回答, 没有记录时使用 scripted 或者返回错误
+使用方法:
+-> python utils/openai_stand_in.py --mode scripted --port 8000 --latency 0.5
+-> OPENAI_API_BASE=http://127.0.0.1:8000/v1 OPENAI_API_KEY=sk-local OPENAI_API_MODEL=gpt-3.5-turbo python llm_rl.py
+@LastEditTime: 2026-10-19 14:27:45
+'''
+import re
+import json
+import time
+import hashlib
+import argparse
+import threading
+import urllib.request
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+
+TOOL_PATTERN = re.compile(r'^([A-Z][\w ]+?): Useful', re.MULTILINE) # ReAct prompt 中 tool 的名称
+ACTION_PATTERN = re.compile(r'"action"\s*:\s*"([^"]+)"')
+PHASE_PATTERN = re.compile(r'Phase-(\d+)')
+
+
+def request_key(request:Dict[str, Any]) -> str:
+    """只使用影响回答的字段
+    """
+    payload = {key: request.get(key) for key in ('model', 'messages', 'temperature', 'stop', 'functions')}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def count_tokens(text:str) -> int:
+    return (len(text) + 3) // 4
+
+
+# ###############
+# Scripted Policy
+# ###############
+def _agent_answer(system:str, user:str) -> str:
+    """ReAct Agent: 每个 tool 调用一次 (有 Get Junction Snapshot 时只调用它), 然后给出 Final Answer
+    """
+    tools = TOOL_PATTERN.findall(system)
+    if 'Get Junction Snapshot' in tools:
+        tools = ['Get Junction Snapshot']
+    used_tools = set(ACTION_PATTERN.findall(user))
+    for tool in tools:
+        if tool not in used_tools:
+            action = json.dumps({'action': tool, 'action_input': 'None'}, indent=2)
+            return f'Thought: I need to use {tool} to know the situation.\nAction:\n```\n{action}\n```'
+
+    observations = user.split('Observation:')[1:]
+    decision = re.search(r'(?:Traditional decision[^\n]*?Phase-|set )(\d+)', ''.join(observations))
+    phase_id = decision.group(1) if decision is not None else '0'
+    return (
+        'Thought: I now have all the information I need.\n'
+        f'Final Answer: \n    "decision":{{"Phase-{phase_id}"}},\n'
+        f'    "expalanations":{{"Phase-{phase_id} is suggested by the traditional decision and no long-tail event needs priority."}}'
+    )
+
+
+def _json_answer(user:str) -> str:
+    """llm.py 的 prompt: 当前相位的下一个相位
+    """
+    actions_line = re.split(r'following actions|Choose ONE action', user)[-1].split('\n')[0] # full 和 compact 两种 prompt
+    available_actions = sorted(set(PHASE_PATTERN.findall(actions_line))) or ['0']
+    current_phase = re.search(r'(?:current phase is|Current phase:) Phase-(\d+)', user)
+    phase_id = available_actions[0]
+    if current_phase is not None and current_phase.group(1) in available_actions:
+        phase_id = available_actions[(available_actions.index(current_phase.group(1)) + 1) % len(available_actions)]
+    answer = {'decision': f'Phase-{phase_id}', 'explanation': f'Switch to Phase-{phase_id} to serve the waiting movements in turn.'}
+    return f'```json\n{json.dumps(answer, indent=4)}\n```'
+
+
+def _parse_answer(user:str) -> str:
+    """OutputParse 的 LLM 解析
+    """
+    response = user.split('Response:')[-1]
+    phases = PHASE_PATTERN.findall(response) or re.findall(r'\d+', response) or ['0']
+    answer = {'phase_id': int(phases[0]), 'explanation': ' '.join(response.split())[:200]}
+    return f'```json\n{json.dumps(answer, indent=4)}\n```'
+
+
+def scripted_answer(request:Dict[str, Any]) -> str:
+    messages = request.get('messages', [])
+    system = '\n'.join(message.get('content') or '' for message in messages if message.get('role') == 'system')
+    user = '\n'.join(message.get('content') or '' for message in messages if message.get('role') != 'system')
+    if 'action_input' in system:
+        return _agent_answer(system, user)
+    if user.lstrip().startswith('Parse the problem response'):
+        return _parse_answer(user)
+    if '"decision"' in user:
+        return _json_answer(user)
+    return 'OK.'
+
+
+def completion(request:Dict[str, Any], content:str) -> Dict[str, Any]:
+    for stop in request.get('stop') or []:
+        content = content.split(stop)[0]
+    prompt_tokens = sum(count_tokens(message.get('content') or '') for message in request.get('messages', []))
+    completion_tokens = count_tokens(content)
+    return {
+        'id': f'chatcmpl-standin-{int(time.time()*1000)}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': request.get('model', 'stand-in'),
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+        'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'total_tokens': prompt_tokens + completion_tokens},
+    }
+
+
+# ########
+# Backend
+# ########
+class StandInBackend:
+    def __init__(self, mode:str='scripted', cassette:str=None, upstream:str=None, api_key:str=None,
+                 latency:float=0, latency_per_token:float=0, on_miss:str='scripted') -> None:
+        self.mode = mode
+        self.cassette = cassette
+        self.upstream = upstream.rstrip('/') if upstream else None
+        self.api_key = api_key
+        self.latency = latency # 每个请求固定的延迟 (s)
+        self.latency_per_token = latency_per_token # 每个输出 token 的延迟 (s)
+        self.on_miss = on_miss # replay 没有记录时: scripted 或 error
+        self.lock = threading.Lock()
+        self.records: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.replay_index: Dict[str, int] = defaultdict(int)
+        self.stats = defaultdict(int)
+        if mode == 'replay':
+            with open(cassette, 'r') as file:
+                for line in file:
+                    record = json.loads(line)
+                    self.records[record['key']].append(record['response'])
+
+    def respond(self, request:Dict[str, Any], authorization:str=None) -> Tuple[int, Dict[str, Any]]:
+        key = request_key(request)
+        if self.mode == 'record':
+            response = self.forward(request, authorization)
+            with self.lock:
+                with open(self.cassette, 'a') as file:
+                    file.write(json.dumps({'key': key, 'request': request, 'response': response}) + '\n')
+                self.stats['recorded'] += 1
+            return 200, response
+
+        if self.mode == 'replay':
+            with self.lock:
+                responses = self.records.get(key)
+                if responses:
+                    index = min(self.replay_index[key], len(responses) - 1) # 超出记录时重复最后一个回答
+                    self.replay_index[key] += 1
+                    self.stats['replayed'] += 1
+                    return 200, responses[index]
+                self.stats['missed'] += 1
+            if self.on_miss == 'error':
+                return 404, {'error': {'message': 'request not found in cassette', 'type': 'invalid_request_error'}}
+
+        response = completion(request, scripted_answer(request))
+        time.sleep(self.latency + self.latency_per_token * response['usage']['completion_tokens'])
+        with self.lock:
+            self.stats['scripted'] += 1
+        return 200, response
+
+    def forward(self, request:Dict[str, Any], authorization:str=None) -> Dict[str, Any]:
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key or authorization:
+            headers['Authorization'] = f'Bearer {self.api_key}' if self.api_key else authorization
+        upstream_request = urllib.request.Request(
+            f'{self.upstream}/chat/completions', data=json.dumps(request).encode('utf-8'), headers=headers, method='POST'
+        )
+        with urllib.request.urlopen(upstream_request) as upstream_response:
+            return json.loads(upstream_response.read())
+
+
+def make_handler(backend:StandInBackend):
+    class StandInHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1' # keep-alive
+
+        def _send(self, status:int, body:Dict[str, Any]) -> None:
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:
+            if self.path.rstrip('/').endswith('models'):
+                self._send(200, {'object': 'list', 'data': [{'id': 'stand-in', 'object': 'model'}]})
+            else:
+                self._send(200, {'mode': backend.mode, 'stats': dict(backend.stats)})
+
+        def do_POST(self) -> None:
+            if not self.path.rstrip('/').endswith('chat/completions'):
+                self._send(404, {'error': {'message': f'unknown path {self.path}', 'type': 'invalid_request_error'}})
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            if request.get('stream'):
+                self._send(400, {'error': {'message': 'stream is not supported', 'type': 'invalid_request_error'}})
+                return
+            try:
+                status, response = backend.respond(request, authorization=self.headers.get('Authorization'))
+            except Exception as e:
+                status, response = 500, {'error': {'message': str(e), 'type': 'server_error'}}
+            self._send(status, response)
+
+        def log_message(self, format:str, *args: Any) -> None:
+            pass # 不输出每一个请求
+
+    return StandInHandler
+
+
+def serve(backend:StandInBackend, host:str='127.0.0.1', port:int=8000) -> ThreadingHTTPServer:
+    """在后台线程中启动服务, 返回 server (使用 server.shutdown() 关闭)
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(backend))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    import sys
+    from pathlib import Path
+    parent_directory = Path(__file__).resolve().parent.parent # 直接运行这个文件时, 可以导入 utils
+    if str(parent_directory) not in sys.path:
+        sys.path.insert(0, str(parent_directory))
+
+    parser = argparse.ArgumentParser(description='OpenAI-compatible stand-in server')
+    parser.add_argument('--mode', type=str, default='scripted', choices=['scripted', 'record', 'replay'])
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--cassette', type=str, default='./llm_cassette.jsonl', help='JSONL file for record/replay')
+    parser.add_argument('--upstream', type=str, default=None, help='Real API base for record mode, default OPENAI_API_BASE in config.yaml')
+    parser.add_argument('--latency', type=float, default=0, help='Fixed latency (s) of scripted responses')
+    parser.add_argument('--latency_per_token', type=float, default=0, help='Latency (s) per completion token of scripted responses')
+    parser.add_argument('--on_miss', type=str, default='scripted', choices=['scripted', 'error'], help='Replay behaviour for unknown requests')
+    args = parser.parse_args()
+
+    upstream, api_key = args.upstream, None
+    if args.mode == 'record':
+        from utils.readConfig import read_config
+        config = read_config()
+        upstream = upstream or config['OPENAI_API_BASE'] or 'https://api.openai.com/v1'
+        api_key = config['OPENAI_API_KEY']
+
+    backend = StandInBackend(
+        mode=args.mode, cassette=args.cassette, upstream=upstream, api_key=api_key,
+        latency=args.latency, latency_per_token=args.latency_per_token, on_miss=args.on_miss
+    )
+    server = serve(backend, host=args.host, port=args.port)
+    print(f'Stand-in server ({args.mode}) on http://{args.host}:{args.port}/v1')
+    try:
+        threading.Event().wait() # 服务在后台线程中运行
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,7 +1,17 @@
+import os
 import yaml
 from pathlib import Path
 
+# 环境变量优先于 config.yaml, 例如 OPENAI_API_BASE=http://127.0.0.1:8000/v1 使用本地的 stand-in server
+ENV_OVERRIDES = ('OPENAI_PROXY', 'OPENAI_API_KEY', 'OPENAI_API_BASE', 'OPENAI_API_MODEL')
+
 def read_config():
-    with open(Path(__file__).parent / './config.yaml', 'r') as file:
-        config = yaml.safe_load(file)
-    return config
\ No newline at end of file
+    config_file = Path(__file__).parent / './config.yaml'
+    config = {key: None for key in ENV_OVERRIDES}
+    if config_file.exists() or not all(key in os.environ for key in ENV_OVERRIDES[1:]):
+        with open(config_file, 'r') as file:
+            config.update(yaml.safe_load(file))
+    for key in ENV_OVERRIDES:
+        if key in os.environ:
+            config[key] = os.environ[key]
+    return config
@@ -0,0 +1,153 @@
+'''
+@Author: WANG Maonan
+@Date: 2026-10-18 15:02:44
+@Description: 向量化的路口相似度搜索 (与 junction_similarity.calculate_similarity 的分数相同)
++ 预先计算每一条记录的 phase 车道数, 当前/上一时刻 phase occupancy, 组成 padding 之后的矩阵
++ 每一次查询只需要一次 numpy 的距离计算, 然后 argpartition 得到 top-k
++ 数据库中损坏的探测器为 -1, 计算 phase occupancy 时与旧版本相同, 当作 '-1%' (-0.01)
+@LastEditTime: 2026-10-19 15:48:31
+'''
+import numpy as np
+from typing import Any, Dict, List, Tuple
+
+from utils.junction_similarity import (
+    topk_min_indices,
+    get_int_info,
+    get_statistic_info,
+    get_occupancy_info,
+)
+
+BROKEN_DETECTOR = -1 # 数据库中损坏的探测器的 occupancy
+LEGACY_BROKEN_OCCUPANCY = -0.01 # 旧版本 convert_percentage_to_float('-1') 的结果
+
+
+def scoring_occupancy(occupancy:np.ndarray) -> np.ndarray:
+    """损坏的探测器 (-1) 转换为旧版本的数值 (-0.01), 迁移之后的分数与旧版本相同
+    """
+    occupancy = np.asarray(occupancy, dtype=np.float64)
+    return np.where(occupancy == BROKEN_DETECTOR, LEGACY_BROKEN_OCCUPANCY, occupancy)
+
+
+def pad_rows(rows:List[List[float]], width:int=None) -> np.ndarray:
+    """将长度不同的列表用 0 填充为矩阵, 与 euclidean_distance 中的 padding 相同
+    """
+    width = max([len(row) for row in rows], default=0) if width is None else width
+    matrix = np.zeros((len(rows), width), dtype=np.float64)
+    for index, row in enumerate(rows):
+        matrix[index, :len(row)] = row
+    return matrix
+
+
+class JunctionSimilarityIndex:
+    """相似度 = (静态相似度 + 动态相似度) / 2, 数值越小越接近
+    + 静态相似度, phase 车道数的欧式距离
+    + 动态相似度, (emergency 是否相同 + 当前 occupancy 的欧式距离 + 上一时刻 occupancy 的欧式距离) / 3
+    """
+    def __init__(
+            self,
+            lane_counts:np.ndarray,
+            current_occupancy:np.ndarray,
+            previous_occupancy:np.ndarray,
+            has_emergency:np.ndarray
+        ) -> None:
+        self.width = max(lane_counts.shape[1], current_occupancy.shape[1], previous_occupancy.shape[1])
+        self.lane_counts = self._pad(lane_counts) # (N, P)
+        self.current_occupancy = self._pad(current_occupancy) # (N, P), 每个 phase 的 occupancy
+        self.previous_occupancy = self._pad(previous_occupancy) # (N, P)
+        self.has_emergency = np.asarray(has_emergency, dtype=bool) # (N,)
+
+    def __len__(self) -> int:
+        return len(self.has_emergency)
+
+    def _pad(self, matrix:np.ndarray, width:int=None) -> np.ndarray:
+        width = self.width if width is None else width
+        matrix = np.asarray(matrix, dtype=np.float64)
+        if matrix.shape[-1] < width:
+            pad = [(0, 0)] * (matrix.ndim - 1) + [(0, width - matrix.shape[-1])]
+            matrix = np.pad(matrix, pad)
+        return matrix
+
+    # ########
+    # Builder
+    # ########
+    @classmethod
+    def from_decisions(cls, decisions:Dict[str, Any]) -> 'JunctionSimilarityIndex':
+        """从 junction_database.load_decisions 的结果中构建
+        """
+        statics = decisions['statics']
+        junction_ids = decisions['junction_id']
+        width = max([len(static['phase_movement_index']) for static in statics.values()], default=0)
+        num_movements = decisions['current_occupancy'].shape[1]
+        num_rows = len(junction_ids)
+
+        lane_counts = np.zeros((num_rows, width), dtype=np.float64)
+        current = np.zeros((num_rows, width), dtype=np.float64)
+        previous = np.zeros((num_rows, width), dtype=np.float64)
+        for junction_id, static in statics.items():
+            rows = np.flatnonzero(junction_ids == junction_id)
+            if len(rows) == 0:
+                continue
+            # movement -> phase 的聚合矩阵, (M, P)
+            aggregation = np.zeros((num_movements, width), dtype=np.float64)
+            for phase_index, movement_indexes in enumerate(static['phase_movement_index'].values()):
+                for movement_index in movement_indexes:
+                    aggregation[movement_index, phase_index] += 1
+            num_phases = len(static['phase_lane_counts'])
+            lane_counts[rows, :num_phases] = static['phase_lane_counts']
+            current[rows] = scoring_occupancy(decisions['current_occupancy'][rows]) @ aggregation
+            previous[rows] = scoring_occupancy(decisions['previous_occupancy'][rows]) @ aggregation
+        return cls(lane_counts, current, previous, decisions['has_emergency'])
+
+    @classmethod
+    def from_database(cls, database:str, junction_id:str=None) -> 'JunctionSimilarityIndex':
+        from utils.junction_database import load_decisions
+        return cls.from_decisions(load_decisions(database, junction_id=junction_id))
+
+    @classmethod
+    def from_legacy_rows(cls, rows:List[Tuple[Any, ...]]) -> 'JunctionSimilarityIndex':
+        """从旧版本 junctionINFO 的记录中构建 (每一行只解析一次)
+        """
+        lane_counts, current, previous, has_emergency = [], [], [], []
+        for row in rows:
+            intersection_layout, phase_structure, emergency_vehicle, current_occupancy, previous_occupancy = get_int_info(row)
+            lane_counts.append(get_statistic_info(intersection_layout, phase_structure))
+            current.append(get_occupancy_info(current_occupancy, phase_structure))
+            previous.append([] if previous_occupancy is None else get_occupancy_info(previous_occupancy, phase_structure))
+            has_emergency.append(bool(emergency_vehicle))
+        return cls(pad_rows(lane_counts), pad_rows(current), pad_rows(previous), np.array(has_emergency, dtype=bool))
+
+    # ######
+    # Query
+    # ######
+    def scores(self, lane_counts, current_occupancy, previous_occupancy, has_emergency:bool) -> np.ndarray:
+        """查询场景与所有记录之间的相似度, (N,)
+        """
+        query = [np.asarray(vector, dtype=np.float64) for vector in (lane_counts, current_occupancy, previous_occupancy)]
+        width = max([self.width] + [len(vector) for vector in query])
+        lane_counts, current_occupancy, previous_occupancy = [self._pad(vector, width) for vector in query]
+        static_similarity = np.sqrt(np.square(self._pad(self.lane_counts, width) - lane_counts).sum(axis=1))
+        current_score = np.sqrt(np.square(self._pad(self.current_occupancy, width) - current_occupancy).sum(axis=1))
+        previous_score = np.sqrt(np.square(self._pad(self.previous_occupancy, width) - previous_occupancy).sum(axis=1))
+        emergency_score = (self.has_emergency != bool(has_emergency)).astype(np.float64)
+        dynamic_similarity = (emergency_score + current_score + previous_score) / 3
+        return (static_similarity + dynamic_similarity) / 2
+
+    def scores_of(self, index:int) -> np.ndarray:
+        """第 index 条记录与所有记录之间的相似度
+        """
+        return self.scores(
+            self.lane_counts[index], self.current_occupancy[index],
+            self.previous_occupancy[index], self.has_emergency[index]
+        )
+
+    def query(self, lane_counts, current_occupancy, previous_occupancy, has_emergency:bool, k:int=1) -> Tuple[np.ndarray, np.ndarray]:
+        """最相似的 k 条记录, 返回 (index, score), 按相似度从高到低排序
+        """
+        scores = self.scores(lane_counts, current_occupancy, previous_occupancy, has_emergency)
+        indices = topk_min_indices(scores, k)
+        return indices, scores[indices]
+
+    def query_index(self, index:int, k:int=1) -> Tuple[np.ndarray, np.ndarray]:
+        scores = self.scores_of(index)
+        indices = topk_min_indices(scores, k)
+        return indices, scores[indices]